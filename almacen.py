@@ -0,0 +1,242 @@
+# Almacén columnar de resultados para revaluar una cartera de forma incremental. Cada
+# corrida guarda, por póliza, su id, una huella de las entradas de la valuación y los
+# resultados de valuar_cartera, un archivo .npy por columna. En la corrida siguiente
+# las columnas se abren con mmap (sin leerlas completas) y solo se valúan las pólizas
+# nuevas o cuya huella cambió; las demás toman sus resultados del almacén.
+#
+#   python lote.py polizas.csv resultados.csv --tasa 4 --almacen cartera_vg
+#
+# La huella combina las columnas de COLUMNAS_POLIZA de cada renglón con una huella del
+# contexto de la corrida (tasa, nombre y datos de la tabla de mortalidad, la tabla de
+# recargos RECARGOS, si los resultados son compactos y VERSION_CALCULO), así que cambiar
+# la tasa, la tabla, cualquier recargo o --compacto revalúa todo. VERSION_CALCULO se incrementa cuando cambian las fórmulas.
+#
+# Estructura del directorio: meta.json dice qué archivo tiene cada columna. Al escribir,
+# las columnas nuevas van a archivos con otro prefijo y meta.json se reemplaza al final
+# de forma atómica, de modo que una corrida interrumpida deja el almacén anterior intacto.
+# Solo se borran los archivos que nombraba el meta.json anterior, y un directorio con
+# otros archivos pero sin meta.json no se acepta como almacén.
+import hashlib
+import json
+import os
+import re
+import uuid
+
+import numpy as np
+
+from calculos import RECARGOS, TABLA_MORTALIDAD, obtener_tabla_conmutada, valuar_cartera
+from lote import COLUMNAS_POLIZA
+from tablas import registro
+
+VERSION_CALCULO = 1
+VERSION_ALMACEN = 1
+# Archivos que escribe el almacén (columnas y meta.json a medio reemplazar). Una primera
+# corrida interrumpida deja solo columnas con este nombre y sin meta.json.
+ARCHIVO_PROPIO = re.compile(r'[0-9a-f]{12}-\d+\.npy|meta\.json\.tmp')
+COLUMNA_ID = 'id_poliza'
+# Tipos con los que valuar_cartera usa cada columna; la huella se calcula sobre ellos
+# para que 40 y 40.0 (o un CSV leído con otro tipo) no cuenten como cambio
+TIPOS_ENTRADA = {
+    'tipo_seguro': str,
+    'edad': np.int64,
+    'suma_asegurada': np.float64,
+    'plazo_seguro': np.int64,
+    'plazo_pago': np.int64,
+    'tipo_recargo': str,
+    't_anos': np.int64,
+}
+
+
+# Huella de 64 bits de lo que es común a toda la corrida
+def huella_contexto(i, tabla=TABLA_MORTALIDAD, compacto=False):
+    mortalidad = registro.obtener(tabla)
+    huella = hashlib.blake2b(digest_size=8)
+    huella.update(json.dumps([VERSION_CALCULO, repr(float(i)), tabla, RECARGOS, bool(compacto)],
+                             sort_keys=True).encode('utf-8'))
+    for campo in ('x', 'lx', 'dx'):
+        huella.update(np.ascontiguousarray(mortalidad[campo], dtype=np.float64).tobytes())
+    return np.uint64(int.from_bytes(huella.digest(), 'little'))
+
+
+# Huella (uint64) de las entradas de cada póliza del DataFrame. Las columnas de texto
+# tienen pocos valores distintos: se factorizan y solo se calcula la huella de cada valor.
+def huella_entradas(polizas, i, tabla=TABLA_MORTALIDAD, compacto=False):
+    import pandas as pd
+    huella = np.full(len(polizas), huella_contexto(i, tabla, compacto), dtype=np.uint64)
+    for columna, tipo in TIPOS_ENTRADA.items():
+        if tipo is str:
+            codigos, valores = pd.factorize(polizas[columna])
+            parcial = pd.util.hash_array(np.asarray(valores, dtype=object).astype(str).astype(object))[codigos]
+        else:
+            parcial = pd.util.hash_array(polizas[columna].to_numpy().astype(tipo))
+        # Misma combinación que usa pandas para los renglones de un DataFrame
+        huella = (huella ^ parcial) * np.uint64(1000003)
+    return huella
+
+
+# Clave uint64 de cada id de póliza. Los ids enteros se usan tal cual; los de texto se
+# pasan a un arreglo de ancho fijo y se combinan carácter por carácter (FNV-1a sobre
+# los códigos, ignorando el relleno), lo que es mucho más rápido que indexar cadenas.
+# Dos ids con la misma clave solo podrían confundirse si además tienen la misma huella
+# de entradas, y en ese caso sus resultados son iguales.
+def claves_poliza(columna):
+    ids = columna.to_numpy()
+    if np.issubdtype(ids.dtype, np.integer):
+        return ids.astype(np.int64).view(np.uint64)
+    texto = ids.astype(str)
+    codigos = texto.view(np.uint32).reshape(len(texto), texto.dtype.itemsize // 4)
+    clave = np.full(len(texto), 0xCBF29CE484222325, dtype=np.uint64)
+    for k in range(codigos.shape[1]):
+        caracter = codigos[:, k].astype(np.uint64)
+        clave = np.where(caracter != 0, (clave ^ caracter) * np.uint64(0x100000001B3), clave)
+    return clave
+
+
+class AlmacenResultados:
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    @property
+    def _meta(self):
+        return os.path.join(self.ruta, 'meta.json')
+
+    # Sin meta.json el directorio solo puede estar vacío o tener archivos del almacén;
+    # cualquier otro archivo indica que no es un almacén y no se toca
+    def _revisar_directorio(self):
+        if not os.path.isdir(self.ruta) or os.path.exists(self._meta):
+            return
+        ajenos = [archivo for archivo in os.listdir(self.ruta) if not ARCHIVO_PROPIO.fullmatch(archivo)]
+        if ajenos:
+            raise ValueError(f"{self.ruta} no está vacío y no es un almacén de resultados (falta meta.json)")
+
+    def _leer_meta(self):
+        with open(self._meta, encoding='utf-8') as f:
+            return json.load(f)
+
+    # Columnas del almacén abiertas con mmap ({'clave', 'huella', resultados...}), o None si
+    # el almacén no existe o es de otra versión
+    def leer(self):
+        self._revisar_directorio()
+        if not os.path.exists(self._meta):
+            return None
+        meta = self._leer_meta()
+        if meta.get('version') != VERSION_ALMACEN:
+            return None
+        return {nombre: np.load(os.path.join(self.ruta, archivo), mmap_mode='r')
+                for nombre, archivo in meta['columnas'].items()}
+
+    def escribir(self, columnas):
+        self._revisar_directorio()
+        os.makedirs(self.ruta, exist_ok=True)
+        # Columnas de la corrida anterior, que se borran al terminar
+        anteriores = set(self._leer_meta().get('columnas', {}).values()) if os.path.exists(self._meta) else set()
+        prefijo = uuid.uuid4().hex[:12]
+        archivos = {}
+        for k, (nombre, valores) in enumerate(columnas.items()):
+            archivos[nombre] = f"{prefijo}-{k}.npy"
+            np.save(os.path.join(self.ruta, archivos[nombre]), np.ascontiguousarray(valores))
+        temporal = self._meta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({'version': VERSION_ALMACEN, 'filas': len(columnas['clave']), 'columnas': archivos}, f, ensure_ascii=False)
+        os.replace(temporal, self._meta)
+        for archivo in anteriores - set(archivos.values()):
+            if ARCHIVO_PROPIO.fullmatch(archivo):
+                try:
+                    os.remove(os.path.join(self.ruta, archivo))
+                except OSError:
+                    pass
+
+
+# Núcleo de revaluar: devuelve las pólizas, los resultados por columna y las cuentas.
+# Los resultados son siempre columnas mapeadas del almacén: si la cartera cambió, se
+# arman las columnas nuevas, se escriben y se vuelven a abrir con mmap, así que después
+# de escribir no quedan en memoria.
+def _revaluar_columnas(polizas, almacen, i, tabla=TABLA_MORTALIDAD, conmutados=None, compacto=False):
+    import pandas as pd
+    faltantes = [c for c in (COLUMNA_ID, *COLUMNAS_POLIZA) if c not in polizas.columns]
+    if faltantes:
+        raise ValueError(f"Faltan las columnas {faltantes}")
+    polizas = polizas.reset_index(drop=True)
+    claves = claves_poliza(polizas[COLUMNA_ID])
+    if not pd.Index(claves).is_unique:
+        raise ValueError(f"La columna {COLUMNA_ID} tiene ids repetidos")
+    huellas = huella_entradas(polizas, i, tabla, compacto)
+    anterior = almacen.leer()
+
+    n = len(polizas)
+    posicion = np.full(n, -1, dtype=np.int64)
+    if anterior is not None:
+        # Caso común: el extracto viene con las mismas pólizas en el mismo orden
+        if len(anterior['clave']) == n and np.array_equal(anterior['clave'], claves):
+            posicion = np.arange(n)
+        else:
+            posicion = pd.Index(anterior['clave']).get_indexer(claves)
+    encontradas = posicion >= 0
+    reusar = encontradas.copy()
+    if anterior is not None:
+        reusar[encontradas] = anterior['huella'][posicion[encontradas]] == huellas[encontradas]
+    recalcular = ~reusar
+    cuentas = {
+        'reutilizadas': int(reusar.sum()),
+        'nuevas': int((~encontradas).sum()),
+        'modificadas': int((encontradas & recalcular).sum()),
+        'bajas': 0 if anterior is None else len(anterior['clave']) - int(encontradas.sum()),
+    }
+
+    sin_cambios = (anterior is not None and cuentas['reutilizadas'] == n == len(anterior['clave'])
+                   and np.array_equal(posicion, np.arange(n)))
+    if sin_cambios:
+        # Misma cartera en el mismo orden: los resultados son directamente las columnas mapeadas
+        resultados = {nombre: columna for nombre, columna in anterior.items() if nombre not in ('clave', 'huella')}
+    else:
+        nuevos = {}
+        if recalcular.any() or anterior is None:
+            conmutados = conmutados if conmutados is not None else obtener_tabla_conmutada(i, tabla)
+            cambiadas = polizas.loc[recalcular, list(COLUMNAS_POLIZA)]
+            nuevos = valuar_cartera(conmutados, *(cambiadas[c].to_numpy() for c in COLUMNAS_POLIZA), compacto=compacto)
+        nombres = list(nuevos) or [nombre for nombre in anterior if nombre not in ('clave', 'huella')]
+        resultados = {}
+        for nombre in nombres:
+            tipo = nuevos[nombre].dtype if nombre in nuevos else anterior[nombre].dtype
+            columna = np.empty(n, dtype=tipo)
+            if nombre in nuevos:
+                columna[recalcular] = nuevos[nombre]
+            if reusar.any():
+                columna[reusar] = anterior[nombre][posicion[reusar]]
+            resultados[nombre] = columna
+        almacen.escribir({'clave': claves, 'huella': huellas, **resultados})
+        resultados = {nombre: columna for nombre, columna in almacen.leer().items() if nombre not in ('clave', 'huella')}
+    return polizas, resultados, cuentas
+
+
+# Valúa el DataFrame de pólizas (con COLUMNA_ID y COLUMNAS_POLIZA) reutilizando lo que
+# ya está en el almacén y lo actualiza con la cartera actual (las pólizas que ya no
+# aparecen se eliminan). Devuelve el DataFrame con los resultados, como
+# lote.valuar_dataframe, y las cuentas de pólizas reutilizadas, nuevas, modificadas y bajas.
+# Con compacto los resultados van en float32, como en valuar_cartera. El DataFrame es
+# una copia completa de los resultados; para escribirlos a un archivo sin copiarlos
+# todos a la vez, ver revaluar_archivo.
+def revaluar(polizas, almacen, i, tabla=TABLA_MORTALIDAD, conmutados=None, compacto=False):
+    import pandas as pd
+    polizas, resultados, cuentas = _revaluar_columnas(polizas, almacen, i, tabla, conmutados, compacto)
+    return pd.concat([polizas, pd.DataFrame(resultados)], axis=1), cuentas
+
+
+# Revaluación incremental de un CSV completo. A diferencia de lote.valuar_archivo corre
+# en un solo proceso y lee el archivo de entrada completo (la huella necesita todas las
+# pólizas). Los resultados no se juntan en memoria: se copian de las columnas mapeadas
+# a la salida por bloques de filas_por_bloque renglones.
+def revaluar_archivo(entrada, salida, ruta_almacen, i, tabla=TABLA_MORTALIDAD, compacto=False, filas_por_bloque=50_000):
+    import pandas as pd
+    polizas, resultados, cuentas = _revaluar_columnas(pd.read_csv(entrada), AlmacenResultados(ruta_almacen), i, tabla,
+                                                      compacto=compacto)
+    n = len(polizas)
+    with open(salida, 'w', encoding='utf-8', newline='') as archivo:
+        # Al menos un bloque, para que una cartera vacía deje el encabezado
+        for inicio in range(0, max(n, 1), filas_por_bloque):
+            fin = min(inicio + filas_por_bloque, n)
+            bloque = polizas.iloc[inicio:fin].reset_index(drop=True)
+            bloque = pd.concat([bloque, pd.DataFrame({nombre: columna[inicio:fin] for nombre, columna in resultados.items()})],
+                               axis=1)
+            bloque.to_csv(archivo, index=False, header=inicio == 0)
+    return n, cuentas
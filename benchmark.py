@@ -0,0 +1,303 @@
+# Benchmarks de las rutas de cálculo más usadas y revisión de valores de referencia.
+# Corre sin Streamlit:
+#
+#   python benchmark.py                  # mide, revisa referencia y compara con la base
+#   python benchmark.py --guardar        # mide y guarda los tiempos como nueva base
+#   python benchmark.py --umbral 15 --solo cartera
+#
+# Cada benchmark reporta el mejor tiempo por llamada de varias repeticiones (como
+# timeit). Si existe el archivo base, la corrida falla (código 1) cuando algún tiempo
+# supera al de la base en más del umbral. Antes de medir se revisan los valores de
+# benchmark_referencia.json (calculados con el código original de la calculadora),
+# tanto por la ruta escalar de la interfaz como por la vectorizada, para que un cambio
+# que acelere no pueda alterar los resultados sin que se note. También se mide el
+# error y la memoria del modo compacto (float32) frente al calendario en float64.
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from calculos import (
+    COTA_ERROR_COMPACTO,
+    TABLA_MORTALIDAD,
+    TIPOS_RECARGO,
+    TIPOS_SEGURO,
+    CommutationTable,
+    calc_seguro_prorrogado,
+    calcular_valores_conmutados,
+    get_valor,
+    obtener_tabla_conmutada,
+    resolver_prorrogado,
+    valuar_calendario,
+    valuar_cartera,
+)
+from grafo import crear_grafo_poliza, valores_poliza
+from lote import COLUMNAS_POLIZA
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+ARCHIVO_BASE = os.path.join(DIRECTORIO, 'benchmark_base.json')
+ARCHIVO_REFERENCIA = os.path.join(DIRECTORIO, 'benchmark_referencia.json')
+CAMPOS_REFERENCIA = ('PNU', 'P', 'B_total', 'V_rescate_total', 'S_saldado_total', 'años', 'meses', 'dias', 'devolucion')
+TAMANOS_CARTERA = (10_000, 100_000, 1_000_000)
+POLIZAS_CALENDARIO = 10_000
+
+
+# Valuación de una póliza por la misma ruta que la interfaz (grafo de cálculo sin
+# resultados previos). Devuelve, entre otros, los campos de CAMPOS_REFERENCIA.
+def valuar_poliza_escalar(i, tabla, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos):
+    entradas = {'i': i, 'tabla': tabla, 'tipo_seguro': tipo_seguro, 'edad': edad, 'suma_asegurada': suma_asegurada,
+                'plazo_seguro': plazo_seguro, 'plazo_pago': plazo_pago, 'tipo_recargo': tipo_recargo, 't_anos': t_anos}
+    return valores_poliza(crear_grafo_poliza(), entradas)
+
+
+# Cartera sintética reproducible con la misma mezcla de productos que la interfaz permite
+def cartera_sintetica(n, conmutados, semilla=0):
+    rng = np.random.default_rng(semilla)
+    omega = int(conmutados.x[-1])
+    tipo = np.array(TIPOS_SEGURO, dtype=object)[rng.integers(0, 3, n)]
+    edad = rng.integers(int(conmutados.x[0]), omega - 1, n)
+    plazo_seguro = np.where(tipo == "Vitalicio", omega - edad, rng.integers(1, omega - edad + 1))
+    plazo_pago = rng.integers(1, plazo_seguro + 1)
+    return {
+        'tipo_seguro': tipo,
+        'edad': edad,
+        'suma_asegurada': rng.choice([10_000.0, 100_000.0, 250_000.0], n),
+        'plazo_seguro': plazo_seguro,
+        'plazo_pago': plazo_pago,
+        'tipo_recargo': np.array(TIPOS_RECARGO, dtype=object)[rng.integers(0, 2, n)],
+        't_anos': rng.integers(1, plazo_seguro + 1),
+    }
+
+
+# --- Valores de referencia ---
+
+def _comparar(etiqueta, obtenido, esperado, tolerancia):
+    errores = []
+    for campo in CAMPOS_REFERENCIA:
+        a, b = float(obtenido[campo]), float(esperado[campo])
+        if not abs(a - b) <= tolerancia * max(abs(b), 1.0):
+            errores.append(f"{etiqueta}: {campo} = {a!r}, se esperaba {b!r}")
+    return errores
+
+
+# Revisa la tabla de conmutados y cada póliza de referencia por la ruta escalar, por
+# valuar_cartera (todas juntas) y por valuar_calendario. Devuelve la lista de diferencias.
+def revisar_referencia(ruta=ARCHIVO_REFERENCIA):
+    with open(ruta, encoding='utf-8') as f:
+        referencia = json.load(f)
+    tolerancia = referencia['tolerancia_relativa']
+    errores = []
+    for tasa, esperado in referencia['conmutados'].items():
+        conmutados = obtener_tabla_conmutada(float(tasa), referencia['tabla'])
+        for columna, valores in esperado.items():
+            if columna == 'x':
+                continue
+            obtenido = conmutados.valor(np.asarray(esperado['x']), columna)
+            malos = ~np.isclose(obtenido, valores, rtol=tolerancia, atol=0)
+            if np.any(malos):
+                errores.append(f"conmutados al {tasa}: {columna} distinto en las edades {np.asarray(esperado['x'])[malos].tolist()}")
+
+    polizas = referencia['polizas']
+    for tasa in sorted({p['tasa'] for p in polizas}):
+        conmutados = obtener_tabla_conmutada(tasa, referencia['tabla'])
+        grupo = [p for p in polizas if p['tasa'] == tasa]
+        columnas = {campo: [p[campo] for p in grupo] for campo in COLUMNAS_POLIZA}
+        cartera = valuar_cartera(conmutados, *columnas.values())
+        calendario = valuar_calendario(conmutados, *list(columnas.values())[:-1])
+        for n, p in enumerate(grupo):
+            etiqueta = f"{p['tipo_seguro']} edad {p['edad']} n={p['plazo_seguro']} t={p['t_anos']} al {tasa}"
+            escalar = valuar_poliza_escalar(tasa, referencia['tabla'], *(p[campo] for campo in columnas))
+            errores += _comparar(etiqueta + " (escalar)", escalar, p['esperado'], tolerancia)
+            errores += _comparar(etiqueta + " (cartera)", {c: cartera[c][n] for c in CAMPOS_REFERENCIA}, p['esperado'], tolerancia)
+            if p['t_anos'] < p['plazo_seguro']:
+                columna_t = p['t_anos'] - 1
+                fila = {c: calendario[c][n] if calendario[c].ndim == 1 else calendario[c][n, columna_t] for c in CAMPOS_REFERENCIA}
+                errores += _comparar(etiqueta + " (calendario)", fila, p['esperado'], tolerancia)
+    return errores
+
+
+# Calendario de una cartera sintética en float64 y en modo compacto: errores máximos
+# absoluto y relativo de los campos de punto flotante, bytes por póliza-año de las
+# matrices (pólizas × duraciones) y memoria pico de cada cálculo
+def revisar_compacto(n=POLIZAS_CALENDARIO):
+    conmutados = obtener_tabla_conmutada(0.04)
+    columnas = list(cartera_sintetica(n, conmutados, semilla=2).values())[:-1]
+    medidas = {}
+    calendarios = {}
+    for compacto in (False, True):
+        tracemalloc.start()
+        calendarios[compacto] = valuar_calendario(conmutados, *columnas, compacto=compacto)
+        medidas['pico_mb' + ('_compacto' if compacto else '')] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    completo, compacto = calendarios[False], calendarios[True]
+    error_absoluto = error_relativo = 0.0
+    for campo, valores in completo.items():
+        if valores.dtype.kind != 'f':
+            if not np.array_equal(valores, compacto[campo]):
+                error_absoluto = error_relativo = np.inf
+            continue
+        diferencia = np.abs(compacto[campo].astype(np.float64) - valores)
+        distintos = valores != 0
+        error_absoluto = max(error_absoluto, float(diferencia.max(initial=0)))
+        error_relativo = max(error_relativo, float((diferencia[distintos] / np.abs(valores[distintos])).max(initial=0)))
+    celdas = n * completo['t'].size
+    medidas.update({
+        'error_absoluto': error_absoluto,
+        'error_relativo': error_relativo,
+        'bytes_poliza_año': sum(v.nbytes for v in completo.values() if v.ndim == 2) / celdas,
+        'bytes_poliza_año_compacto': sum(v.nbytes for v in compacto.values() if v.ndim == 2) / celdas,
+    })
+    return medidas
+
+
+# --- Benchmarks ---
+
+# Cada benchmark es (nombre, preparar) donde preparar() devuelve la función a medir,
+# para que la preparación (tablas, carteras sintéticas) no entre en el tiempo.
+def _benchmarks(tamanos):
+    i = 0.04
+    conmutados = obtener_tabla_conmutada(i)
+    omega = int(conmutados.x[-1])
+    lista = [
+        ('conmutados_pandas', lambda: lambda: calcular_valores_conmutados(i)),
+        ('conmutados_numpy', lambda: lambda: CommutationTable.desde_tasa(i)),
+        ('get_valor', lambda: lambda: get_valor(conmutados, 45, 'Nx')),
+    ]
+    for tipo, plazo in (("Vitalicio", omega - 35), ("Temporal", 20), ("Dotal (Mixto)", 20)):
+        nombre = 'poliza_' + tipo.split()[0].lower()
+        argumentos = (i, TABLA_MORTALIDAD, tipo, 35, 100_000.0, plazo, min(15, plazo), "Mínimos", 10)
+        lista.append((nombre, lambda a=argumentos: lambda: valuar_poliza_escalar(*a)))
+
+    # Cambio de t en la interfaz: solo se recalculan rescate, saldado y prorrogado
+    def preparar_cambio_t():
+        grafo = crear_grafo_poliza()
+        entradas = [{'i': i, 'tabla': TABLA_MORTALIDAD, 'tipo_seguro': "Vitalicio", 'edad': 35, 'suma_asegurada': 100_000.0,
+                     'plazo_seguro': omega - 35, 'plazo_pago': 15, 'tipo_recargo': "Mínimos", 't_anos': t} for t in (10, 11)]
+        ciclo = iter(lambda: entradas.reverse() or entradas[0], None)
+        return lambda: valores_poliza(grafo, next(ciclo))
+    lista.append(('poliza_cambio_t', preparar_cambio_t))
+
+    def preparar_prorrogado_cartera():
+        rng = np.random.default_rng(1)
+        edades = rng.integers(int(conmutados.x[0]), omega, 100_000)
+        V = rng.uniform(0, 1, edades.size) * (1 - conmutados.valor(edades, 'Mx') / conmutados.valor(edades, 'Dx'))
+        return lambda: resolver_prorrogado(conmutados, V, 1.0, edades)
+
+    lista += [
+        ('prorrogado', lambda: lambda: calc_seguro_prorrogado(conmutados, 0.25, 1, 45, "Vitalicio")),
+        ('prorrogado_100k', preparar_prorrogado_cartera),
+        ('calendario', lambda: lambda: valuar_calendario(conmutados, "Vitalicio", 30, 100_000.0, omega - 30, 20, "Mínimos")),
+    ]
+    for compacto in (False, True):
+        def preparar_calendario(compacto=compacto):
+            columnas = list(cartera_sintetica(POLIZAS_CALENDARIO, conmutados).values())[:-1]
+            return lambda: valuar_calendario(conmutados, *columnas, compacto=compacto)
+        lista.append((f'calendario_{POLIZAS_CALENDARIO // 1000}k' + ('_compacto' if compacto else ''), preparar_calendario))
+    for n in tamanos:
+        def preparar(n=n):
+            cartera = cartera_sintetica(n, conmutados)
+            return lambda: valuar_cartera(conmutados, *cartera.values())
+        lista.append((f'cartera_{n // 1000}k' if n < 1_000_000 else f'cartera_{n // 1_000_000}M', preparar))
+    return lista
+
+
+# Mejor tiempo por llamada en segundos: ajusta el número de llamadas para que cada
+# repetición dure al menos ~0.2 s y toma el mínimo de las repeticiones
+def medir(funcion, repeticiones=5):
+    temporizador = timeit.Timer(funcion)
+    numero, _ = temporizador.autorange()
+    return min(temporizador.repeat(repeat=repeticiones, number=numero)) / numero
+
+
+def correr(patrones=None, tamanos=TAMANOS_CARTERA, repeticiones=5):
+    resultados = {}
+    for nombre, preparar in _benchmarks(tamanos):
+        if patrones and not any(fnmatch.fnmatch(nombre, f"*{p}*") for p in patrones):
+            continue
+        resultados[nombre] = medir(preparar(), repeticiones)
+        print(f"{nombre:<24} {_formato_tiempo(resultados[nombre]):>12}", flush=True)
+    return resultados
+
+
+def _formato_tiempo(segundos):
+    for unidad, escala in (('s', 1), ('ms', 1e-3), ('µs', 1e-6)):
+        if segundos >= escala:
+            return f"{segundos / escala:.3f} {unidad}"
+    return f"{segundos / 1e-9:.1f} ns"
+
+
+# Benchmarks más lentos que la base por encima del umbral (en %): [(nombre, base, actual)]
+def regresiones(resultados, base, umbral):
+    return [(nombre, base[nombre], t) for nombre, t in resultados.items()
+            if nombre in base and t > base[nombre] * (1 + umbral / 100)]
+
+
+def guardar_base(resultados, ruta=ARCHIVO_BASE):
+    contenido = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'maquina': platform.platform(),
+        'segundos': resultados,
+    }
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(contenido, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks y valores de referencia de la calculadora")
+    parser.add_argument('--base', default=ARCHIVO_BASE, help="Archivo JSON con los tiempos base")
+    parser.add_argument('--guardar', action='store_true', help="Guarda los tiempos medidos como nueva base")
+    parser.add_argument('--umbral', type=float, default=float(os.environ.get('VG_BENCH_UMBRAL', 20)),
+                        help="Porcentaje de lentitud tolerado frente a la base (por omisión 20)")
+    parser.add_argument('--solo', nargs='*', help="Corre solo los benchmarks cuyo nombre contenga alguno de estos textos")
+    parser.add_argument('--tamanos', nargs='*', type=int, default=list(TAMANOS_CARTERA), help="Tamaños de cartera sintética")
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--sin-referencia', action='store_true', help="No revisa los valores de referencia")
+    args = parser.parse_args(argv)
+
+    if not args.sin_referencia:
+        errores = revisar_referencia()
+        if errores:
+            print("Valores de referencia distintos:", file=sys.stderr)
+            for error in errores:
+                print("  " + error, file=sys.stderr)
+            return 1
+        print("Valores de referencia: OK")
+        compacto = revisar_compacto()
+        print(f"Modo compacto ({POLIZAS_CALENDARIO:,} pólizas): error máximo absoluto {compacto['error_absoluto']:.3g}, "
+              f"relativo {compacto['error_relativo']:.3g} (cota {COTA_ERROR_COMPACTO:.3g}); "
+              f"{compacto['bytes_poliza_año']:.0f} -> {compacto['bytes_poliza_año_compacto']:.0f} bytes por póliza-año, "
+              f"pico {compacto['pico_mb']:.0f} -> {compacto['pico_mb_compacto']:.0f} MB")
+        if not compacto['error_relativo'] <= COTA_ERROR_COMPACTO:
+            print("El error del modo compacto supera la cota", file=sys.stderr)
+            return 1
+
+    resultados = correr(args.solo, args.tamanos, args.repeticiones)
+    if args.guardar:
+        guardar_base(resultados, args.base)
+        print(f"Base guardada en {args.base}")
+        return 0
+    if not os.path.exists(args.base):
+        print(f"No hay base en {args.base}; usa --guardar para crearla")
+        return 0
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)['segundos']
+    lentos = regresiones(resultados, base, args.umbral)
+    for nombre, antes, ahora in lentos:
+        print(f"REGRESIÓN {nombre}: {_formato_tiempo(antes)} -> {_formato_tiempo(ahora)} "
+              f"(+{(ahora / antes - 1) * 100:.0f}%, umbral {args.umbral:g}%)", file=sys.stderr)
+    if not lentos:
+        print(f"Sin regresiones mayores al {args.umbral:g}% frente a {args.base}")
+    return 1 if lentos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,582 @@
+# Motor de cálculo de valores garantizados: conmutados, anualidades, primas,
+# rescate, saldado y prorrogado. Solo depende de NumPy para poder importarse
+# desde procesos por lotes sin cargar Streamlit ni fpdf.
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from medicion import contar, etapa
+from tablas import TABLA_MORTALIDAD, data, registro
+
+
+# Función para calcular valores conmutados (como DataFrame; pandas se importa solo aquí)
+def calcular_valores_conmutados(i, tabla=TABLA_MORTALIDAD):
+    import pandas as pd
+    mortalidad = registro.obtener(tabla)
+    df = pd.DataFrame({campo: np.asarray(mortalidad[campo]) for campo in ('x', 'lx', 'dx')})
+    df['Dx'] = df['lx'] * ((1 + i) ** (-df['x']))
+    df['Cx'] = df['dx'] * ((1 + i) ** (-(df['x'] + 1)))
+    df['Nx'] = df['Dx'][::-1].cumsum()[::-1]
+    df['Mx'] = df['Cx'][::-1].cumsum()[::-1]
+    return df
+
+# Tabla de conmutados en arreglos contiguos de NumPy: la edad x vive en la
+# posición x - edad_min, así que cada consulta es un acceso directo por índice
+class CommutationTable:
+    COLUMNAS = ('Dx', 'Nx', 'Cx', 'Mx')
+
+    def __init__(self, x, Dx, Nx, Cx, Mx):
+        self.x = np.array(x, dtype=np.int64)
+        self.edad_min = int(self.x[0])
+        self.edad_max = int(self.x[-1])
+        if not np.array_equal(self.x, np.arange(self.edad_min, self.edad_max + 1)):
+            raise ValueError("Las edades de la tabla deben ser enteros consecutivos")
+        # Copias de solo lectura: la misma tabla se comparte entre sesiones desde la caché
+        self.Dx, self.Nx, self.Cx, self.Mx = (np.array(col, dtype=np.float64) for col in (Dx, Nx, Cx, Mx))
+        for col in (self.x, self.Dx, self.Nx, self.Cx, self.Mx):
+            col.setflags(write=False)
+        self._columnas = {'Dx': self.Dx, 'Nx': self.Nx, 'Cx': self.Cx, 'Mx': self.Mx}
+
+    # Construye la tabla para la tasa i con las mismas fórmulas que calcular_valores_conmutados.
+    # Si i es un vector de tasas, las columnas quedan con forma (tasas × edades) y el
+    # descuento se calcula por difusión en una sola operación.
+    @classmethod
+    def desde_tasa(cls, i, tabla=None):
+        tabla = data if tabla is None else tabla
+        x = np.asarray(tabla['x'], dtype=np.int64)
+        lx = np.asarray(tabla['lx'], dtype=np.float64)
+        dx = np.asarray(tabla['dx'], dtype=np.float64)
+        if np.ndim(i) > 0:
+            i = np.asarray(i, dtype=np.float64)[:, None]
+        Dx = lx * ((1 + i) ** (-x))
+        Cx = dx * ((1 + i) ** (-(x + 1)))
+        Nx = Dx[..., ::-1].cumsum(axis=-1)[..., ::-1]
+        Mx = Cx[..., ::-1].cumsum(axis=-1)[..., ::-1]
+        return cls(x, Dx, Nx, Cx, Mx)
+
+    # Construye la tabla a partir de factores de descuento por edad en lugar de una tasa
+    # fija: descuento[..., k] es el valor presente de $1 pagadero a la edad x[0] + k, con
+    # una edad más al final para C de la última edad. Con varias filas (por ejemplo
+    # trayectorias de tasas) las columnas quedan con forma (filas × edades).
+    @classmethod
+    def desde_descuento(cls, descuento, tabla=None):
+        tabla = data if tabla is None else tabla
+        x = np.asarray(tabla['x'], dtype=np.int64)
+        lx = np.asarray(tabla['lx'], dtype=np.float64)
+        dx = np.asarray(tabla['dx'], dtype=np.float64)
+        descuento = np.asarray(descuento, dtype=np.float64)
+        if descuento.shape[-1] != x.size + 1:
+            raise ValueError(f"Se esperaban {x.size + 1} factores de descuento por fila, no {descuento.shape[-1]}")
+        Dx = lx * descuento[..., :-1]
+        Cx = dx * descuento[..., 1:]
+        Nx = Dx[..., ::-1].cumsum(axis=-1)[..., ::-1]
+        Mx = Cx[..., ::-1].cumsum(axis=-1)[..., ::-1]
+        return cls(x, Dx, Nx, Cx, Mx)
+
+    @classmethod
+    def desde_df(cls, df):
+        return cls(df['x'].values, df['Dx'].values, df['Nx'].values, df['Cx'].values, df['Mx'].values)
+
+    def __len__(self):
+        return len(self.x)
+
+    # Convierte edades (escalar o arreglo) a posiciones; fuera de rango es un error.
+    # Una edad entera de Python (el caso de las funciones escalares) se resuelve sin
+    # pasar por NumPy.
+    def indices(self, edad):
+        if type(edad) is int:
+            if not self.edad_min <= edad <= self.edad_max:
+                raise ValueError(f"Edad fuera de la tabla ({self.edad_min}-{self.edad_max}): {edad}")
+            return edad - self.edad_min
+        edad = np.asarray(edad)
+        if edad.dtype.kind not in 'iu':
+            if edad.dtype.kind != 'f' or np.any(edad != np.floor(edad)):
+                raise ValueError(f"La edad debe ser un número entero: {edad}")
+            edad = edad.astype(np.int64)
+        if np.any((edad < self.edad_min) | (edad > self.edad_max)):
+            fuera = edad[(edad < self.edad_min) | (edad > self.edad_max)] if edad.ndim else edad
+            raise ValueError(f"Edad fuera de la tabla ({self.edad_min}-{self.edad_max}): {fuera}")
+        return edad - self.edad_min
+
+    def valor(self, edad, columna):
+        if columna not in self._columnas:
+            raise ValueError(f"Columna desconocida: {columna!r} (disponibles: {', '.join(self.COLUMNAS)})")
+        return self._columnas[columna][..., self.indices(edad)]
+
+# Caché de tablas de conmutados compartida por todas las sesiones del proceso,
+# indexada por (tabla de mortalidad, tasa) y acotada con desalojo LRU
+class CacheConmutados:
+    def __init__(self, max_tablas=32):
+        self.max_tablas = max_tablas
+        self.aciertos = 0
+        self.fallos = 0
+        self._tablas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, i, tabla=TABLA_MORTALIDAD):
+        clave = (tabla, float(i))
+        with self._lock:
+            if clave in self._tablas:
+                self._tablas.move_to_end(clave)
+                self.aciertos += 1
+                contar('cache_aciertos')
+                return self._tablas[clave]
+            self.fallos += 1
+        contar('cache_fallos')
+        with etapa('construccion_conmutados'):
+            conmutados = CommutationTable.desde_tasa(i, registro.obtener(tabla))
+        with self._lock:
+            self._tablas[clave] = conmutados
+            self._tablas.move_to_end(clave)
+            self._desalojar()
+        return conmutados
+
+    def configurar(self, max_tablas):
+        if max_tablas < 1:
+            raise ValueError("La caché debe admitir al menos una tabla")
+        with self._lock:
+            self.max_tablas = max_tablas
+            self._desalojar()
+
+    def limpiar(self):
+        with self._lock:
+            self._tablas.clear()
+            self.aciertos = 0
+            self.fallos = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return {'aciertos': self.aciertos, 'fallos': self.fallos,
+                    'tablas': len(self._tablas), 'max_tablas': self.max_tablas}
+
+    def _desalojar(self):
+        while len(self._tablas) > self.max_tablas:
+            self._tablas.popitem(last=False)
+
+# Una sola instancia por proceso: el módulo se importa una vez y Streamlit lo
+# reutiliza en cada nueva ejecución del script de la interfaz
+_cache = CacheConmutados(int(os.environ.get('VG_CACHE_TABLAS', 32)))
+
+def cache_conmutados():
+    return _cache
+
+def obtener_tabla_conmutada(i, tabla=TABLA_MORTALIDAD):
+    return cache_conmutados().obtener(i, tabla)
+
+# Función para obtener valor conmutado
+def get_valor(df, edad, columna):
+    contar('get_valor')
+    if isinstance(df, CommutationTable):
+        return df.valor(edad, columna)
+    try:
+        return df[df['x'] == edad][columna].values[0]
+    except:
+        return 0
+
+# Cálculo de anualidades
+def calc_anualidad_anticipada_vitalicia(df, edad, i):
+    Dx = get_valor(df, edad, 'Dx')
+    Nx = get_valor(df, edad, 'Nx')
+    return Nx / Dx if Dx != 0 else 0
+
+def calc_anualidad_anticipada_temporal(df, edad, n, i):
+    Dx = get_valor(df, edad, 'Dx')
+    Nx = get_valor(df, edad, 'Nx')
+    Nx_n = get_valor(df, edad + n, 'Nx')
+    return (Nx - Nx_n) / Dx if Dx != 0 else 0
+
+# PNU - Prima Neta Única
+def calc_PNU_vitalicia(df, edad, i):
+    Dx = get_valor(df, edad, 'Dx')
+    Mx = get_valor(df, edad, 'Mx')
+    return Mx / Dx if Dx != 0 else 0
+
+def calc_PNU_temporal(df, edad, n, i):
+    Dx = get_valor(df, edad, 'Dx')
+    Mx = get_valor(df, edad, 'Mx')
+    Mx_n = get_valor(df, edad + n, 'Mx')
+    return (Mx - Mx_n) / Dx if Dx != 0 else 0
+
+def calc_PNU_dotal(df, edad, n, i):
+    Dx = get_valor(df, edad, 'Dx')
+    Dx_n = get_valor(df, edad + n, 'Dx')
+    Mx = get_valor(df, edad, 'Mx')
+    Mx_n = get_valor(df, edad + n, 'Mx')
+    return ((Mx - Mx_n) / Dx + Dx_n / Dx) if Dx != 0 else 0
+
+# Prima Comercial
+def calc_prima_comercial(P, a_pago, a_seguro, alpha, gamma, beta, k):
+    numerador = P * a_pago + alpha + gamma * a_seguro
+    denominador = a_pago * (1 - k / a_pago - beta)
+    return numerador / denominador if denominador != 0 else 0
+
+# Valor de Rescate
+def calc_valor_rescate(A_actual, P, a_restante, kB, a_pago_original):
+    # proteger división por cero
+    if a_pago_original == 0:
+        return A_actual - P * a_restante
+    return A_actual - P * a_restante - (kB * a_restante / a_pago_original)
+
+# Seguro Saldado
+def calc_seguro_saldado(V_rescate, A_nueva):
+    return V_rescate / A_nueva if A_nueva != 0 else 0
+
+# Seguro Prorrogado
+def calc_seguro_prorrogado(df, V_rescate, SA, edad_actual, tipo_seguro, n_restante=None):
+    contar('busquedas_prorrogado')
+    conmutados = df if isinstance(df, CommutationTable) else CommutationTable.desde_df(df)
+    años, meses, dias = resolver_prorrogado(conmutados, V_rescate, SA, edad_actual)
+    return int(años), int(meses), int(dias)
+
+# Busca la edad del prorrogado para una o muchas pólizas a la vez. Mx decrece con la
+# edad, así que en el arreglo invertido (creciente) np.searchsorted da cuántas edades
+# tienen Mx <= M_buscado, y de ahí la primera edad y que cumple M_{y-1} >= M_buscado >= M_y
+# (la misma que encontraba el recorrido lineal de edad_actual + 1 a la penúltima edad).
+# Devuelve (años, meses, días) como arreglos de la forma de las entradas.
+def resolver_prorrogado(conmutados, V_rescate, SA, edad_actual):
+    V_rescate, SA, edad_actual = np.broadcast_arrays(
+        np.asarray(V_rescate, dtype=np.float64), np.asarray(SA, dtype=np.float64), np.asarray(edad_actual))
+    Dx, Mx = conmutados.Dx, conmutados.Mx
+    pos = conmutados.indices(edad_actual)
+    Dx_actual = Dx[pos]
+    M_buscado = Mx[pos] - (V_rescate / SA) * Dx_actual
+    ultima = len(Mx) - 2
+    j = np.maximum(len(Mx) - np.searchsorted(Mx[::-1], M_buscado, side='right'), pos + 1)
+    encontrado = (j <= ultima) & (Dx_actual != 0)
+    j = np.minimum(j, ultima)
+    M_edad_ant, M_edad = Mx[j - 1], Mx[j]
+    encontrado &= M_buscado <= M_edad_ant
+    with np.errstate(divide='ignore', invalid='ignore'):
+        I = np.where(M_edad_ant != M_edad, ((M_edad_ant - M_buscado) / (M_edad_ant - M_edad)) * 365, 0.0)
+    return _normalizar_prorroga(np.where(encontrado, j - 1 - pos, 0), np.where(encontrado, I, 0.0))
+
+# Convierte años completos más I días (base 365/30) en años, meses y días
+def _normalizar_prorroga(años, I):
+    meses = np.trunc(I / 30).astype(np.int64)
+    dias = np.round(I - meses * 30).astype(np.int64)
+    meses = meses + (dias >= 30)
+    dias = np.where(dias >= 30, dias - 30, dias)
+    años = años + meses // 12
+    meses = meses % 12
+    return años.astype(np.int64), meses, dias
+
+TIPOS_SEGURO = ("Vitalicio", "Temporal", "Dotal (Mixto)")
+TIPOS_RECARGO = ("Mínimos", "Máximos")
+
+# Recargos por familia de producto (Vitalicio y Dotal comparten los de 'permanente'):
+# α (honorarios), γ (administración) y β (cobranza) por tipo de recargo, y k
+# (adquisición) = min(plazo_pago × k_por_año, k_max). Es la única fuente de los
+# recargos: la usan calc_recargos y la valuación vectorizada, y almacen.py la incluye
+# en la huella de cada corrida.
+RECARGOS = {
+    'temporal': {
+        'alpha': 0,
+        'gamma': {"Mínimos": 2 / 1000, "Máximos": 3 / 1000},
+        'beta': {"Mínimos": 0.05, "Máximos": 0.07},
+        'k_por_año': 0.03,
+        'k_max': 0.6,
+    },
+    'permanente': {
+        'alpha': 0,
+        'gamma': {"Mínimos": 5 / 1000, "Máximos": 7 / 1000},
+        'beta': {"Mínimos": 0.05, "Máximos": 0.07},
+        'k_por_año': 0.05,
+        'k_max': 1.0,
+    },
+}
+
+# Recargos (α, γ, β, k) según el tipo de seguro, el tipo de recargo y el plazo de pago
+def calc_recargos(tipo_seguro, tipo_recargo, plazo_pago):
+    recargos = RECARGOS['permanente' if tipo_seguro in ["Vitalicio", "Dotal (Mixto)"] else 'temporal']
+    tipo_recargo = "Mínimos" if tipo_recargo == "Mínimos" else "Máximos"
+    gamma, beta = recargos['gamma'][tipo_recargo], recargos['beta'][tipo_recargo]
+    k = min(plazo_pago * recargos['k_por_año'], recargos['k_max'])
+    alpha = recargos['alpha']
+    return alpha, gamma, beta, k
+
+# --- Valuación vectorizada de carteras ---
+
+# División elemento a elemento que devuelve 0 donde el denominador es 0, como las funciones escalares
+def _dividir(a, b):
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+    return np.divide(a, b, out=np.zeros(a.shape), where=(b != 0))
+
+# PNU (o A_{x+t}) por tipo de seguro; 0 donde Dx es 0, como en calc_PNU_*
+def _pnu_vectorizado(vitalicio, dotal, M, M_n, D, D_n):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        A = np.where(vitalicio, M / D, (M - M_n) / D)
+        A = np.where(dotal, (M - M_n) / D + D_n / D, A)
+    return np.where(D != 0, A, 0.0)
+
+# Una máscara por cada valor permitido. Se compara directamente en lugar de usar
+# np.unique/np.setdiff1d, que ordenan la columna completa (lento con cadenas de pandas).
+def _validar_categoria(valores, permitidos, etiqueta):
+    mascaras = [valores == permitido for permitido in permitidos]
+    conocidos = np.logical_or.reduce(mascaras)
+    if not conocidos.all():
+        raise ValueError(f"{etiqueta} desconocido: {np.unique(valores[~conocidos].astype(str))}")
+    return mascaras
+
+# Normaliza y valida las columnas de una cartera. Para el seguro Vitalicio el plazo
+# del seguro es siempre hasta la última edad de la tabla.
+def _preparar_cartera(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo):
+    columnas = np.broadcast_arrays(
+        np.asarray(tipo_seguro), np.asarray(edad, dtype=np.int64), np.asarray(suma_asegurada, dtype=np.float64),
+        np.asarray(plazo_seguro, dtype=np.int64), np.asarray(plazo_pago, dtype=np.int64), np.asarray(tipo_recargo))
+    tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo = (np.atleast_1d(c) for c in columnas)
+
+    vitalicio, temporal, dotal = _validar_categoria(tipo_seguro, TIPOS_SEGURO, "Tipo de seguro")
+    minimos, _ = _validar_categoria(tipo_recargo, TIPOS_RECARGO, "Tipo de recargo")
+    x0, omega = conmutados.edad_min, conmutados.edad_max
+    plazo_seguro = np.where(vitalicio, omega - edad, plazo_seguro)
+    if np.any(edad < x0) or np.any(edad >= omega):
+        raise ValueError(f"La edad de emisión debe estar entre {x0} y {omega - 1}")
+    if np.any(plazo_seguro < 1) or np.any(edad + plazo_seguro > omega):
+        raise ValueError(f"El plazo del seguro debe ser al menos 1 año y terminar a más tardar a la edad {omega}")
+    if np.any(plazo_pago < 1) or np.any(plazo_pago > plazo_seguro):
+        raise ValueError("El plazo de pago debe estar entre 1 y el plazo del seguro")
+    return {
+        'vitalicio': vitalicio,
+        'dotal': dotal,
+        'temporal': temporal,
+        'minimos': minimos,
+        'edad': edad,
+        'suma_asegurada': suma_asegurada,
+        'plazo_seguro': plazo_seguro,
+        'plazo_pago': plazo_pago,
+    }
+
+# Prima comercial por póliza (no depende del año de cálculo)
+def _primas_cartera(conmutados, c):
+    vitalicio, dotal, temporal, minimos = c['vitalicio'], c['dotal'], c['temporal'], c['minimos']
+    temporales, permanentes = RECARGOS['temporal'], RECARGOS['permanente']
+
+    def por_familia(recargo):
+        return np.where(temporal, np.where(minimos, temporales[recargo]["Mínimos"], temporales[recargo]["Máximos"]),
+                        np.where(minimos, permanentes[recargo]["Mínimos"], permanentes[recargo]["Máximos"]))
+
+    gamma, beta = por_familia('gamma'), por_familia('beta')
+    k = np.where(temporal, np.minimum(c['plazo_pago'] * temporales['k_por_año'], temporales['k_max']),
+                 np.minimum(c['plazo_pago'] * permanentes['k_por_año'], permanentes['k_max']))
+    alpha = np.where(temporal, temporales['alpha'], permanentes['alpha'])
+
+    # El índice va sobre el último eje para admitir también tablas de varias tasas
+    Dx, Nx, Mx = conmutados.Dx, conmutados.Nx, conmutados.Mx
+    pos = c['edad'] - conmutados.edad_min
+    pos_n = pos + c['plazo_seguro']
+    D, N, M = Dx[..., pos], Nx[..., pos], Mx[..., pos]
+    PNU = _pnu_vectorizado(vitalicio, dotal, M, Mx[..., pos_n], D, Dx[..., pos_n])
+    a_pago = np.where(vitalicio, _dividir(N, D), _dividir(N - Nx[..., pos + c['plazo_pago']], D))
+    a_seguro = np.where(vitalicio, a_pago, _dividir(N - Nx[..., pos_n], D))
+    P = _dividir(PNU, a_pago)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        B = _dividir(P * a_pago + alpha + gamma * a_seguro, a_pago * (1 - k / a_pago - beta))
+    return {'PNU': PNU, 'P': P, 'B': B, 'a_pago': a_pago, 'k': k}
+
+# Valor de rescate por $1 al año t (cero cuando t >= plazo del seguro, como en la app).
+# Los índices van sobre el último eje, así que también sirve con tablas de varias tasas
+# o escenarios. Devuelve (vigente, edad_actual, D_t, D_n, A_actual, V_rescate).
+def _rescate_en_t(conmutados, c, primas, t_anos):
+    vitalicio, dotal = c['vitalicio'], c['dotal']
+    edad, plazo_seguro, plazo_pago = c['edad'], c['plazo_seguro'], c['plazo_pago']
+    P, B, a_pago, k = primas['P'], primas['B'], primas['a_pago'], primas['k']
+    Dx, Nx, Mx, x0 = conmutados.Dx, conmutados.Nx, conmutados.Mx, conmutados.edad_min
+    pos_n = edad + plazo_seguro - x0
+
+    vigente = t_anos < plazo_seguro
+    edad_actual = np.where(vigente, edad + t_anos, edad)
+    pos_t = edad_actual - x0
+    D_t, M_t = Dx[..., pos_t], Mx[..., pos_t]
+    D_n = np.broadcast_to(Dx[..., pos_n], D_t.shape)
+    A_actual = _pnu_vectorizado(vitalicio, dotal, M_t, Mx[..., pos_n], D_t, D_n)
+    a_restante = np.where(t_anos < plazo_pago, _dividir(Nx[..., pos_t] - Nx[..., edad + plazo_pago - x0], D_t), 0.0)
+    V_rescate = A_actual - P * a_restante
+    V_rescate = np.where(a_pago != 0, V_rescate - _dividir(k * B * a_restante, a_pago), V_rescate)
+    V_rescate = np.where(vigente, V_rescate, 0.0)
+    return vigente, edad_actual, D_t, D_n, A_actual, V_rescate
+
+# Rescate, saldado y prorrogado al año t. Las columnas de la cartera y de las primas
+# pueden venir con forma (n, 1) y t con forma (1, T) para evaluar todas las duraciones
+# en una sola pasada; el resultado toma la forma de la difusión.
+def _valores_en_t(conmutados, c, primas, t_anos):
+    dotal = c['dotal']
+    edad, suma_asegurada, plazo_seguro = c['edad'], c['suma_asegurada'], c['plazo_seguro']
+    vigente, edad_actual, D_t, D_n, A_actual, V_rescate = _rescate_en_t(conmutados, c, primas, t_anos)
+
+    # Seguro saldado
+    S_saldado = np.where(vigente, _dividir(V_rescate, A_actual), 0.0)
+
+    # Seguro prorrogado y devolución del dotal
+    años, meses, dias = resolver_prorrogado(conmutados, V_rescate, 1, edad_actual)
+    años, meses, dias = (np.where(vigente, v, 0) for v in (años, meses, dias))
+    V_rescate_total = V_rescate * suma_asegurada
+    n_restante = np.where(vigente, plazo_seguro - t_anos, 0)
+    devolucion = np.where(dotal & vigente & (años >= n_restante) & (D_t != 0),
+                          V_rescate_total - suma_asegurada * _dividir(D_n, D_t), 0.0)
+    return {
+        'edad_actual': edad + t_anos,
+        'A_actual': np.where(vigente, A_actual, 0.0),
+        'V_rescate_total': V_rescate_total,
+        'S_saldado_total': S_saldado * suma_asegurada,
+        'n_restante': n_restante,
+        'años': años,
+        'meses': meses,
+        'dias': dias,
+        'devolucion': devolucion,
+    }
+
+# Modo compacto para carteras grandes: todo se calcula en float64 (conmutados
+# incluidos) y solo el resultado se guarda en float32 y enteros de 32 bits, la mitad
+# de memoria. Cada valor se redondea una sola vez, así que el error relativo frente al
+# cálculo en float64 es a lo más COTA_ERROR_COMPACTO (2^-24, unos 6e-8, media unidad
+# en el último lugar de float32); los enteros son exactos.
+COTA_ERROR_COMPACTO = 2.0 ** -24
+TIPOS_COMPACTOS = {np.dtype(np.float64): np.float32, np.dtype(np.int64): np.int32}
+# Duraciones por bloque al armar calendarios en modo compacto o por bloques
+BLOQUE_DURACIONES = 8
+
+def _compactar(resultado):
+    return {clave: v.astype(TIPOS_COMPACTOS.get(v.dtype, v.dtype), copy=False) for clave, v in resultado.items()}
+
+# Valúa una cartera completa con operaciones de arreglos sobre la tabla de conmutados.
+# Recibe columnas (listas o arreglos del mismo largo, o escalares que se replican) y
+# devuelve un diccionario de arreglos con las mismas claves que pdf_data.
+def valuar_cartera(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos, compacto=False):
+    c = _preparar_cartera(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo)
+    t_anos = np.broadcast_to(np.asarray(t_anos, dtype=np.int64), c['edad'].shape)
+    if np.any(t_anos < 1):
+        raise ValueError("El año de cálculo debe ser al menos 1")
+    primas = _primas_cartera(conmutados, c)
+    resultado = {'PNU': primas['PNU'], 'P': primas['P'], 'B_total': primas['B'] * c['suma_asegurada']}
+    resultado.update(_valores_en_t(conmutados, c, primas, t_anos))
+    return _compactar(resultado) if compacto else resultado
+
+# Primas por póliza, duraciones t = 1..t_max y una función que da los valores de un
+# grupo de duraciones como matrices (pólizas × duraciones)
+def _preparar_calendario(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_max):
+    c = _preparar_cartera(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo)
+    primas = _primas_cartera(conmutados, c)
+    if t_max is None:
+        t_max = int(c['plazo_seguro'].max()) - 1 if c['plazo_seguro'].size else 0
+    t = np.arange(1, max(t_max, 0) + 1, dtype=np.int64)
+    columna = {clave: v[:, None] for clave, v in c.items()}
+    primas_columna = {clave: v[:, None] for clave, v in primas.items()}
+    por_poliza = {'PNU': primas['PNU'], 'P': primas['P'], 'B_total': primas['B'] * c['suma_asegurada']}
+    return por_poliza, t, lambda t_bloque: _valores_en_t(conmutados, columna, primas_columna, t_bloque[None, :])
+
+# Tabla de valores garantizados para t = 1..n en una sola pasada: las primas se
+# calculan una vez por póliza y los valores al año t se difunden sobre una matriz
+# (pólizas × duraciones). Las duraciones posteriores al plazo de cada póliza quedan
+# en cero. Devuelve 't' (T,) y los mismos campos que valuar_cartera con forma (n, T).
+# Con compacto=True las matrices son float32/int32 y se llenan por bloques de
+# duraciones, de modo que los intermedios en float64 ocupan solo un bloque.
+def valuar_calendario(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_max=None,
+                      compacto=False, bloque=BLOQUE_DURACIONES):
+    por_poliza, t, valores = _preparar_calendario(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago,
+                                                  tipo_recargo, t_max)
+    if not compacto:
+        resultado = {'t': t, **por_poliza}
+        resultado.update(valores(t))
+        return resultado
+    resultado = {'t': t, **_compactar(por_poliza)}
+    for inicio in range(0, max(t.size, 1), bloque):
+        t_bloque = t[inicio:inicio + bloque]
+        for campo, v in valores(t_bloque).items():
+            if campo not in resultado:
+                resultado[campo] = np.empty(v.shape[:-1] + t.shape, dtype=TIPOS_COMPACTOS.get(v.dtype, v.dtype))
+            resultado[campo][:, inicio:inicio + t_bloque.size] = v
+    return resultado
+
+# Calendario por bloques de duraciones, para escribirlo sin tenerlo completo en
+# memoria: cada bloque trae 't' con sus duraciones, las primas por póliza y los campos
+# de valuar_calendario con forma (n, duraciones del bloque). Siempre hay al menos un
+# bloque (vacío si no hay duraciones), para que el consumidor conozca los campos.
+def iterar_calendario(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_max=None,
+                      compacto=False, bloque=BLOQUE_DURACIONES):
+    por_poliza, t, valores = _preparar_calendario(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago,
+                                                  tipo_recargo, t_max)
+    if compacto:
+        por_poliza = _compactar(por_poliza)
+    for inicio in range(0, max(t.size, 1), bloque):
+        t_bloque = t[inicio:inicio + bloque]
+        resultado = valores(t_bloque)
+        yield {'t': t_bloque, **por_poliza, **(_compactar(resultado) if compacto else resultado)}
+
+# Prima y valor de rescate al año t sobre una tabla de varias tasas o escenarios
+# (columnas con forma escenarios × edades); cada resultado tiene forma (escenarios, n).
+# No incluye saldado ni prorrogado, cuya búsqueda necesita una sola curva de Mx.
+def valuar_escenarios(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos):
+    c = _preparar_cartera(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo)
+    t_anos = np.broadcast_to(np.asarray(t_anos, dtype=np.int64), c['edad'].shape)
+    if np.any(t_anos < 1):
+        raise ValueError("El año de cálculo debe ser al menos 1")
+    primas = _primas_cartera(conmutados, c)
+    vigente, _, _, _, A_actual, V_rescate = _rescate_en_t(conmutados, c, primas, t_anos)
+    return {'PNU': primas['PNU'], 'P': primas['P'], 'B_total': primas['B'] * c['suma_asegurada'],
+            'A_actual': np.where(vigente, A_actual, 0.0), 'V_rescate_total': V_rescate * c['suma_asegurada']}
+
+# Columna de conmutados con una fila por póliza: al indexarla con [..., pos] cada
+# póliza toma la edad pos de su propia fila (en lugar de todas las filas por todas las pólizas)
+class _ColumnaPorPoliza:
+    __slots__ = ('valores',)
+
+    def __init__(self, valores):
+        self.valores = valores
+
+    def __getitem__(self, indice):
+        pos = np.broadcast_to(indice[-1], self.valores.shape[:1])
+        return np.take_along_axis(self.valores, pos[:, None], axis=-1)[:, 0]
+
+# Conmutados con una tasa distinta para cada póliza (tasas del largo de la cartera),
+# para valuar_objetivos. Cada fila es la misma que daría desde_tasa con esa tasa.
+class TablaPorPoliza:
+    def __init__(self, tasas, tabla=TABLA_MORTALIDAD):
+        base = CommutationTable.desde_tasa(np.atleast_1d(np.asarray(tasas, dtype=np.float64)), registro.obtener(tabla))
+        self.x, self.edad_min, self.edad_max = base.x, base.edad_min, base.edad_max
+        self.Dx, self.Nx, self.Cx, self.Mx = (_ColumnaPorPoliza(col) for col in (base.Dx, base.Nx, base.Cx, base.Mx))
+
+    def __len__(self):
+        return len(self.x)
+
+# Prima comercial, valor de rescate y suma asegurada saldada al año t: los valores que
+# busca el cálculo inverso (inverso.py). No calcula el prorrogado, así que también
+# admite una TablaPorPoliza. Los resultados son los mismos que los de valuar_cartera.
+def valuar_objetivos(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos):
+    c = _preparar_cartera(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo)
+    t_anos = np.broadcast_to(np.asarray(t_anos, dtype=np.int64), c['edad'].shape)
+    if np.any(t_anos < 1):
+        raise ValueError("El año de cálculo debe ser al menos 1")
+    primas = _primas_cartera(conmutados, c)
+    vigente, _, _, _, A_actual, V_rescate = _rescate_en_t(conmutados, c, primas, t_anos)
+    S_saldado = np.where(vigente, _dividir(V_rescate, A_actual), 0.0)
+    return {'B_total': primas['B'] * c['suma_asegurada'], 'V_rescate_total': V_rescate * c['suma_asegurada'],
+            'S_saldado_total': S_saldado * c['suma_asegurada']}
+
+# --- Sensibilidad a la tasa de interés ---
+
+# Malla (tasas × edades de emisión) de PNU, prima neta nivelada y prima comercial por
+# $1 de suma asegurada. Los conmutados de todas las tasas se construyen de una vez y
+# las primas se evalúan sobre toda la malla. Para Vitalicio el plazo del seguro es
+# hasta la última edad; las edades donde el plazo no cabe en la tabla quedan en NaN.
+def calc_sensibilidad(tasas, tipo_seguro, plazo_seguro, plazo_pago, tipo_recargo, tabla=TABLA_MORTALIDAD):
+    tasas = np.atleast_1d(np.asarray(tasas, dtype=np.float64))
+    conmutados = CommutationTable.desde_tasa(tasas, registro.obtener(tabla))
+    edades = conmutados.x[:-1]
+    if tipo_seguro == "Vitalicio":
+        validas = np.ones(edades.shape, dtype=bool)
+        plazo_seguro = conmutados.edad_max - edades
+    else:
+        validas = edades + plazo_seguro <= conmutados.edad_max
+    # En edades avanzadas el plazo de pago se recorta al plazo del seguro
+    plazo_pago = np.minimum(plazo_pago, plazo_seguro)
+    c = _preparar_cartera(conmutados, tipo_seguro, edades[validas], 1.0, np.broadcast_to(plazo_seguro, edades.shape)[validas],
+                          np.broadcast_to(plazo_pago, edades.shape)[validas], tipo_recargo)
+    primas = _primas_cartera(conmutados, c)
+    resultado = {'tasas': tasas, 'edades': edades}
+    for clave in ('PNU', 'P', 'B'):
+        malla = np.full((tasas.size, edades.size), np.nan)
+        malla[:, validas] = primas[clave]
+        resultado[clave] = malla
+    return resultado
@@ -1,121 +1,34 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-from datetime import datetime
-
-# Intentar importar fpdf, si no está disponible, desactivar PDF
-try:
-    from fpdf import FPDF
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
+import importlib.util
+import io
+
+from calculos import (
+    cache_conmutados,
+    calc_recargos,
+    calc_sensibilidad,
+)
+from estocastico import ModeloTasas, valuar_estocastico
+from exportar import FORMATOS, PARQUET_DISPONIBLE, exportar, grupos_calendario, grupos_conmutados, leer_polizas
+from grafo import calendario_poliza, crear_grafo_poliza, valores_poliza
+from inverso import INTERVALO_TASA, resolver
+from medicion import ACTIVA as MEDICION_POR_OMISION, etapa, medir
+from tablas import registro
+
+# fpdf se importa solo al generar el PDF; aquí basta saber si está instalado
+PDF_AVAILABLE = importlib.util.find_spec('fpdf') is not None
+if not PDF_AVAILABLE:
     st.warning("⚠️ Módulo 'fpdf' no instalado. Para generar PDFs, ejecuta: pip install fpdf")
 
-# Inicializar session_state
-st.session_state.setdefault('results_ready', False)
-st.session_state.setdefault('pdf_data', {})
-
-# Datos de mortalidad - CORREGIDOS para tener la misma longitud
-data = {
-    'x': list(range(12, 101)),  # 12 a 100 (89 valores)
-    'lx': [10000000.00, 9996040.00, 9991772, 9987175, 9982232, 9976911, 9971175, 9965002, 9958356, 9951206, 9943513, 9935230, 9926319, 9916730, 9906406, 9895301, 9883358, 9870509, 9856691, 9841827, 9825844, 9808658, 9790179, 9770314, 9748956, 9726007, 9701352, 9674867, 9646423, 9615883, 9583092, 9547903, 9510151, 9469657, 9426238, 9379692, 9329820, 9276407, 9219227, 9158039, 9092605, 9022655, 8947930, 8868159, 8783051, 8692322, 8595672, 8492808, 8383429, 8267235, 8143937, 8013243, 7874895, 7728626, 7574208, 7411439, 7240153, 7060228, 6871578, 6674199, 6468140.00, 6253527, 6030583, 5799611, 5561038, 5315385, 5063308, 4805576, 4543100, 4276911, 4008175, 3738177, 3468318, 3200088, 2935067, 2674876, 2421164, 2175571, 1939687, 1715009, 1502902, 1304559, 1120960, 952835, 800645, 664559, 544452, 439906.00, 350237],
-    'dx': [3960.00, 4268, 4596, 4944, 5321, 5737, 6172, 6647, 7150, 7692, 8283, 8912, 9589, 10323, 11105, 11944, 12848, 13819, 14864, 15983, 17185, 18480, 19864, 21358, 22949, 24655, 26485, 28444, 30541, 32790, 35189, 37752, 40494, 43418, 46547, 49872, 53413, 57180, 61188, 65434, 69949, 74726, 79771, 85108, 90729, 96650, 102864, 109379, 116194, 123298, 130694, 138349, 146268, 154418, 162770, 171286, 179925, 188649, 197379, 206059, 214613, 222944, 230971, 238573, 245653, 252077, 257733, 262476, 266189, 268735, 269999, 269859, 268229, 265022, 260191, 253712, 245593, 235884, 224678, 212107, 198342, 183600, 168125, 152190, 136086, 120108, 104546, 89669, 350237]
-}
-
-# Función para calcular valores conmutados
-def calcular_valores_conmutados(i):
-    df = pd.DataFrame(data)
-    df['Dx'] = df['lx'] * ((1 + i) ** (-df['x']))
-    df['Cx'] = df['dx'] * ((1 + i) ** (-(df['x'] + 1)))
-    df['Nx'] = df['Dx'][::-1].cumsum()[::-1]
-    df['Mx'] = df['Cx'][::-1].cumsum()[::-1]
-    return df
-
-# Función para obtener valor conmutado
-def get_valor(df, edad, columna):
-    try:
-        return df[df['x'] == edad][columna].values[0]
-    except:
-        return 0
-
-# Cálculo de anualidades
-def calc_anualidad_anticipada_vitalicia(df, edad, i):
-    Dx = get_valor(df, edad, 'Dx')
-    Nx = get_valor(df, edad, 'Nx')
-    return Nx / Dx if Dx != 0 else 0
-
-def calc_anualidad_anticipada_temporal(df, edad, n, i):
-    Dx = get_valor(df, edad, 'Dx')
-    Nx = get_valor(df, edad, 'Nx')
-    Nx_n = get_valor(df, edad + n, 'Nx')
-    return (Nx - Nx_n) / Dx if Dx != 0 else 0
-
-# PNU - Prima Neta Única
-def calc_PNU_vitalicia(df, edad, i):
-    Dx = get_valor(df, edad, 'Dx')
-    Mx = get_valor(df, edad, 'Mx')
-    return Mx / Dx if Dx != 0 else 0
-
-def calc_PNU_temporal(df, edad, n, i):
-    Dx = get_valor(df, edad, 'Dx')
-    Mx = get_valor(df, edad, 'Mx')
-    Mx_n = get_valor(df, edad + n, 'Mx')
-    return (Mx - Mx_n) / Dx if Dx != 0 else 0
-
-def calc_PNU_dotal(df, edad, n, i):
-    Dx = get_valor(df, edad, 'Dx')
-    Dx_n = get_valor(df, edad + n, 'Dx')
-    Mx = get_valor(df, edad, 'Mx')
-    Mx_n = get_valor(df, edad + n, 'Mx')
-    return ((Mx - Mx_n) / Dx + Dx_n / Dx) if Dx != 0 else 0
-
-# Prima Comercial
-def calc_prima_comercial(P, a_pago, a_seguro, alpha, gamma, beta, k):
-    numerador = P * a_pago + alpha + gamma * a_seguro
-    denominador = a_pago * (1 - k / a_pago - beta)
-    return numerador / denominador if denominador != 0 else 0
-
-# Valor de Rescate
-def calc_valor_rescate(A_actual, P, a_restante, kB, a_pago_original):
-    # proteger división por cero
-    if a_pago_original == 0:
-        return A_actual - P * a_restante
-    return A_actual - P * a_restante - (kB * a_restante / a_pago_original)
-
-# Seguro Saldado
-def calc_seguro_saldado(V_rescate, A_nueva):
-    return V_rescate / A_nueva if A_nueva != 0 else 0
+# Tasas por exportación desde la interfaz (el archivo se arma en memoria para la descarga)
+MAX_TASAS_EXPORTAR = 20_000
+# Renglones por exportación de una cartera cargada (unos 130 MB en CSV)
+MAX_RENGLONES_EXPORTAR = 1_000_000
+TIPOS_MIME = {'csv': "text/csv", 'parquet': "application/vnd.apache.parquet"}
 
-# Seguro Prorrogado
-def calc_seguro_prorrogado(df, V_rescate, SA, edad_actual, tipo_seguro, n_restante=None):
-    edad_x = edad_actual
-    Dx_actual = get_valor(df, edad_x, 'Dx')
-    Mx_actual = get_valor(df, edad_x, 'Mx')
-    if Dx_actual == 0:
-        return 0, 0, 0
-    M_buscado = Mx_actual - (V_rescate / SA) * Dx_actual
-    for edad in range(edad_x + 1, 100):
-        M_edad_ant = get_valor(df, edad - 1, 'Mx')
-        M_edad = get_valor(df, edad, 'Mx')
-        if M_buscado <= M_edad_ant and M_buscado >= M_edad:
-            edad_encontrada = edad - 1
-            if M_edad_ant != M_edad:
-                I = ((M_edad_ant - M_buscado) / (M_edad_ant - M_edad)) * 365
-            else:
-                I = 0
-            años = edad_encontrada - edad_x
-            dias_totales = I
-            meses = int(dias_totales / 30)
-            dias_restantes = dias_totales - (meses * 30)
-            dias = round(dias_restantes)
-            if dias >= 30:
-                meses += 1
-                dias -= 30
-            if meses >= 12:
-                años += meses // 12
-                meses = meses % 12
-            return años, meses, dias
-    return 0, 0, 0
+# Inicializar session_state
+st.session_state.setdefault('rendimiento', {})
 
 # Configuración de Streamlit
 st.set_page_config(page_title="Valores Garantizados - Seguros", layout="wide")
@@ -125,198 +38,155 @@ st.markdown("### Sistema de cálculo para Seguros de Vida")
 # Sidebar para parámetros generales
 with st.sidebar:
     st.header("⚙️ Parámetros Generales")
+    nombre_tabla = st.selectbox("Tabla de Mortalidad", registro.nombres(), help="Se agregan tablas copiando archivos .npy al directorio de tablas")
+    try:
+        tabla_mortalidad = registro.obtener(nombre_tabla)
+    except (OSError, ValueError) as e:
+        st.error(f"❌ No se pudo cargar la tabla '{nombre_tabla}': {e}")
+        st.stop()
+    omega = tabla_mortalidad.edad_max
     tipo_seguro = st.selectbox("Tipo de Seguro", ["Vitalicio", "Temporal", "Dotal (Mixto)"])
     suma_asegurada = st.number_input("Suma Asegurada ($)", min_value=10000.0, value=100000.0, step=10000.0, help="Mínimo $10,000")
     tasa_interes = st.number_input("Tasa de Interés (%)", min_value=0.01, max_value=10.0, value=4.0, step=0.1, help="Mayor a 0% y menor o igual a 10%")
-    edad = st.number_input("Edad del Asegurado", min_value=12, max_value=99, value=40, step=1)
+    edad = st.number_input("Edad del Asegurado", min_value=tabla_mortalidad.edad_min, max_value=omega - 1,
+                           value=min(max(40, tabla_mortalidad.edad_min), omega - 1), step=1)
     tipo_recargo = st.radio("Tipo de Recargos", ["Mínimos", "Máximos"])
     t_anos = st.number_input("Año de Cálculo (t)", min_value=1, max_value=50, value=10, step=1, help="Año en el que se calculan los valores garantizados")
+    medir_rendimiento = st.checkbox("⏱️ Medir rendimiento", value=MEDICION_POR_OMISION, key="medir_rendimiento",
+                                    help="Mide el tiempo de cada etapa del cálculo y del PDF y lo escribe en el log como JSON")
 
 # Parámetros específicos según tipo de seguro
 st.header("📋 Parámetros del Seguro")
 col1, col2 = st.columns(2)
 with col1:
     if tipo_seguro == "Vitalicio":
-        plazo_seguro = 100 - edad
-        st.info(f"Plazo del Seguro: Vitalicio (hasta edad 100)")
+        plazo_seguro = omega - edad
+        st.info(f"Plazo del Seguro: Vitalicio (hasta edad {omega})")
         plazo_pago = st.number_input("Plazo de Pago de Primas (años)", min_value=1, max_value=plazo_seguro, value=min(20, plazo_seguro), step=1)
     elif tipo_seguro == "Temporal":
-        plazo_seguro = st.number_input("Plazo del Seguro (años)", min_value=1, max_value=100 - edad, value=20, step=1)
+        plazo_seguro = st.number_input("Plazo del Seguro (años)", min_value=1, max_value=omega - edad, value=min(20, omega - edad), step=1)
         plazo_pago = st.number_input("Plazo de Pago de Primas (años)", min_value=1, max_value=plazo_seguro, value=min(15, plazo_seguro), step=1)
     else:
-        plazo_seguro = st.number_input("Plazo del Seguro (años)", min_value=1, max_value=100 - edad, value=20, step=1)
+        plazo_seguro = st.number_input("Plazo del Seguro (años)", min_value=1, max_value=omega - edad, value=min(20, omega - edad), step=1)
         plazo_pago = st.number_input("Plazo de Pago de Primas (años)", min_value=1, max_value=plazo_seguro, value=min(15, plazo_seguro), step=1)
 
 with col2:
     st.markdown("**Recargos Aplicables:**")
-    if tipo_seguro in ["Vitalicio", "Dotal (Mixto)"]:
-        if tipo_recargo == "Mínimos":
-            gamma = 5 / 1000
-            beta = 0.05
-            k = min(plazo_pago * 0.05, 1.0)
-        else:
-            gamma = 7 / 1000
-            beta = 0.07
-            k = min(plazo_pago * 0.05, 1.0)
-    else:
-        if tipo_recargo == "Mínimos":
-            gamma = 2 / 1000
-            beta = 0.05
-            k = min(plazo_pago * 0.03, 0.6)
-        else:
-            gamma = 3 / 1000
-            beta = 0.07
-            k = min(plazo_pago * 0.03, 0.6)
-    alpha = 0
+    alpha, gamma, beta, k = calc_recargos(tipo_seguro, tipo_recargo, plazo_pago)
     st.write(f"• γ (Administración): {gamma:.6f}")
     st.write(f"• β (Cobranza): {beta:.2f}")
     st.write(f"• k (Adquisición): {k:.4f}")
     st.write(f"• α (Honorarios): {alpha}")
 
-# Botón para calcular
-if st.button("🔢 CALCULAR VALORES GARANTIZADOS", type="primary", key="btn_calcular"):
-    i = tasa_interes / 100
-    df_conmutados = calcular_valores_conmutados(i)
+# Cálculo en vivo: el grafo de la sesión guarda cada etapa con las entradas de las que
+# depende, así que al mover un parámetro solo se recalculan las etapas afectadas (por
+# ejemplo, cambiar t no reconstruye conmutados ni primas, y cambiar la suma asegurada
+# no recalcula nada)
+if 'grafo_poliza' not in st.session_state:
+    st.session_state['grafo_poliza'] = crear_grafo_poliza()
+grafo = st.session_state['grafo_poliza']
+entradas = {'i': tasa_interes / 100, 'tabla': nombre_tabla, 'tipo_seguro': tipo_seguro, 'edad': edad,
+            'suma_asegurada': suma_asegurada, 'plazo_seguro': plazo_seguro, 'plazo_pago': plazo_pago,
+            'tipo_recargo': tipo_recargo, 't_anos': t_anos}
+with medir("calculo", medir_rendimiento, tipo_seguro=tipo_seguro, tabla=nombre_tabla, tasa=tasa_interes) as medicion:
+    v = valores_poliza(grafo, entradas)
+    recalculados = list(grafo.recalculados)
     st.header("📊 RESULTADOS")
-    tab1, tab2, tab3, tab4 = st.tabs(["Prima Comercial", "Valor de Rescate", "Seguro Saldado", "Seguro Prorrogado"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Prima Comercial", "Valor de Rescate", "Seguro Saldado", "Seguro Prorrogado", "Tabla de Valores Garantizados"])
+    mensaje_plazo = "El año de cálculo no puede ser mayor o igual al plazo del seguro"
 
     # 1. PRIMA COMERCIAL
-    with tab1:
+    with tab1, etapa("mostrar_prima"):
         st.subheader("💰 Prima Comercial")
-        if tipo_seguro == "Vitalicio":
-            PNU = calc_PNU_vitalicia(df_conmutados, edad, i)
-            a_pago = calc_anualidad_anticipada_vitalicia(df_conmutados, edad, i)
-            a_seguro = a_pago
-            P = PNU / a_pago if a_pago != 0 else 0
-        elif tipo_seguro == "Temporal":
-            PNU = calc_PNU_temporal(df_conmutados, edad, plazo_seguro, i)
-            a_pago = calc_anualidad_anticipada_temporal(df_conmutados, edad, plazo_pago, i)
-            a_seguro = calc_anualidad_anticipada_temporal(df_conmutados, edad, plazo_seguro, i)
-            Nx = get_valor(df_conmutados, edad, 'Nx')
-            Nx_p = get_valor(df_conmutados, edad + plazo_pago, 'Nx')
-            denominador = Nx - Nx_p
-            P = PNU / (denominador / get_valor(df_conmutados, edad, 'Dx')) if denominador != 0 else 0
-        else:
-            PNU = calc_PNU_dotal(df_conmutados, edad, plazo_seguro, i)
-            a_pago = calc_anualidad_anticipada_temporal(df_conmutados, edad, plazo_pago, i)
-            a_seguro = calc_anualidad_anticipada_temporal(df_conmutados, edad, plazo_seguro, i)
-            Nx = get_valor(df_conmutados, edad, 'Nx')
-            Nx_p = get_valor(df_conmutados, edad + plazo_pago, 'Nx')
-            denominador = Nx - Nx_p
-            P = PNU / (denominador / get_valor(df_conmutados, edad, 'Dx')) if denominador != 0 else 0
-
-        B = calc_prima_comercial(P, a_pago, a_seguro, alpha, gamma, beta, k)
-        B_total = B * suma_asegurada
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("PNU por $1", f"${PNU:.10f}")
+            st.metric("PNU por $1", f"${v['PNU']:.10f}")
         with col2:
-            st.metric("Prima Neta Nivelada", f"${P:.10f}")
+            st.metric("Prima Neta Nivelada", f"${v['P']:.10f}")
         with col3:
-            st.metric("Prima Comercial Anual", f"${B_total:,.2f}")
-        st.success(f"**Prima Comercial: ${B_total:,.2f}** (5 puntos)")
+            st.metric("Prima Comercial Anual", f"${v['B_total']:,.2f}")
+        st.success(f"**Prima Comercial: ${v['B_total']:,.2f}** (5 puntos)")
 
     # 2. VALOR DE RESCATE
-    with tab2:
+    with tab2, etapa("mostrar_rescate"):
         st.subheader("💵 Valor de Rescate")
-        if t_anos >= plazo_seguro:
-            st.error("El año de cálculo no puede ser mayor o igual al plazo del seguro")
-            A_actual = 0
-            a_restante = 0
-            V_rescate = 0
-            V_rescate_total = 0
+        if not v['vigente']:
+            st.error(mensaje_plazo)
         else:
-            edad_actual = edad + t_anos
-            if tipo_seguro == "Vitalicio":
-                A_actual = calc_PNU_vitalicia(df_conmutados, edad_actual, i)
-                a_restante = calc_anualidad_anticipada_temporal(df_conmutados, edad_actual, max(plazo_pago - t_anos, 0), i) if t_anos < plazo_pago else 0
-            elif tipo_seguro == "Temporal":
-                n_restante = plazo_seguro - t_anos
-                A_actual = calc_PNU_temporal(df_conmutados, edad_actual, n_restante, i)
-                a_restante = calc_anualidad_anticipada_temporal(df_conmutados, edad_actual, max(plazo_pago - t_anos, 0), i) if t_anos < plazo_pago else 0
-            else:
-                n_restante = plazo_seguro - t_anos
-                A_actual = calc_PNU_dotal(df_conmutados, edad_actual, n_restante, i)
-                a_restante = calc_anualidad_anticipada_temporal(df_conmutados, edad_actual, max(plazo_pago - t_anos, 0), i) if t_anos < plazo_pago else 0
-
-            a_pago_original = a_pago if 'a_pago' in locals() else 0
-            V_rescate = calc_valor_rescate(A_actual, P, a_restante, k * B, a_pago_original)
-            V_rescate_total = V_rescate * suma_asegurada
             col1, col2 = st.columns(2)
             with col1:
-                st.metric("Edad Actual", f"{edad_actual} años")
-                st.metric("A_{x+t}", f"{A_actual:.10f}")
+                st.metric("Edad Actual", f"{v['edad_actual']} años")
+                st.metric("A_{x+t}", f"{v['A_actual']:.10f}")
             with col2:
                 st.metric("Años transcurridos", f"{t_anos} años")
-                st.metric("Anualidad restante", f"{a_restante:.6f}")
-            st.success(f"**Valor de Rescate: ${V_rescate_total:,.2f}** (7.5 puntos)")
+                st.metric("Anualidad restante", f"{v['a_restante']:.6f}")
+            st.success(f"**Valor de Rescate: ${v['V_rescate_total']:,.2f}** (7.5 puntos)")
 
     # 3. SEGURO SALDADO
-    with tab3:
+    with tab3, etapa("mostrar_saldado"):
         st.subheader("🛡️ Seguro Saldado")
-        if t_anos >= plazo_seguro:
-            st.error("El año de cálculo no puede ser mayor o igual al plazo del seguro")
-            A_nueva = 0
-            S_saldado = 0
-            S_saldado_total = 0
-            n_restante = 0
+        if not v['vigente']:
+            st.error(mensaje_plazo)
         else:
-            edad_actual = edad + t_anos
-            n_restante = plazo_seguro - t_anos if tipo_seguro != "Vitalicio" else (100 - edad_actual)
-            if tipo_seguro == "Vitalicio":
-                A_nueva = calc_PNU_vitalicia(df_conmutados, edad_actual, i)
-            elif tipo_seguro == "Temporal":
-                A_nueva = calc_PNU_temporal(df_conmutados, edad_actual, n_restante, i)
-            else:
-                A_nueva = calc_PNU_dotal(df_conmutados, edad_actual, n_restante, i)
-            S_saldado = calc_seguro_saldado(V_rescate, A_nueva)
-            S_saldado_total = S_saldado * suma_asegurada
             col1, col2 = st.columns(2)
             with col1:
-                st.metric("PNU Nueva", f"{A_nueva:.10f}")
-                st.metric("Vigencia Restante", f"{n_restante} años")
+                st.metric("PNU Nueva", f"{v['A_nueva']:.10f}")
+                st.metric("Vigencia Restante", f"{v['n_restante']} años")
             with col2:
-                st.metric("Valor Rescate Utilizado", f"${V_rescate_total:,.2f}")
-                st.metric("Nueva Suma Asegurada", f"${S_saldado_total:,.2f}")
-            st.success(f"**Seguro Saldado: ${S_saldado_total:,.2f}** (7.5 puntos)")
-            st.info(f"El asegurado queda cubierto por ${S_saldado_total:,.2f} durante los {n_restante} años restantes")
+                st.metric("Valor Rescate Utilizado", f"${v['V_rescate_total']:,.2f}")
+                st.metric("Nueva Suma Asegurada", f"${v['S_saldado_total']:,.2f}")
+            st.success(f"**Seguro Saldado: ${v['S_saldado_total']:,.2f}** (7.5 puntos)")
+            st.info(f"El asegurado queda cubierto por ${v['S_saldado_total']:,.2f} durante los {v['n_restante']} años restantes")
 
     # 4. SEGURO PRORROGADO
-    with tab4:
+    with tab4, etapa("mostrar_prorrogado"):
         st.subheader("⏰ Seguro Prorrogado")
-        if t_anos >= plazo_seguro:
-            st.error("El año de cálculo no puede ser mayor o igual al plazo del seguro")
-            años, meses, dias = 0, 0, 0
-            edad_actual = edad + t_anos
+        años, meses, dias = v['años'], v['meses'], v['dias']
+        if not v['vigente']:
+            st.error(mensaje_plazo)
         else:
-            edad_actual = edad + t_anos
-            n_restante = plazo_seguro - t_anos if tipo_seguro != "Vitalicio" else None
-            años, meses, dias = calc_seguro_prorrogado(df_conmutados, V_rescate, 1, edad_actual, tipo_seguro, n_restante)
             col1, col2 = st.columns(2)
             with col1:
-                st.metric("Edad Actual", f"{edad_actual} años")
+                st.metric("Edad Actual", f"{v['edad_actual']} años")
                 st.metric("Suma Asegurada", f"${suma_asegurada:,.2f}")
             with col2:
-                st.metric("Valor Rescate", f"${V_rescate_total:,.2f}")
+                st.metric("Valor Rescate", f"${v['V_rescate_total']:,.2f}")
                 st.metric("Prórroga", f"{años} años, {meses} meses, {dias} días")
-            if tipo_seguro == "Dotal (Mixto)":
-                if años >= (n_restante or 0):
-                    Dx_actual = get_valor(df_conmutados, edad_actual, 'Dx')
-                    Dx_final = get_valor(df_conmutados, edad + plazo_seguro, 'Dx')
-                    devolucion = V_rescate_total - (suma_asegurada * (Dx_final / Dx_actual)) if Dx_actual != 0 else 0
-                    st.success(f"**Prórroga: Hasta término de vigencia ({n_restante} años)**")
-                    if devolucion > 0:
-                        st.info(f"**Devolución si llega con vida: ${devolucion:,.2f}** (10 puntos)")
-                else:
-                    st.success(f"**Prórroga: {años} años, {meses} meses, {dias} días** (10 puntos)")
+            if v['hasta_termino']:
+                st.success(f"**Prórroga: Hasta término de vigencia ({v['n_restante']} años)**")
+                if v['devolucion'] > 0:
+                    st.info(f"**Devolución si llega con vida: ${v['devolucion']:,.2f}** (10 puntos)")
             else:
                 st.success(f"**Prórroga: {años} años, {meses} meses, {dias} días** (10 puntos)")
             st.info(f"📅 **Fecha de término de la prórroga:** {años} años, {meses} meses y {dias} días desde hoy")
 
-    # Guardar resultados en session_state para poder generar PDF fuera del bloque de cálculo
-    st.session_state['results_ready'] = True
-    st.session_state['pdf_data'] = {
+    # 5. TABLA DE VALORES GARANTIZADOS (todos los años de vigencia)
+    with tab5, etapa("mostrar_tabla_valores"):
+        st.subheader("📑 Tabla de Valores Garantizados")
+        calendario = calendario_poliza(grafo, entradas)
+        recalculados += grafo.recalculados
+        if calendario['t'].size == 0:
+            st.info("El seguro tiene un solo año de vigencia; no hay valores garantizados que mostrar")
+        else:
+            tabla_vg = pd.DataFrame({
+                'Año (t)': calendario['t'],
+                'Edad': calendario['edad_actual'][0],
+                'Valor de Rescate ($)': calendario['V_rescate_total'][0],
+                'Seguro Saldado ($)': calendario['S_saldado_total'][0],
+                'Prórroga (años)': calendario['años'][0],
+                'Prórroga (meses)': calendario['meses'][0],
+                'Prórroga (días)': calendario['dias'][0],
+            })
+            if tipo_seguro == "Dotal (Mixto)":
+                tabla_vg['Devolución ($)'] = calendario['devolucion'][0]
+            st.dataframe(tabla_vg.style.format({'Valor de Rescate ($)': '{:,.2f}', 'Seguro Saldado ($)': '{:,.2f}', 'Devolución ($)': '{:,.2f}'}),
+                         use_container_width=True, hide_index=True)
+    st.caption("Etapas recalculadas: " + (", ".join(recalculados) if recalculados else "ninguna (resultados reutilizados)"))
+
+    # Datos del reporte PDF, tomados directamente de los resultados del grafo
+    pdf_data = {
         'tipo_seguro': tipo_seguro,
+        'tabla_mortalidad': nombre_tabla,
         'suma_asegurada': suma_asegurada,
         'tasa_interes': tasa_interes,
         'edad': edad,
@@ -324,122 +194,256 @@ if st.button("🔢 CALCULAR VALORES GARANTIZADOS", type="primary", key="btn_calc
         'plazo_pago': plazo_pago,
         'tipo_recargo': tipo_recargo,
         't_anos': t_anos,
-        'PNU': locals().get('PNU', 0),
-        'P': locals().get('P', 0),
-        'B_total': locals().get('B_total', 0),
-        'edad_actual': locals().get('edad_actual', 0),
-        'A_actual': locals().get('A_actual', 0),
-        'V_rescate_total': locals().get('V_rescate_total', 0),
-        'S_saldado_total': locals().get('S_saldado_total', 0),
-        'n_restante': locals().get('n_restante', 0),
-        'años': locals().get('años', 0),
-        'meses': locals().get('meses', 0),
-        'dias': locals().get('dias', 0),
-        'devolucion': locals().get('devolucion', 0)
+        **{clave: v[clave] for clave in ('PNU', 'P', 'B_total', 'edad_actual', 'A_actual', 'V_rescate_total',
+                                         'S_saldado_total', 'n_restante', 'años', 'meses', 'dias', 'devolucion')},
     }
+if medicion is not None:
+    st.session_state['rendimiento']['calculo'] = medicion.resumen()
 
-# --- Generación de PDF fuera del bloque de cálculo ---
+# --- Generación de PDF ---
 st.header("📄 Generar Reporte PDF")
-if not st.session_state.get('results_ready', False):
-    st.info("Primero haz clic en '🔢 CALCULAR VALORES GARANTIZADOS' para poder generar el PDF.")
+if not PDF_AVAILABLE:
+    st.error("❌ Para generar PDF, instala fpdf: pip install fpdf")
+    st.code("pip install fpdf", language="bash")
 else:
-    pdf_data = st.session_state.get('pdf_data', {})
-    if not PDF_AVAILABLE:
-        st.error("❌ Para generar PDF, instala fpdf: pip install fpdf")
-        st.code("pip install fpdf", language="bash")
+    if st.button("📥 Generar y Descargar Reporte en PDF", key="generar_pdf"):
+        try:
+            from reportes import generar_pdf, nombre_reporte
+            with medir("pdf", medir_rendimiento, tipo_seguro=pdf_data.get('tipo_seguro')) as medicion:
+                with etapa("generar_pdf"):
+                    pdf_bytes = generar_pdf(pdf_data)
+                    nombre_archivo = nombre_reporte(pdf_data)
+                with etapa("descarga"):
+                    st.download_button(label="📥 Descargar PDF", data=pdf_bytes, file_name=nombre_archivo, mime="application/pdf")
+            if medicion is not None:
+                st.session_state['rendimiento']['pdf'] = medicion.resumen()
+            st.success("✅ PDF generado exitosamente! Haz clic en 'Descargar PDF' arriba.")
+        except Exception as e:
+            st.error(f"❌ Error al generar PDF: {e}")
+            st.info("Intenta instalar fpdf nuevamente: pip install fpdf")
+
+# --- Tiempos por etapa de la última ejecución de cada flujo ---
+if medir_rendimiento:
+    with st.expander("⏱️ Rendimiento", expanded=False):
+        rendimiento = st.session_state.get('rendimiento', {})
+        if not rendimiento:
+            st.info("Calcula los valores garantizados o genera el PDF para ver los tiempos.")
+        for evento, resumen in rendimiento.items():
+            st.markdown(f"**{evento}**: {resumen['total_ms']:,.2f} ms en total")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.dataframe(pd.DataFrame({'Etapa': list(resumen['etapas_ms']), 'ms': list(resumen['etapas_ms'].values())}),
+                             use_container_width=True, hide_index=True)
+            with col2:
+                st.dataframe(pd.DataFrame({'Contador': list(resumen['contadores']), 'Valor': list(resumen['contadores'].values())}),
+                             use_container_width=True, hide_index=True)
+        estadisticas = cache_conmutados().estadisticas()
+        st.caption(f"Caché de conmutados: {estadisticas['tablas']}/{estadisticas['max_tablas']} tablas, "
+                   f"{estadisticas['aciertos']} aciertos, {estadisticas['fallos']} fallos")
+
+# --- Sensibilidad de primas a la tasa de interés ---
+st.header("📈 Sensibilidad a la Tasa de Interés")
+with st.expander("Mapa de calor tasa × edad", expanded=False):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        tasa_min = st.number_input("Tasa mínima (%)", min_value=0.01, max_value=10.0, value=1.0, step=0.1, key="sens_tasa_min")
+    with col2:
+        tasa_max = st.number_input("Tasa máxima (%)", min_value=0.01, max_value=10.0, value=8.0, step=0.1, key="sens_tasa_max")
+    with col3:
+        n_tasas = st.number_input("Número de tasas", min_value=2, max_value=500, value=50, step=10, key="sens_n_tasas")
+    metrica = st.radio("Valor a mostrar", ["Prima Comercial Anual", "Prima Neta Nivelada", "PNU"], horizontal=True, key="sens_metrica")
+    if tasa_min >= tasa_max:
+        st.error("La tasa mínima debe ser menor que la tasa máxima")
+    elif st.checkbox("Mostrar mapa de calor", key="sens_mostrar"):
+        import altair as alt
+        tasas = np.linspace(tasa_min, tasa_max, int(n_tasas)) / 100
+        sensibilidad = calc_sensibilidad(tasas, tipo_seguro, plazo_seguro, plazo_pago, tipo_recargo, nombre_tabla)
+        malla = {"Prima Comercial Anual": sensibilidad['B'] * suma_asegurada,
+                 "Prima Neta Nivelada": sensibilidad['P'], "PNU": sensibilidad['PNU']}[metrica]
+        tasas_malla, edades_malla = np.meshgrid(tasas * 100, sensibilidad['edades'], indexing='ij')
+        df_malla = pd.DataFrame({'Tasa (%)': tasas_malla.ravel().round(4), 'Edad': edades_malla.ravel(), metrica: malla.ravel()}).dropna()
+        mapa = alt.Chart(df_malla).mark_rect().encode(
+            x=alt.X('Edad:O'),
+            y=alt.Y('Tasa (%):O', sort='descending'),
+            color=alt.Color(f'{metrica}:Q', scale=alt.Scale(scheme='viridis')),
+            tooltip=['Tasa (%)', 'Edad', alt.Tooltip(f'{metrica}:Q', format=',.6f')],
+        )
+        with alt.data_transformers.disable_max_rows():
+            st.altair_chart(mapa, use_container_width=True)
+
+# --- Tasas de interés estocásticas (Monte Carlo) ---
+st.header("🎲 Tasas de Interés Estocásticas")
+with st.expander("Distribución de primas y valor de rescate (Monte Carlo)", expanded=False):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        modelo_tasas = st.radio("Modelo de tasas", list(ModeloTasas.MODELOS), horizontal=True, key="mc_modelo",
+                                format_func=lambda m: {"vasicek": "Vasicek", "lognormal": "Lognormal"}[m])
+        escenarios = st.number_input("Escenarios", min_value=100, max_value=1_000_000, value=10_000, step=10_000, key="mc_escenarios")
+    with col2:
+        tasa_media = st.number_input("Tasa media de largo plazo (%)", min_value=0.01, max_value=10.0, value=tasa_interes, step=0.1, key="mc_media")
+        reversion = st.number_input("Velocidad de reversión", min_value=0.0, max_value=5.0, value=0.1, step=0.05, key="mc_reversion")
+    with col3:
+        if modelo_tasas == "vasicek":
+            volatilidad = st.number_input("Volatilidad anual (puntos %)", min_value=0.0, max_value=5.0, value=1.0, step=0.1, key="mc_vol_vasicek") / 100
+        else:
+            volatilidad = st.number_input("Volatilidad anual (% de la tasa)", min_value=0.0, max_value=100.0, value=10.0, step=1.0, key="mc_vol_lognormal") / 100
+        semilla = st.number_input("Semilla", min_value=0, value=0, step=1, key="mc_semilla")
+    st.caption(f"La tasa del primer año es la tasa de interés técnico ({tasa_interes}%); la misma semilla da siempre los mismos escenarios.")
+    parametros_mc = (tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos, nombre_tabla,
+                     modelo_tasas, tasa_interes, tasa_media, reversion, volatilidad, int(escenarios), int(semilla))
+    if st.button("Simular escenarios", key="mc_simular"):
+        with st.spinner("Simulando trayectorias de tasas..."):
+            modelo = ModeloTasas(modelo_tasas, tasa_interes / 100, tasa_media / 100, reversion, volatilidad)
+            st.session_state['montecarlo'] = (parametros_mc, valuar_estocastico(
+                tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos,
+                modelo=modelo, escenarios=int(escenarios), semilla=int(semilla), tabla=nombre_tabla))
+    simulacion = st.session_state.get('montecarlo')
+    if simulacion is not None and simulacion[0] == parametros_mc:
+        estocastico = simulacion[1]
+        etiquetas = {'PNU': ("PNU por $1", v['PNU']), 'B_total': ("Prima Comercial Anual", v['B_total']),
+                     'V_rescate_total': (f"Valor de Rescate al año {t_anos}", v['V_rescate_total'])}
+        filas = []
+        for campo, (etiqueta, valor_fijo) in etiquetas.items():
+            filas.append({'Valor': etiqueta, 'Tasa fija': valor_fijo, **estocastico[campo]})
+        tabla_mc = pd.DataFrame(filas).rename(columns={'media': 'Media', 'desviacion': 'Desv. estándar'})
+        st.dataframe(tabla_mc, use_container_width=True, hide_index=True)
+        st.caption(f"{estocastico['escenarios']:,} escenarios; p1 ... p99 son percentiles de la distribución.")
+    elif simulacion is not None:
+        st.info("Los parámetros cambiaron; vuelve a simular para ver la distribución.")
+
+# --- Cálculo inverso ---
+st.header("🎯 Cálculo Inverso")
+with st.expander("¿Qué suma asegurada, tasa o edad da un valor objetivo?", expanded=False):
+    nombres_incognita = {'suma_asegurada': "Suma asegurada", 'tasa': "Tasa de interés técnico", 'edad': "Edad de emisión"}
+    nombres_objetivo = {'B_total': "Prima comercial anual", 'V_rescate_total': f"Valor de rescate al año {t_anos}",
+                        'S_saldado_total': f"Suma asegurada saldada al año {t_anos}"}
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        incognita = st.selectbox("Buscar", list(nombres_incognita), format_func=nombres_incognita.get, key="inv_incognita")
+    with col2:
+        objetivo = st.selectbox("Para que", list(nombres_objetivo), format_func=nombres_objetivo.get, key="inv_objetivo")
+    with col3:
+        # Sin key: al cambiar la póliza o el objetivo el valor vuelve al actual
+        valor_objetivo = st.number_input("Valor objetivo ($)", value=round(float(v[objetivo]), 2), step=100.0)
+    st.caption("Los demás datos son los de la póliza actual. La tasa se busca entre "
+               f"{INTERVALO_TASA[0] * 100:g}% y {INTERVALO_TASA[1] * 100:g}%.")
+    parametros_inv = (incognita, objetivo, valor_objetivo, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago,
+                      tipo_recargo, t_anos, tasa_interes, nombre_tabla)
+    if st.button("Resolver", key="inv_resolver"):
+        # El error se guarda con el resultado para mostrarlo mientras no cambien los datos
+        try:
+            st.session_state['inverso'] = (parametros_inv, resolver(
+                incognita, objetivo, valor_objetivo, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago,
+                tipo_recargo, t_anos, i=tasa_interes / 100, tabla=nombre_tabla))
+        except ValueError as e:
+            st.session_state['inverso'] = (parametros_inv, str(e))
+    calculo_inverso = st.session_state.get('inverso')
+    if calculo_inverso is not None and calculo_inverso[0] == parametros_inv:
+        inverso = calculo_inverso[1]
+        if isinstance(inverso, str):
+            st.error(inverso)
+        elif inverso['convergio'][0]:
+            solucion = inverso['solucion'][0]
+            formato = {'suma_asegurada': f"${solucion:,.2f}", 'tasa': f"{solucion * 100:.6f}%", 'edad': f"{solucion:.0f} años"}
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric(nombres_incognita[incognita], formato[incognita])
+            with col2:
+                st.metric("Valor logrado", f"${inverso['logrado'][0]:,.2f}")
+            with col3:
+                st.metric("Iteraciones", int(inverso['iteraciones'][0]))
+            if incognita == 'edad':
+                st.caption("La edad es entera: se muestra la que da el valor más cercano al objetivo.")
+        else:
+            st.warning(f"Ningún valor de {nombres_incognita[incognita].lower()} da ese objetivo con los demás datos de la póliza.")
+    elif calculo_inverso is not None:
+        st.info("Los datos cambiaron; vuelve a resolver.")
+
+# --- Exportación de conmutados y calendarios ---
+st.header("📤 Exportar Datos")
+with st.expander("Tablas de conmutados y calendarios de valores garantizados", expanded=False):
+    col1, col2 = st.columns(2)
+    with col1:
+        que_exportar = st.radio("Exportar", ["Tablas de conmutados", "Calendario de valores garantizados"], key="exp_que")
+    with col2:
+        formato_exp = st.selectbox("Formato", [f for f in FORMATOS if f != 'parquet' or PARQUET_DISPONIBLE],
+                                   format_func=str.upper, key="exp_formato")
+        if not PARQUET_DISPONIBLE:
+            st.caption("Para exportar a Parquet instala pyarrow: pip install pyarrow")
+    crear_grupos = None
+    if que_exportar == "Tablas de conmutados":
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            exp_min = st.number_input("Tasa mínima (%)", min_value=0.0, max_value=20.0, value=1.0, step=0.1, key="exp_tasa_min")
+        with col2:
+            exp_max = st.number_input("Tasa máxima (%)", min_value=0.0, max_value=20.0, value=10.0, step=0.1, key="exp_tasa_max")
+        with col3:
+            exp_paso = st.number_input("Paso (%)", min_value=0.0001, max_value=10.0, value=0.01, step=0.01, format="%.4f", key="exp_paso")
+        n_exp = int(round((exp_max - exp_min) / exp_paso)) + 1
+        if exp_min > exp_max:
+            st.error("La tasa mínima no puede ser mayor que la tasa máxima")
+        elif n_exp > MAX_TASAS_EXPORTAR:
+            st.error(f"Son {n_exp:,} tasas; desde aquí se exportan hasta {MAX_TASAS_EXPORTAR:,}. "
+                     "Para más usa: python exportar.py conmutados ...")
+        else:
+            tasas_exp = np.round(np.arange(n_exp) * exp_paso + exp_min, 10)
+            st.caption(f"{n_exp:,} tasas × {len(tabla_mortalidad)} edades = {n_exp * len(tabla_mortalidad):,} renglones "
+                       f"de la tabla {nombre_tabla}.")
+            parametros_exp = ('conmutados', nombre_tabla, exp_min, exp_max, exp_paso, formato_exp)
+            nombre_exp = f"conmutados_{nombre_tabla}"
+            crear_grupos = lambda: grupos_conmutados(tasas_exp / 100, nombre_tabla)
     else:
-        if st.button("📥 Generar y Descargar Reporte en PDF", key="generar_pdf"):
+        fuente_exp = st.radio("Pólizas", ["Línea de producto actual", "Cartera (CSV)"], horizontal=True, key="exp_fuente")
+        if fuente_exp == "Línea de producto actual":
+            # La póliza actual a cada edad de emisión admisible
+            edades_exp = np.arange(tabla_mortalidad.edad_min, omega)
+            if tipo_seguro == "Vitalicio":
+                plazos_exp = omega - edades_exp
+            else:
+                edades_exp = edades_exp[edades_exp + plazo_seguro <= omega]
+                plazos_exp = np.full(edades_exp.size, plazo_seguro)
+            polizas_exp = pd.DataFrame({'id_poliza': edades_exp, 'tipo_seguro': tipo_seguro, 'edad': edades_exp,
+                                        'suma_asegurada': suma_asegurada, 'plazo_seguro': plazos_exp,
+                                        'plazo_pago': np.minimum(plazo_pago, plazos_exp), 'tipo_recargo': tipo_recargo})
+            st.caption(f"{tipo_seguro} con los parámetros actuales a {edades_exp.size} edades de emisión "
+                       f"({edades_exp[0]}-{edades_exp[-1]}), tasa {tasa_interes}%; id_poliza es la edad de emisión.")
+            parametros_exp = ('linea', tipo_seguro, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, tasa_interes,
+                              nombre_tabla, formato_exp)
+            nombre_exp = f"calendario_{tipo_seguro.split()[0].lower()}"
+            crear_grupos = lambda: grupos_calendario([polizas_exp], tasa_interes / 100, nombre_tabla)
+        else:
+            archivo_exp = st.file_uploader("CSV de pólizas", type="csv", key="exp_polizas",
+                                           help="Columnas tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, "
+                                                "tipo_recargo y opcionalmente id_poliza, como en lote.py")
+            if archivo_exp is not None:
+                parametros_exp = ('cartera', archivo_exp.name, archivo_exp.size, tasa_interes, nombre_tabla, formato_exp)
+                nombre_exp = f"calendario_{archivo_exp.name.rsplit('.', 1)[0]}"
+
+                # El tamaño de la cartera no se conoce hasta valuarla: se corta al pasar el límite
+                def crear_grupos():
+                    archivo_exp.seek(0)
+                    renglones = 0
+                    for grupo in grupos_calendario(leer_polizas(archivo_exp), tasa_interes / 100, nombre_tabla):
+                        renglones += len(grupo['id_poliza'])
+                        if renglones > MAX_RENGLONES_EXPORTAR:
+                            raise ValueError(f"El calendario pasa de {MAX_RENGLONES_EXPORTAR:,} renglones; desde aquí "
+                                             "no se exporta más. Para más usa: python exportar.py calendario ...")
+                        yield grupo
+    if crear_grupos is not None and st.button("Preparar archivo", key="exp_preparar"):
+        # Se libera el archivo anterior antes de armar el nuevo
+        st.session_state.pop('exportacion', None)
+        with st.spinner("Generando el archivo..."):
             try:
-                import tempfile, os
-                pdf = FPDF()
-                pdf.add_page()
-                pdf.set_font("Arial", "B", 16)
-                pdf.cell(0, 10, "REPORTE DE VALORES GARANTIZADOS", 0, 1, "C")
-                pdf.set_font("Arial", "", 10)
-                pdf.cell(0, 5, f"Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M')}", 0, 1, "C")
-                pdf.ln(10)
-
-                # Datos generales
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 8, "DATOS GENERALES", 0, 1)
-                pdf.set_font("Arial", "", 10)
-                pdf.cell(0, 6, f"Tipo de Seguro: {pdf_data.get('tipo_seguro')}", 0, 1)
-                pdf.cell(0, 6, f"Suma Asegurada: ${pdf_data.get('suma_asegurada'):,.2f}", 0, 1)
-                pdf.cell(0, 6, f"Tasa de Interes: {pdf_data.get('tasa_interes')}%", 0, 1)
-                pdf.cell(0, 6, f"Edad del Asegurado: {pdf_data.get('edad')} anos", 0, 1)
-                pdf.cell(0, 6, f"Plazo del Seguro: {pdf_data.get('plazo_seguro')} anos", 0, 1)
-                pdf.cell(0, 6, f"Plazo de Pago: {pdf_data.get('plazo_pago')} anos", 0, 1)
-                pdf.cell(0, 6, f"Tipo de Recargos: {pdf_data.get('tipo_recargo')}", 0, 1)
-                pdf.cell(0, 6, f"Ano de Calculo: {pdf_data.get('t_anos')}", 0, 1)
-                pdf.ln(5)
-
-                # Prima Comercial
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 8, "PRIMA COMERCIAL (5 puntos)", 0, 1)
-                pdf.set_font("Arial", "", 10)
-                pdf.cell(0, 6, f"PNU: ${pdf_data.get('PNU'):.10f}", 0, 1)
-                pdf.cell(0, 6, f"Prima Neta Nivelada: ${pdf_data.get('P'):.10f}", 0, 1)
-                pdf.cell(0, 6, f"Prima Comercial Anual: ${pdf_data.get('B_total'):,.2f}", 0, 1)
-                pdf.ln(5)
-
-                # Valor de Rescate
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 8, f"VALOR DE RESCATE AL ANO {pdf_data.get('t_anos')} (7.5 puntos)", 0, 1)
-                pdf.set_font("Arial", "", 10)
-                pdf.cell(0, 6, f"Edad Actual: {pdf_data.get('edad_actual')} anos", 0, 1)
-                pdf.cell(0, 6, f"Valor de Rescate: ${pdf_data.get('V_rescate_total'):,.2f}", 0, 1)
-                pdf.ln(5)
-
-                # Seguro Saldado
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 8, f"SEGURO SALDADO AL ANO {pdf_data.get('t_anos')} (7.5 puntos)", 0, 1)
-                pdf.set_font("Arial", "", 10)
-                pdf.cell(0, 6, f"Nueva Suma Asegurada: ${pdf_data.get('S_saldado_total'):,.2f}", 0, 1)
-                if pdf_data.get('tipo_seguro') != 'Vitalicio':
-                    pdf.cell(0, 6, f"Vigencia Restante: {pdf_data.get('n_restante')} anos", 0, 1)
-                else:
-                    pdf.cell(0, 6, f"Vigencia: Vitalicia", 0, 1)
-                pdf.ln(5)
-
-                # Seguro Prorrogado
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 8, f"SEGURO PRORROGADO AL ANO {pdf_data.get('t_anos')} (10 puntos)", 0, 1)
-                pdf.set_font("Arial", "", 10)
-                pdf.cell(0, 6, f"Suma Asegurada Mantenida: ${pdf_data.get('suma_asegurada'):,.2f}", 0, 1)
-                pdf.cell(0, 6, f"Prorroga: {pdf_data.get('años')} anos, {pdf_data.get('meses')} meses, {pdf_data.get('dias')} dias", 0, 1)
-
-                if pdf_data.get('tipo_seguro') == "Dotal (Mixto)":
-                    if pdf_data.get('años', 0) >= pdf_data.get('n_restante', 0):
-                        pdf.cell(0, 6, f"Vigencia hasta termino original: {pdf_data.get('n_restante')} anos", 0, 1)
-                        if pdf_data.get('devolucion', 0) > 0:
-                            pdf.cell(0, 6, f"Devolucion si llega con vida: ${pdf_data.get('devolucion'):,.2f}", 0, 1)
-
-                pdf.ln(10)
-
-                # Resumen de puntuación
-                pdf.set_font("Arial", "B", 10)
-                pdf.cell(0, 6, "RESUMEN DE PUNTUACION:", 0, 1)
-                pdf.set_font("Arial", "", 9)
-                pdf.cell(0, 5, "- Prima Comercial: 5 puntos", 0, 1)
-                pdf.cell(0, 5, "- Valor de Rescate: 7.5 puntos", 0, 1)
-                pdf.cell(0, 5, "- Seguro Saldado: 7.5 puntos", 0, 1)
-                pdf.cell(0, 5, "- Seguro Prorrogado: 10 puntos", 0, 1)
-                pdf.ln(3)
-                pdf.set_font("Arial", "I", 8)
-                pdf.cell(0, 5, "Total por tipo de seguro: 30 puntos", 0, 1, "C")
-                pdf.cell(0, 5, "Calificacion maxima (3 tipos): 100 puntos = 30 puntos del parcial", 0, 1, "C")
-
-                # Guardar PDF y entregar descarga
-                nombre_archivo = f"valores_garantizados_{pdf_data.get('tipo_seguro','').lower().replace(' ', '_').replace('(', '').replace(')', '')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                ruta_pdf = os.path.join(tempfile.gettempdir(), nombre_archivo)
-                pdf.output(ruta_pdf)
-                with open(ruta_pdf, 'rb') as f:
-                    pdf_bytes = f.read()
-                st.download_button(label="📥 Descargar PDF", data=pdf_bytes, file_name=nombre_archivo, mime="application/pdf")
-                st.success("✅ PDF generado exitosamente! Haz clic en 'Descargar PDF' arriba.")
-            except Exception as e:
-                st.error(f"❌ Error al generar PDF: {e}")
-                st.info("Intenta instalar fpdf nuevamente: pip install fpdf")
+                salida_exp = io.BytesIO()
+                filas_exp = exportar(crear_grupos(), salida_exp, formato_exp)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                st.session_state['exportacion'] = (parametros_exp, salida_exp.getvalue(), filas_exp)
+    exportacion = st.session_state.get('exportacion')
+    if crear_grupos is not None and exportacion is not None and exportacion[0] == parametros_exp:
+        st.download_button(f"📥 Descargar {formato_exp.upper()} ({exportacion[2]:,} renglones)", exportacion[1],
+                           file_name=f"{nombre_exp}.{formato_exp}", mime=TIPOS_MIME[formato_exp], key="exp_descargar")
 
 # Footer y demás (sin cambios funcionales)
 st.markdown("---")
@@ -455,7 +459,7 @@ with st.expander("📖 Instrucciones de Uso"):
     st.markdown("""
     ### Cómo usar esta calculadora:
     1. **Seleccione el tipo de seguro** en el panel lateral.
-    2. **Configure los parámetros** y haga clic en 'CALCULAR'.
+    2. **Configure los parámetros**; los resultados se actualizan al momento.
     3. Luego usa 'Generar y Descargar Reporte en PDF'.
     """)
 
@@ -471,7 +475,9 @@ with st.expander("🔢 Información sobre Valores Conmutados"):
     - **C_x** = d_x × (1+i)^(-(x+1))
     - **M_x** = Σ C_y (desde y=x hasta y=100)
     """)
-with st.expander("📊 Ver Tabla de Mortalidad (edades 12-50)"):
-    df_muestra = pd.DataFrame(data)
-    df_muestra = df_muestra[df_muestra['x'] <= 50]
-    st.dataframe(df_muestra, use_container_width=True)
\ No newline at end of file
+with st.expander("📊 Ver Tabla de Mortalidad y Conmutados"):
+    df_tabla = pd.DataFrame(next(grupos_conmutados(tasa_interes / 100, nombre_tabla))).drop(columns='tasa')
+    st.caption(f"Tabla {nombre_tabla} completa, conmutados a la tasa de {tasa_interes}%.")
+    st.dataframe(df_tabla, use_container_width=True, hide_index=True)
+    st.download_button("📥 Descargar CSV", df_tabla.to_csv(index=False).encode('utf-8'),
+                       file_name=f"conmutados_{nombre_tabla}_{tasa_interes:g}.csv", mime="text/csv", key="descargar_tabla")
\ No newline at end of file
@@ -0,0 +1,129 @@
+# Valuación con tasas de interés estocásticas (Monte Carlo). Se generan N trayectorias
+# de tasas anuales a partir de la edad de emisión y, con el descuento acumulado de cada
+# una, se arma una tabla de conmutados por escenario (CommutationTable.desde_descuento,
+# columnas escenarios × edades). Sobre ella valuar_escenarios da la PNU, la prima
+# comercial y el valor de rescate al año t de todos los escenarios a la vez.
+#
+# Los escenarios se procesan por bloques, así que la memoria de trabajo depende del
+# bloque (del orden de bloque × edades × 8 bytes por columna) y no del total; de cada
+# escenario solo se guardan los tres resultados. Los bloques pueden repartirse entre
+# varios procesos.
+#
+# Reproducibilidad: cada grupo de ESCENARIOS_POR_SEMILLA escenarios usa su propio
+# generador, derivado de (semilla, número de grupo) con SeedSequence. Por eso el
+# resultado para una semilla no depende del tamaño de bloque ni del número de procesos.
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from calculos import TABLA_MORTALIDAD, CommutationTable, valuar_escenarios
+from tablas import registro
+
+ESCENARIOS_POR_SEMILLA = 1024
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+CAMPOS_ESTOCASTICOS = ('PNU', 'B_total', 'V_rescate_total')
+# Las tasas simuladas se acotan por abajo para que 1 + r sea positivo (Vasicek admite negativas)
+TASA_MINIMA = -0.99
+
+
+# Modelo de tasas anuales con reversión a la media, discretizado de forma exacta a
+# pasos de un año:
+#   vasicek:   r' = b + (r - b) e^{-a} + σ √((1 - e^{-2a}) / 2a) ε
+#   lognormal: el mismo proceso sobre ln r (tipo Black-Karasinski), siempre positivo
+# Con reversión 0 ambos quedan como caminata aleatoria con desviación σ por año.
+class ModeloTasas:
+    MODELOS = ('vasicek', 'lognormal')
+
+    def __init__(self, modelo='vasicek', tasa_inicial=0.04, tasa_media=None, reversion=0.1, volatilidad=None):
+        if modelo not in self.MODELOS:
+            raise ValueError(f"Modelo de tasas desconocido: {modelo!r} (disponibles: {', '.join(self.MODELOS)})")
+        if reversion < 0:
+            raise ValueError("La velocidad de reversión no puede ser negativa")
+        if modelo == 'lognormal' and tasa_inicial <= 0:
+            raise ValueError("El modelo lognormal necesita una tasa inicial positiva")
+        self.modelo = modelo
+        self.tasa_inicial = tasa_inicial
+        self.tasa_media = tasa_inicial if tasa_media is None else tasa_media
+        if modelo == 'lognormal' and self.tasa_media <= 0:
+            raise ValueError("El modelo lognormal necesita una tasa media positiva")
+        self.reversion = reversion
+        # Por omisión: 1 punto porcentual por año en Vasicek, 10% de la tasa en lognormal
+        self.volatilidad = (0.01 if modelo == 'vasicek' else 0.1) if volatilidad is None else volatilidad
+        if self.volatilidad < 0:
+            raise ValueError("La volatilidad no puede ser negativa")
+
+    # Trayectorias (escenarios × pasos); la primera columna es la tasa del primer año
+    def simular(self, rng, escenarios, pasos):
+        a = self.reversion
+        persistencia = np.exp(-a)
+        escala = self.volatilidad * (np.sqrt((1 - np.exp(-2 * a)) / (2 * a)) if a > 0 else 1.0)
+        log = self.modelo == 'lognormal'
+        inicial, media = (np.log(self.tasa_inicial), np.log(self.tasa_media)) if log else (self.tasa_inicial, self.tasa_media)
+        choques = rng.standard_normal((escenarios, pasos - 1))
+        r = np.empty((escenarios, pasos))
+        r[:, 0] = inicial
+        for k in range(1, pasos):
+            r[:, k] = media + (r[:, k - 1] - media) * persistencia + escala * choques[:, k - 1]
+        return np.exp(r) if log else np.maximum(r, TASA_MINIMA)
+
+
+def _generador(semilla, grupo):
+    return np.random.default_rng(np.random.SeedSequence(semilla, spawn_key=(grupo,)))
+
+
+# Valúa los escenarios de los grupos [grupo_inicio, grupo_fin) en una sola pasada
+# vectorizada. Es la unidad de trabajo de cada proceso.
+def _valuar_grupos(poliza, modelo, semilla, grupo_inicio, grupo_fin, escenarios, tabla):
+    tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos = poliza
+    mortalidad = registro.obtener(tabla)
+    pos = edad - mortalidad.edad_min
+    if not 0 <= pos < len(mortalidad) - 1:
+        raise ValueError(f"La edad de emisión debe estar entre {mortalidad.edad_min} y {mortalidad.edad_max - 1}")
+    # Tabla desde la edad de emisión: el descuento de cada escenario parte de ahí
+    desde_emision = {campo: mortalidad[campo][pos:] for campo in ('x', 'lx', 'dx')}
+    pasos = len(desde_emision['x'])
+    tasas = np.concatenate([
+        modelo.simular(_generador(semilla, g), min(ESCENARIOS_POR_SEMILLA, escenarios - g * ESCENARIOS_POR_SEMILLA), pasos)
+        for g in range(grupo_inicio, grupo_fin)])
+    descuento = np.ones((tasas.shape[0], pasos + 1))
+    np.exp(-np.cumsum(np.log1p(tasas), axis=1), out=descuento[:, 1:])
+    conmutados = CommutationTable.desde_descuento(descuento, desde_emision)
+    resultado = valuar_escenarios(conmutados, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos)
+    return {campo: resultado[campo][:, 0] for campo in CAMPOS_ESTOCASTICOS}
+
+
+def resumir(valores, percentiles=PERCENTILES):
+    resumen = {'media': float(np.mean(valores)), 'desviacion': float(np.std(valores, ddof=1)) if valores.size > 1 else 0.0}
+    resumen.update({f"p{p}": float(v) for p, v in zip(percentiles, np.percentile(valores, percentiles))})
+    return resumen
+
+
+# Distribución de PNU, prima comercial y valor de rescate al año t de una póliza bajo
+# tasas estocásticas. Devuelve {'escenarios': N, campo: {'media', 'desviacion', 'p1',
+# ..., 'p99'}} y, con devolver_escenarios=True, también los valores de cada escenario
+# en {'valores': {campo: arreglo}}.
+def valuar_estocastico(tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos,
+                       modelo=None, escenarios=10_000, semilla=0, tabla=TABLA_MORTALIDAD, bloque=16_384,
+                       procesos=1, devolver_escenarios=False):
+    if escenarios < 1:
+        raise ValueError("Se necesita al menos un escenario")
+    if bloque < 1:
+        raise ValueError("El bloque debe tener al menos un escenario")
+    modelo = modelo or ModeloTasas()
+    poliza = (tipo_seguro, int(edad), float(suma_asegurada), int(plazo_seguro), int(plazo_pago), tipo_recargo, int(t_anos))
+    grupos = -(-escenarios // ESCENARIOS_POR_SEMILLA)
+    grupos_por_bloque = max(1, bloque // ESCENARIOS_POR_SEMILLA)
+    tareas = [(poliza, modelo, semilla, g, min(g + grupos_por_bloque, grupos), escenarios, tabla)
+              for g in range(0, grupos, grupos_por_bloque)]
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1 or len(tareas) == 1:
+        partes = [_valuar_grupos(*tarea) for tarea in tareas]
+    else:
+        with ProcessPoolExecutor(min(procesos, len(tareas))) as pool:
+            partes = list(pool.map(_valuar_grupos, *zip(*tareas)))
+    valores = {campo: np.concatenate([parte[campo] for parte in partes]) for campo in CAMPOS_ESTOCASTICOS}
+    resultado = {'escenarios': escenarios, **{campo: resumir(valores[campo]) for campo in CAMPOS_ESTOCASTICOS}}
+    if devolver_escenarios:
+        resultado['valores'] = valores
+    return resultado
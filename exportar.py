@@ -0,0 +1,308 @@
+# Exportación masiva de tablas de conmutados y calendarios de valores garantizados a
+# CSV o Parquet. Los datos se generan y se escriben por grupos de renglones (un grupo
+# de filas de Parquet por grupo), así que la memoria depende del tamaño de grupo y no
+# del total de renglones:
+#
+#   python exportar.py conmutados conmutados.parquet --rango 0.5 10 0.01
+#   python exportar.py calendario polizas.csv calendario.csv --tasa 4 --compacto
+#
+# conmutados: una fila por tasa y edad (tasa en %, x, lx, dx, Dx, Nx, Cx, Mx).
+# calendario: una fila por póliza y año de vigencia (id_poliza, t, las primas de
+# CAMPOS_POR_POLIZA y los campos de CAMPOS_CALENDARIO); las pólizas se leen del CSV
+# por bloques, como en lote.py, y si no hay columna id_poliza se usa el número de renglón.
+#
+# Parquet necesita pyarrow, que es opcional; CSV funciona también sin él y da los
+# mismos bytes (ver _EscritorCSV).
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+
+from calculos import TABLA_MORTALIDAD, CommutationTable, iterar_calendario, obtener_tabla_conmutada
+from lote import COLUMNAS_POLIZA, leer_bloques, leer_encabezado
+from tablas import registro
+
+FORMATOS = ('csv', 'parquet')
+PARQUET_DISPONIBLE = importlib.util.find_spec('pyarrow') is not None
+FILAS_POR_GRUPO = 250_000
+CAMPOS_POR_POLIZA = ('PNU', 'P', 'B_total')
+CAMPOS_CALENDARIO = ('edad_actual', 'A_actual', 'V_rescate_total', 'S_saldado_total', 'n_restante', 'años', 'meses', 'dias',
+                     'devolucion')
+# El calendario no depende del año de cálculo
+COLUMNAS_CALENDARIO = tuple(c for c in COLUMNAS_POLIZA if c != 't_anos')
+
+
+# Tablas de conmutados a varias tasas (en decimal). Cada grupo trae tantas tasas
+# completas como quepan en filas_por_grupo renglones.
+def grupos_conmutados(tasas, tabla=TABLA_MORTALIDAD, filas_por_grupo=FILAS_POR_GRUPO):
+    tasas = np.atleast_1d(np.asarray(tasas, dtype=np.float64))
+    if tasas.size == 0:
+        raise ValueError("Se necesita al menos una tasa")
+    mortalidad = registro.obtener(tabla)
+    edades = len(mortalidad)
+    por_grupo = max(1, filas_por_grupo // edades)
+    for inicio in range(0, tasas.size, por_grupo):
+        bloque = tasas[inicio:inicio + por_grupo]
+        conmutados = CommutationTable.desde_tasa(bloque, mortalidad)
+        grupo = {
+            'tasa': np.repeat(np.round(bloque * 100, 10), edades),
+            'x': np.tile(conmutados.x, bloque.size),
+            'lx': np.tile(np.asarray(mortalidad['lx'], dtype=np.float64), bloque.size),
+            'dx': np.tile(np.asarray(mortalidad['dx'], dtype=np.float64), bloque.size),
+        }
+        grupo.update({columna: getattr(conmutados, columna).ravel() for columna in CommutationTable.COLUMNAS})
+        yield grupo
+
+
+# Calendario en formato largo de un bloque de pólizas (DataFrame): solo los años de
+# vigencia de cada póliza (t menor que su plazo). Se arma con iterar_calendario, así que
+# las matrices (pólizas × duraciones) solo existen un bloque de duraciones a la vez; los
+# renglones vigentes de cada bloque se juntan y se ordenan por póliza y año.
+def _calendario_largo(conmutados, polizas, inicio, compacto):
+    faltantes = [c for c in COLUMNAS_CALENDARIO if c not in polizas.columns]
+    if faltantes:
+        raise ValueError(f"Faltan las columnas {faltantes}")
+    if 'id_poliza' not in polizas.columns:
+        ids = np.arange(inicio, inicio + len(polizas))
+    elif polizas['id_poliza'].dtype.kind in 'iu':
+        ids = polizas['id_poliza'].to_numpy()
+    else:
+        # Como arreglo de texto (y no de objetos) el tipo no depende de los valores,
+        # así que un bloque vacío también sale como texto; un id faltante queda vacío
+        ids = polizas['id_poliza'].fillna('').to_numpy(dtype=str)
+    partes = {campo: [] for campo in ('poliza', 't', *CAMPOS_CALENDARIO)}
+    for bloque in iterar_calendario(conmutados, *(polizas[c].to_numpy() for c in COLUMNAS_CALENDARIO), compacto=compacto):
+        vigente = bloque['n_restante'] > 0
+        poliza, duracion = np.nonzero(vigente)
+        partes['poliza'].append(poliza)
+        partes['t'].append(bloque['t'][duracion])
+        for campo in CAMPOS_CALENDARIO:
+            partes[campo].append(bloque[campo][vigente])
+    largo = {campo: np.concatenate(valores) for campo, valores in partes.items()}
+    # Cada bloque viene ordenado por póliza; el orden estable conserva los años crecientes
+    orden = np.argsort(largo['poliza'], kind='stable')
+    poliza = largo['poliza'][orden]
+    grupo = {'id_poliza': ids[poliza], 't': largo['t'][orden]}
+    grupo.update({campo: bloque[campo][poliza] for campo in CAMPOS_POR_POLIZA})
+    grupo.update({campo: largo[campo][orden] for campo in CAMPOS_CALENDARIO})
+    return grupo
+
+
+# Calendarios de un iterable de DataFrames de pólizas, un grupo por DataFrame
+def grupos_calendario(bloques_polizas, i, tabla=TABLA_MORTALIDAD, compacto=False):
+    conmutados = obtener_tabla_conmutada(i, tabla)
+    inicio = 0
+    for polizas in bloques_polizas:
+        yield _calendario_largo(conmutados, polizas, inicio, compacto)
+        inicio += len(polizas)
+
+
+# Lee el CSV de pólizas (ruta o archivo binario abierto) en bloques de tamano_bloque
+# renglones. id_poliza se lee siempre como texto: si cada bloque infiriera su tipo, un
+# bloque con ids numéricos y otro con "X25" darían esquemas distintos. Un CSV con solo
+# el encabezado da un bloque vacío, para que la salida tenga encabezado y esquema.
+def leer_polizas(entrada, tamano_bloque=10_000):
+    import io
+
+    import pandas as pd
+    archivo = open(entrada, 'rb') if isinstance(entrada, str) else entrada
+    try:
+        encabezado = leer_encabezado(archivo)
+        vacio = True
+        for lineas in leer_bloques(archivo, tamano_bloque):
+            vacio = False
+            yield pd.read_csv(io.BytesIO(encabezado + lineas), dtype={'id_poliza': str})
+        if vacio:
+            yield pd.read_csv(io.BytesIO(encabezado), dtype={'id_poliza': str})
+    finally:
+        if isinstance(entrada, str):
+            archivo.close()
+
+
+# Texto de un flotante como lo escribe pyarrow: los dígitos más cortos que reproducen
+# el valor (del float32 si es float32), en notación posicional si el exponente decimal
+# está entre -6 y 9 (sin ".0" en los enteros) y si no en científica (1e+10, 2.5e-7)
+def _texto_flotante(valor):
+    if not np.isfinite(valor):
+        return str(valor)
+    if valor == 0:
+        return '-0' if np.signbit(valor) else '0'
+    mantisa, exponente = np.format_float_scientific(valor, unique=True, trim='-', exp_digits=1).split('e')
+    if -7 < int(exponente) < 10:
+        return np.format_float_positional(valor, unique=True, trim='-')
+    return f"{mantisa}e{int(exponente):+d}"
+
+
+def _texto_columna(valores):
+    valores = np.asarray(valores)
+    if valores.dtype.kind == 'f':
+        texto = valores.astype(str)
+        # Caso común, en lote: NumPy ya escribe en posicional y basta quitar el ".0"
+        # de los enteros; lo demás (científica, fuera de rango, no finitos) va uno a uno
+        comun = (np.char.find(texto, 'e') < 0) & (np.abs(valores) < 1e10)
+        enteros = comun & np.char.endswith(texto, '.0')
+        texto = texto.astype(object)
+        if enteros.any():
+            texto[enteros] = np.char.replace(texto[enteros].astype(str), '.0', '')
+        texto[~comun] = [_texto_flotante(v) for v in valores[~comun]]
+        return texto
+    if valores.dtype.kind in 'iu':
+        return valores.astype(str).astype(object)
+    if valores.dtype.kind == 'b':
+        return np.where(valores, 'true', 'false').astype(object)
+    # Texto: siempre entre comillas (con las comillas internas duplicadas) y vacío si falta
+    import pandas as pd
+    faltante = pd.isna(valores)
+    texto = np.empty(len(valores), dtype=object)
+    texto[faltante] = ''
+    texto[~faltante] = ['"' + str(v).replace('"', '""') + '"' for v in valores[~faltante]]
+    return texto
+
+
+# Con pyarrow el CSV se escribe con su escritor nativo, unas diez veces más rápido que
+# DataFrame.to_csv. Sin pyarrow, _texto_columna reproduce su formato para que el archivo
+# sea el mismo byte por byte: los textos siempre van entre comillas y los flotantes con
+# los dígitos más cortos (250000, no 250000.0).
+class _EscritorCSV:
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.escritor = None
+        self.primero = True
+
+    def escribir(self, grupo):
+        if self.primero:
+            # El encabezado va sin comillas
+            self.archivo.write((','.join(grupo) + '\n').encode('utf-8'))
+            self.primero = False
+        if PARQUET_DISPONIBLE:
+            import pyarrow
+            import pyarrow.csv
+            tabla = pyarrow.table(grupo)
+            if self.escritor is None:
+                opciones = pyarrow.csv.WriteOptions(include_header=False, quoting_style='needed')
+                self.escritor = pyarrow.csv.CSVWriter(self.archivo, tabla.schema, write_options=opciones)
+            self.escritor.write_table(tabla)
+        else:
+            columnas = [_texto_columna(valores) for valores in grupo.values()]
+            renglones = columnas[0]
+            for columna in columnas[1:]:
+                renglones = renglones + ',' + columna
+            self.archivo.write(''.join(renglon + '\n' for renglon in renglones).encode('utf-8'))
+
+    def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+
+
+class _EscritorParquet:
+    def __init__(self, archivo):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        self.archivo = archivo
+        self.escritor = None
+
+    def escribir(self, grupo):
+        tabla = self._pa.table(grupo)
+        if self.escritor is None:
+            self.escritor = self._pq.ParquetWriter(self.archivo, tabla.schema)
+        self.escritor.write_table(tabla)
+
+    def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+
+
+# Escribe los grupos en destino (ruta o archivo binario abierto) conforme se generan.
+# Una ruta se escribe primero en destino.tmp y se renombra al terminar, así que una
+# exportación que falla no deja un archivo truncado. Devuelve el número de renglones escritos.
+def exportar(grupos, destino, formato='csv'):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato!r} (disponibles: {', '.join(FORMATOS)})")
+    if formato == 'parquet' and not PARQUET_DISPONIBLE:
+        raise ValueError("Para exportar a Parquet instala pyarrow: pip install pyarrow")
+    if isinstance(destino, str):
+        temporal = destino + '.tmp'
+        try:
+            with open(temporal, 'wb') as archivo:
+                filas = exportar(grupos, archivo, formato)
+            os.replace(temporal, destino)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        return filas
+    escritor = _EscritorParquet(destino) if formato == 'parquet' else _EscritorCSV(destino)
+    filas = 0
+    try:
+        for grupo in grupos:
+            n = len(next(iter(grupo.values())))
+            if n or filas == 0:
+                escritor.escribir(grupo)
+            filas += n
+    finally:
+        # También si falla, para que el escritor no quede abierto sobre un archivo cerrado
+        escritor.cerrar()
+    return filas
+
+
+def _formato(ruta, formato):
+    if formato:
+        return formato
+    return 'parquet' if ruta.lower().endswith(('.parquet', '.pq')) else 'csv'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exportación de conmutados y calendarios de valores garantizados")
+    subparsers = parser.add_subparsers(dest='que', required=True)
+    p_conmutados = subparsers.add_parser('conmutados', help="Tablas de conmutados a varias tasas")
+    p_conmutados.add_argument('salida', help="Archivo .csv o .parquet")
+    tasas = p_conmutados.add_mutually_exclusive_group(required=True)
+    tasas.add_argument('--tasas', type=float, nargs='+', help="Tasas en %% (ej. 3 4 5.5)")
+    tasas.add_argument('--rango', type=float, nargs=3, metavar=('MIN', 'MAX', 'PASO'), help="Tasas en %% de MIN a MAX cada PASO")
+    p_calendario = subparsers.add_parser('calendario', help="Calendarios de valores garantizados de un CSV de pólizas")
+    p_calendario.add_argument('entrada', help="CSV de pólizas con las columnas " + ", ".join(COLUMNAS_CALENDARIO)
+                                             + " (y opcionalmente id_poliza)")
+    p_calendario.add_argument('salida', help="Archivo .csv o .parquet")
+    p_calendario.add_argument('--tasa', type=float, required=True, help="Tasa de interés técnico en %% (ej. 4)")
+    p_calendario.add_argument('--bloque', type=int, default=10_000, help="Pólizas por grupo de renglones")
+    p_calendario.add_argument('--compacto', action='store_true', help="Valores en float32 (ver COTA_ERROR_COMPACTO)")
+    for p in (p_conmutados, p_calendario):
+        p.add_argument('--tabla', default=TABLA_MORTALIDAD, help="Tabla de mortalidad registrada")
+        p.add_argument('--formato', choices=FORMATOS, help="Por omisión, según la extensión de la salida")
+    args = parser.parse_args(argv)
+
+    formato = _formato(args.salida, args.formato)
+    if args.tabla not in registro:
+        parser.error(f"tabla de mortalidad desconocida: {args.tabla!r} (disponibles: {', '.join(registro.nombres())})")
+    if formato == 'parquet' and not PARQUET_DISPONIBLE:
+        parser.error("para exportar a Parquet instala pyarrow: pip install pyarrow")
+    if args.que == 'conmutados':
+        if args.rango:
+            minima, maxima, paso = args.rango
+            if paso <= 0 or maxima < minima:
+                parser.error("el rango debe cumplir MIN <= MAX y PASO > 0")
+            lista = np.round(np.arange(round((maxima - minima) / paso) + 1) * paso + minima, 10)
+        else:
+            lista = np.asarray(args.tasas)
+        if np.any(lista < 0):
+            parser.error("las tasas no pueden ser negativas")
+        grupos = grupos_conmutados(lista / 100, args.tabla)
+    else:
+        if not 0 < args.tasa <= 10:
+            parser.error("la tasa debe ser mayor a 0% y menor o igual a 10%")
+        if args.bloque < 1:
+            parser.error("el bloque debe tener al menos una póliza")
+        grupos = grupos_calendario(leer_polizas(args.entrada, args.bloque), args.tasa / 100, args.tabla, args.compacto)
+
+    inicio = time.perf_counter()
+    filas = exportar(grupos, args.salida, formato)
+    segundos = time.perf_counter() - inicio
+    print(f"{filas:,} renglones escritos en {segundos:.2f} s ({filas / max(segundos, 1e-9):,.0f} renglones/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# Cálculo de una póliza como grafo de dependencias. Cada nodo guarda su último
+# resultado junto con la clave de las entradas de las que depende (las suyas y la
+# versión de sus nodos previos, que cambia cada vez que se recalculan), así que al
+# cambiar una entrada solo se recalculan los nodos que la usan y los que dependen de
+# ellos. En cada evaluación un nodo se resuelve una sola vez aunque varios lo usen.
+#
+#   conmutados (i, tabla) → primas (PNU, P, B) → rescate (t) → saldado / prorrogado
+#                         → calendario
+#
+# La suma asegurada no entra al grafo: todos los nodos trabajan por $1 y valores_poliza
+# y calendario_poliza multiplican al final, de modo que cambiarla no recalcula nada.
+# Los nodos usan las mismas funciones escalares y el mismo orden de operaciones que
+# tenía la interfaz.
+from calculos import (
+    calc_anualidad_anticipada_temporal,
+    calc_anualidad_anticipada_vitalicia,
+    calc_PNU_dotal,
+    calc_PNU_temporal,
+    calc_PNU_vitalicia,
+    calc_prima_comercial,
+    calc_recargos,
+    calc_seguro_prorrogado,
+    calc_seguro_saldado,
+    calc_valor_rescate,
+    get_valor,
+    obtener_tabla_conmutada,
+    valuar_calendario,
+)
+from medicion import contar, etapa
+
+
+class GrafoCalculo:
+    def __init__(self):
+        self._nodos = {}
+        self._memo = {}
+        self._version = 0
+        self.recalculados = []
+
+    # Registra funcion(*resultados_previos, **entradas) como el nodo nombre
+    def nodo(self, nombre, entradas=(), previos=()):
+        def registrar(funcion):
+            faltantes = [previo for previo in previos if previo not in self._nodos]
+            if faltantes:
+                raise ValueError(f"El nodo {nombre!r} depende de nodos no registrados: {faltantes}")
+            self._nodos[nombre] = (funcion, tuple(entradas), tuple(previos))
+            return funcion
+        return registrar
+
+    # resueltos guarda los nodos ya resueltos en esta evaluación
+    def _evaluar(self, nombre, valores, resueltos):
+        if nombre in resueltos:
+            return resueltos[nombre]
+        funcion, entradas, previos = self._nodos[nombre]
+        resultados_previos = [self._evaluar(previo, valores, resueltos) for previo in previos]
+        clave = (tuple(valores[e] for e in entradas), tuple(self._memo[previo][2] for previo in previos))
+        memo = self._memo.get(nombre)
+        if memo is not None and memo[0] == clave:
+            contar('nodos_reutilizados')
+            resultado = memo[1]
+        else:
+            contar('nodos_recalculados')
+            with etapa(nombre):
+                resultado = funcion(*resultados_previos, **{e: valores[e] for e in entradas})
+            self._version += 1
+            self._memo[nombre] = (clave, resultado, self._version)
+            self.recalculados.append(nombre)
+        resueltos[nombre] = resultado
+        return resultado
+
+    # Evalúa los nodos pedidos con el diccionario de entradas; devuelve {nombre: resultado}.
+    # recalculados queda con los nodos que sí se calcularon en esta llamada.
+    def evaluar(self, nombres, valores):
+        self.recalculados = []
+        resueltos = {}
+        return {nombre: self._evaluar(nombre, valores, resueltos) for nombre in nombres}
+
+    def limpiar(self):
+        self._memo.clear()
+
+
+def _primas(conmutados, i, tipo_seguro, edad, plazo_seguro, plazo_pago, tipo_recargo):
+    alpha, gamma, beta, k = calc_recargos(tipo_seguro, tipo_recargo, plazo_pago)
+    if tipo_seguro == "Vitalicio":
+        PNU = calc_PNU_vitalicia(conmutados, edad, i)
+        a_pago = calc_anualidad_anticipada_vitalicia(conmutados, edad, i)
+        a_seguro = a_pago
+        P = PNU / a_pago if a_pago != 0 else 0
+    else:
+        calc_PNU = calc_PNU_temporal if tipo_seguro == "Temporal" else calc_PNU_dotal
+        PNU = calc_PNU(conmutados, edad, plazo_seguro, i)
+        a_pago = calc_anualidad_anticipada_temporal(conmutados, edad, plazo_pago, i)
+        a_seguro = calc_anualidad_anticipada_temporal(conmutados, edad, plazo_seguro, i)
+        Nx = get_valor(conmutados, edad, 'Nx')
+        Nx_p = get_valor(conmutados, edad + plazo_pago, 'Nx')
+        denominador = Nx - Nx_p
+        P = PNU / (denominador / get_valor(conmutados, edad, 'Dx')) if denominador != 0 else 0
+    B = calc_prima_comercial(P, a_pago, a_seguro, alpha, gamma, beta, k)
+    return {'PNU': PNU, 'P': P, 'B': B, 'a_pago': a_pago, 'a_seguro': a_seguro, 'k': k}
+
+
+# Valor de rescate por $1 al año t. vigente es False cuando t ya alcanzó el plazo.
+def _rescate(conmutados, primas, i, tipo_seguro, edad, plazo_seguro, plazo_pago, t_anos):
+    edad_actual = edad + t_anos
+    if t_anos >= plazo_seguro:
+        return {'vigente': False, 'edad_actual': edad_actual, 'A_actual': 0, 'a_restante': 0, 'V_rescate': 0}
+    n_restante = plazo_seguro - t_anos
+    if tipo_seguro == "Vitalicio":
+        A_actual = calc_PNU_vitalicia(conmutados, edad_actual, i)
+    elif tipo_seguro == "Temporal":
+        A_actual = calc_PNU_temporal(conmutados, edad_actual, n_restante, i)
+    else:
+        A_actual = calc_PNU_dotal(conmutados, edad_actual, n_restante, i)
+    a_restante = calc_anualidad_anticipada_temporal(conmutados, edad_actual, max(plazo_pago - t_anos, 0), i) if t_anos < plazo_pago else 0
+    V_rescate = calc_valor_rescate(A_actual, primas['P'], a_restante, primas['k'] * primas['B'], primas['a_pago'])
+    return {'vigente': True, 'edad_actual': edad_actual, 'A_actual': A_actual, 'a_restante': a_restante, 'V_rescate': V_rescate}
+
+
+# La PNU a la edad alcanzada es la misma A_{x+t} del rescate (mismo plazo restante)
+def _saldado(conmutados, rescate, tipo_seguro, plazo_seguro, t_anos):
+    if not rescate['vigente']:
+        return {'A_nueva': 0, 'S_saldado': 0, 'n_restante': 0}
+    n_restante = plazo_seguro - t_anos if tipo_seguro != "Vitalicio" else conmutados.edad_max - rescate['edad_actual']
+    return {'A_nueva': rescate['A_actual'], 'S_saldado': calc_seguro_saldado(rescate['V_rescate'], rescate['A_actual']),
+            'n_restante': n_restante}
+
+
+# Prórroga por $1. En el Dotal que alcanza el término original se guarda también
+# D_{x+n} / D_{x+t} para calcular la devolución con la suma asegurada.
+def _prorrogado(conmutados, rescate, tipo_seguro, edad, plazo_seguro, t_anos):
+    if not rescate['vigente']:
+        return {'años': 0, 'meses': 0, 'dias': 0, 'hasta_termino': False, 'factor_devolucion': None}
+    n_restante = plazo_seguro - t_anos if tipo_seguro != "Vitalicio" else None
+    años, meses, dias = calc_seguro_prorrogado(conmutados, rescate['V_rescate'], 1, rescate['edad_actual'], tipo_seguro, n_restante)
+    hasta_termino = tipo_seguro == "Dotal (Mixto)" and años >= (n_restante or 0)
+    factor_devolucion = None
+    if hasta_termino:
+        Dx_actual = get_valor(conmutados, rescate['edad_actual'], 'Dx')
+        Dx_final = get_valor(conmutados, edad + plazo_seguro, 'Dx')
+        factor_devolucion = Dx_final / Dx_actual if Dx_actual != 0 else None
+    return {'años': años, 'meses': meses, 'dias': dias, 'hasta_termino': hasta_termino, 'factor_devolucion': factor_devolucion}
+
+
+ENTRADAS_POLIZA = ('i', 'tabla', 'tipo_seguro', 'edad', 'suma_asegurada', 'plazo_seguro', 'plazo_pago', 'tipo_recargo', 't_anos')
+NODOS_POLIZA = ('primas', 'rescate', 'saldado', 'prorrogado')
+# Campos de valuar_calendario proporcionales a la suma asegurada
+CAMPOS_MONTO = ('B_total', 'V_rescate_total', 'S_saldado_total', 'devolucion')
+
+
+def crear_grafo_poliza():
+    grafo = GrafoCalculo()
+    grafo.nodo('conmutados', entradas=('i', 'tabla'))(lambda i, tabla: obtener_tabla_conmutada(i, tabla))
+    grafo.nodo('primas', ('i', 'tipo_seguro', 'edad', 'plazo_seguro', 'plazo_pago', 'tipo_recargo'), ('conmutados',))(_primas)
+    grafo.nodo('rescate', ('i', 'tipo_seguro', 'edad', 'plazo_seguro', 'plazo_pago', 't_anos'), ('conmutados', 'primas'))(_rescate)
+    grafo.nodo('saldado', ('tipo_seguro', 'plazo_seguro', 't_anos'), ('conmutados', 'rescate'))(_saldado)
+    grafo.nodo('prorrogado', ('tipo_seguro', 'edad', 'plazo_seguro', 't_anos'), ('conmutados', 'rescate'))(_prorrogado)
+    grafo.nodo('calendario', ('tipo_seguro', 'edad', 'plazo_seguro', 'plazo_pago', 'tipo_recargo'), ('conmutados',))(
+        lambda conmutados, **entradas: valuar_calendario(conmutados, suma_asegurada=1.0, **entradas))
+    return grafo
+
+
+# Evalúa la póliza en el grafo y arma los valores con la suma asegurada, con las
+# mismas claves que pdf_data (más los intermedios que muestra la interfaz)
+def valores_poliza(grafo, entradas):
+    r = grafo.evaluar(NODOS_POLIZA, entradas)
+    primas, rescate, saldado, prorrogado = (r[nombre] for nombre in NODOS_POLIZA)
+    SA = entradas['suma_asegurada']
+    V_rescate_total = rescate['V_rescate'] * SA
+    devolucion = 0
+    if prorrogado['hasta_termino']:
+        factor = prorrogado['factor_devolucion']
+        devolucion = V_rescate_total - (SA * factor) if factor is not None else 0
+    return {
+        'PNU': primas['PNU'],
+        'P': primas['P'],
+        'B_total': primas['B'] * SA,
+        'vigente': rescate['vigente'],
+        'edad_actual': rescate['edad_actual'],
+        'A_actual': rescate['A_actual'],
+        'a_restante': rescate['a_restante'],
+        'V_rescate_total': V_rescate_total,
+        'A_nueva': saldado['A_nueva'],
+        'S_saldado_total': saldado['S_saldado'] * SA,
+        'n_restante': saldado['n_restante'],
+        'años': prorrogado['años'],
+        'meses': prorrogado['meses'],
+        'dias': prorrogado['dias'],
+        'hasta_termino': prorrogado['hasta_termino'],
+        'devolucion': devolucion,
+    }
+
+
+# Calendario de valores garantizados de la póliza (como valuar_calendario, con una sola
+# póliza): el grafo lo guarda por $1 y aquí se multiplican los montos por la suma asegurada
+def calendario_poliza(grafo, entradas):
+    calendario = dict(grafo.evaluar(['calendario'], entradas)['calendario'])
+    SA = entradas['suma_asegurada']
+    for campo in CAMPOS_MONTO:
+        calendario[campo] = calendario[campo] * SA
+    return calendario
@@ -0,0 +1,314 @@
+# Cálculo inverso: dado un valor objetivo (prima comercial anual, valor de rescate o
+# suma asegurada saldada al año t) encuentra la suma asegurada, la tasa de interés
+# técnico o la edad de emisión que lo reproduce, para muchas pólizas a la vez.
+#
+#   suma asegurada: los tres valores son proporcionales a ella, así que un paso de
+#                   Newton desde cero (con el valor por $1 como derivada) es exacto
+#   tasa:           secante con intervalo (regla falsa de Illinois). El rescate y el
+#                   saldado no siempre son monótonos en la tasa, así que primero se
+#                   evalúa la cartera en una malla de tasas con las tablas de la caché
+#                   y cada póliza toma el primer tramo con cambio de signo (la menor
+#                   tasa que da el objetivo). Dos raíces dentro de una celda no cambian
+#                   el signo, así que antes se refinan con sección dorada los mínimos
+#                   locales de |f| en la malla cercanos a cero. La búsqueda sigue
+#                   limitada por la malla: una raíz doble sin mínimo local visible en
+#                   ella puede perderse. La iteración nunca sale de su tramo y converge
+#                   de forma superlineal; cada paso usa una TablaPorPoliza con las
+#                   pólizas que aún no convergen
+#   edad:           el valor no es monótono en la edad (el rescate del Vitalicio sube
+#                   y luego baja), así que se evalúan todas las edades admisibles de
+#                   cada póliza (menos de 90) en una sola pasada por bloque; la
+#                   solución es la primera edad que da el objetivo o, si no hay, la de
+#                   valor más cercano, siempre que el valor cruce el objetivo
+#
+#   python inverso.py polizas.csv resultados.csv --incognita tasa --objetivo B_total
+#
+# Por póliza se devuelve la solución, el valor que se logra con ella, las iteraciones
+# y si convergió. Una póliza sin solución en el intervalo queda con NaN y convergio False.
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from calculos import TABLA_MORTALIDAD, TablaPorPoliza, obtener_tabla_conmutada, valuar_objetivos
+from lote import COLUMNAS_POLIZA
+from tablas import registro
+
+INCOGNITAS = ('suma_asegurada', 'tasa', 'edad')
+OBJETIVOS = ('B_total', 'V_rescate_total', 'S_saldado_total')
+INTERVALO_TASA = (0.0001, 0.20)
+# Tasas de la malla (tablas de la caché) con la que se acota la raíz de cada póliza
+PUNTOS_MALLA = 11
+# Ancho de intervalo de tasa con el que se da por convergida una póliza
+TOLERANCIA_TASA = 1e-12
+# La sección dorada busca un mínimo: por debajo de este ancho el redondeo domina
+ANCHO_MINIMO = 1e-8
+RAZON_DORADA = (np.sqrt(5) - 1) / 2
+# Fracción del objetivo por debajo de la cual un mínimo local de la malla se refina
+CERCANIA_MINIMO = 0.01
+
+
+def _subconjunto(poliza, indices):
+    return {clave: columna[indices] for clave, columna in poliza.items()}
+
+
+def _evaluar(conmutados, poliza, objetivo):
+    return valuar_objetivos(conmutados, *(poliza[c] for c in COLUMNAS_POLIZA))[objetivo]
+
+
+def _resolver_suma(conmutados, objetivo, meta, poliza):
+    por_peso = _evaluar(conmutados, {**poliza, 'suma_asegurada': np.ones(meta.shape)}, objetivo)
+    solucion = np.divide(meta, por_peso, out=np.full(meta.shape, np.nan), where=por_peso != 0)
+    convergio = np.isfinite(solucion) & (solucion >= 0)
+    solucion[~convergio] = np.nan
+    return {'solucion': solucion, 'logrado': por_peso * solucion,
+            'iteraciones': np.ones(meta.shape, dtype=np.int64), 'convergio': convergio}
+
+
+# Valores a una tasa distinta por póliza (las pólizas k), por bloques: la tabla por
+# póliza ocupa (pólizas × edades) por columna
+def _evaluar_tasas(tasas, k, poliza, objetivo, tabla, bloque):
+    valores = np.empty(k.size)
+    for inicio in range(0, k.size, bloque):
+        parte = slice(inicio, inicio + bloque)
+        valores[parte] = _evaluar(TablaPorPoliza(tasas[parte], tabla), _subconjunto(poliza, k[parte]), objetivo)
+    return valores
+
+
+# Sección dorada sobre signo·f en [xi, xd] para las pólizas k, donde f no cambia de signo
+# en la malla pero puede tocar el objetivo entre dos puntos. Se detiene en cuanto una
+# evaluación da el objetivo o lo cruza; devuelve esa tasa y su f (NaN si no la hay) y
+# las evaluaciones usadas.
+def _buscar_cruce(xi, xd, signo, k, meta, tolerancia_f, poliza, objetivo, tabla, max_iteraciones, bloque):
+    def g(tasas, sel):
+        return signo[sel] * (_evaluar_tasas(tasas, k[sel], poliza, objetivo, tabla, bloque) - meta[k[sel]])
+
+    todas = np.arange(k.size)
+    xi, xd = xi.copy(), xd.copy()
+    c, d = xd - RAZON_DORADA * (xd - xi), xi + RAZON_DORADA * (xd - xi)
+    gc, gd = g(c, todas), g(d, todas)
+    cruce = np.full(k.size, np.nan)
+    f_cruce = np.full(k.size, np.nan)
+    # d primero para que, si ambos cruzan, quede el menor
+    for x, gx in ((d, gd), (c, gc)):
+        marca = gx <= tolerancia_f[k]
+        cruce[marca], f_cruce[marca] = x[marca], signo[marca] * gx[marca]
+    usadas = np.full(k.size, 2, dtype=np.int64)
+    activo = np.isnan(cruce)
+    for _ in range(max_iteraciones):
+        sel = np.flatnonzero(activo & (xd - xi > ANCHO_MINIMO))
+        if sel.size == 0:
+            break
+        # El mínimo queda en [xi, d] si g(c) < g(d); si no, en [c, xd]
+        izquierda = gc[sel] < gd[sel]
+        xi[sel], xd[sel] = np.where(izquierda, xi[sel], c[sel]), np.where(izquierda, d[sel], xd[sel])
+        nuevo = np.where(izquierda, xd[sel] - RAZON_DORADA * (xd[sel] - xi[sel]),
+                         xi[sel] + RAZON_DORADA * (xd[sel] - xi[sel]))
+        g_nuevo = g(nuevo, sel)
+        usadas[sel] += 1
+        c[sel], gc[sel], d[sel], gd[sel] = (np.where(izquierda, nuevo, d[sel]), np.where(izquierda, g_nuevo, gd[sel]),
+                                            np.where(izquierda, c[sel], nuevo), np.where(izquierda, gc[sel], g_nuevo))
+        marca = g_nuevo <= tolerancia_f[k[sel]]
+        cruce[sel[marca]], f_cruce[sel[marca]] = nuevo[marca], signo[sel[marca]] * g_nuevo[marca]
+        activo[sel[marca]] = False
+    return cruce, f_cruce, usadas
+
+
+def _resolver_tasa(objetivo, meta, poliza, tabla, intervalo, tolerancia, max_iteraciones, bloque):
+    n = meta.size
+    a, b = intervalo
+    if not 0 <= a < b:
+        raise ValueError("El intervalo de tasas debe cumplir 0 <= mínima < máxima")
+    malla = np.linspace(a, b, PUNTOS_MALLA)
+    valores = np.stack([_evaluar(obtener_tabla_conmutada(tasa, tabla), poliza, objetivo) for tasa in malla])
+    f = valores - meta
+    tolerancia_f = tolerancia * np.maximum(np.abs(meta), 1.0)
+
+    # Primer punto de la malla que ya da el objetivo y primer tramo con cambio de signo
+    exacto = np.abs(f) <= tolerancia_f
+    cambio = np.sign(f[:-1]) != np.sign(f[1:])
+    primer_exacto = np.where(exacto.any(axis=0), exacto.argmax(axis=0), PUNTOS_MALLA)
+    primer_cambio = np.where(cambio.any(axis=0), cambio.argmax(axis=0), PUNTOS_MALLA)
+    en_malla = primer_exacto <= primer_cambio
+    activo = ~en_malla & (primer_cambio < PUNTOS_MALLA - 1)
+    tramo = np.minimum(primer_cambio, PUNTOS_MALLA - 2)
+    columnas = np.arange(n)
+    xa, xb = malla[tramo], malla[tramo + 1]
+    fa, fb = f[tramo, columnas], f[tramo + 1, columnas]
+
+    solucion = np.full(n, np.nan)
+    logrado = np.full(n, np.nan)
+    iteraciones = np.zeros(n, dtype=np.int64)
+    exactas = np.flatnonzero(en_malla & (primer_exacto < PUNTOS_MALLA))
+    solucion[exactas] = malla[primer_exacto[exactas]]
+    logrado[exactas] = valores[primer_exacto[exactas], exactas]
+    convergio = np.zeros(n, dtype=bool)
+    convergio[exactas] = True
+
+    # Dos raíces en una misma celda no cambian el signo en la malla. Antes del primer
+    # cruce o punto exacto, cada mínimo local de |f| cercano a cero (menor que lo que
+    # sube |f| hacia el vecino más alto o que CERCANIA_MINIMO del objetivo) se refina,
+    # de la menor tasa a la mayor, con sección dorada en las dos celdas vecinas
+    absoluto = np.abs(f)
+    anterior = np.vstack([np.full((1, n), np.inf), absoluto[:-1]])
+    siguiente = np.vstack([absoluto[1:], np.full((1, n), np.inf)])
+    vecino_alto = np.fmax(np.where(np.isinf(anterior), np.nan, anterior), np.where(np.isinf(siguiente), np.nan, siguiente))
+    cercano = (absoluto <= vecino_alto - absoluto) | (absoluto <= CERCANIA_MINIMO * np.abs(meta))
+    candidato = ((absoluto <= anterior) & (absoluto <= siguiente) & cercano
+                 & (np.arange(PUNTOS_MALLA)[:, None] < np.minimum(primer_exacto, primer_cambio)))
+    while candidato.any():
+        k = np.flatnonzero(candidato.any(axis=0))
+        j = candidato[:, k].argmax(axis=0)
+        candidato[j, k] = False
+        izquierdo = np.maximum(j - 1, 0)
+        cruce, f_cruce, usadas = _buscar_cruce(malla[izquierdo], malla[np.minimum(j + 1, PUNTOS_MALLA - 1)],
+                                               np.sign(f[j, k]), k, meta, tolerancia_f, poliza, objetivo, tabla,
+                                               max_iteraciones, bloque)
+        iteraciones[k] += usadas
+        hallado = np.isfinite(cruce)
+        candidato[:, k[hallado]] = False
+        # Si la evaluación ya da el objetivo es la solución; si lo cruza, acota la raíz
+        exacta = hallado & (np.abs(f_cruce) <= tolerancia_f[k])
+        solucion[k[exacta]], logrado[k[exacta]] = cruce[exacta], f_cruce[exacta] + meta[k[exacta]]
+        convergio[k[exacta]] = True
+        activo[k[exacta]] = False
+        acota = hallado & ~exacta
+        xa[k[acota]], fa[k[acota]] = malla[izquierdo[acota]], f[izquierdo[acota], k[acota]]
+        xb[k[acota]], fb[k[acota]] = cruce[acota], f_cruce[acota]
+        activo[k[acota]] = True
+
+    for _ in range(max_iteraciones):
+        k = np.flatnonzero(activo)
+        if k.size == 0:
+            break
+        xc = xb[k] - fb[k] * (xb[k] - xa[k]) / (fb[k] - fa[k])
+        valor_c = _evaluar_tasas(xc, k, poliza, objetivo, tabla, bloque)
+        fc = valor_c - meta[k]
+        iteraciones[k] += 1
+        # Si c y b quedan del mismo lado se conserva a y se reduce fa a la mitad (Illinois)
+        cruza = np.sign(fc) != np.sign(fb[k])
+        xa[k] = np.where(cruza, xb[k], xa[k])
+        fa[k] = np.where(cruza, fb[k], fa[k] / 2)
+        xb[k], fb[k] = xc, fc
+        listo = (np.abs(fc) <= tolerancia_f[k]) | (np.abs(xb[k] - xa[k]) <= TOLERANCIA_TASA)
+        solucion[k[listo]], logrado[k[listo]] = xc[listo], valor_c[listo]
+        convergio[k[listo]] = True
+        activo[k[listo]] = False
+    return {'solucion': solucion, 'logrado': logrado, 'iteraciones': iteraciones, 'convergio': convergio}
+
+
+def _resolver_edad(conmutados, objetivo, meta, poliza, tolerancia, bloque):
+    n = meta.size
+    vitalicio = poliza['tipo_seguro'] == "Vitalicio"
+    # En el Vitalicio el plazo es hasta la última edad, así que debe caber el plazo de pago
+    alto = conmutados.edad_max - np.where(vitalicio, poliza['plazo_pago'], poliza['plazo_seguro']).astype(np.int64)
+    if np.any(alto < conmutados.edad_min):
+        raise ValueError(f"El plazo del seguro no cabe en la tabla para ninguna edad desde {conmutados.edad_min}")
+    edades = np.arange(conmutados.edad_min, int(alto.max()) + 1)
+    tolerancia_f = tolerancia * np.maximum(np.abs(meta), 1.0)
+
+    solucion = np.full(n, np.nan)
+    logrado = np.full(n, np.nan)
+    convergio = np.zeros(n, dtype=bool)
+    # Por bloques de pólizas: cada una se evalúa en todas las edades (matriz pólizas × edades)
+    por_bloque = max(1, bloque // 8)
+    for inicio in range(0, n, por_bloque):
+        k = np.arange(inicio, min(inicio + por_bloque, n))
+        admisible = edades <= alto[k, None]
+        # Las edades no admisibles se evalúan en la última admisible y se descartan
+        malla = np.minimum(edades, alto[k, None])
+        repetida = _subconjunto(poliza, np.repeat(k, edades.size))
+        valores = _evaluar(conmutados, {**repetida, 'edad': malla.ravel()}, objetivo).reshape(malla.shape)
+        f = np.where(admisible, valores - meta[k, None], np.inf)
+        distancia = np.abs(f)
+        # Hay solución si alguna edad da el objetivo o si el valor lo cruza entre dos edades seguidas
+        exacta = distancia <= tolerancia_f[k, None]
+        cruza = ((np.sign(f[:, :-1]) != np.sign(f[:, 1:])) & admisible[:, 1:]).any(axis=1)
+        elegida = np.where(exacta.any(axis=1), exacta.argmax(axis=1), distancia.argmin(axis=1))
+        ok = exacta.any(axis=1) | cruza
+        filas = np.arange(k.size)
+        solucion[k] = np.where(ok, edades[elegida], np.nan)
+        logrado[k] = np.where(ok, valores[filas, elegida], np.nan)
+        convergio[k] = ok
+    return {'solucion': solucion, 'logrado': logrado, 'iteraciones': np.ones(n, dtype=np.int64), 'convergio': convergio}
+
+
+# Resuelve la incógnita para que el campo objetivo (uno de OBJETIVOS) valga
+# valores_objetivo. Las columnas son como las de valuar_cartera; la de la incógnita se
+# ignora (puede ser None). i es la tasa técnica en decimal y no se usa si la incógnita
+# es la tasa, que se busca en intervalo. Devuelve {'solucion', 'logrado', 'iteraciones',
+# 'convergio'} como arreglos del largo de la cartera.
+def resolver(incognita, objetivo, valores_objetivo, tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago,
+             tipo_recargo, t_anos, i=None, tabla=TABLA_MORTALIDAD, intervalo=INTERVALO_TASA, tolerancia=1e-10,
+             max_iteraciones=100, bloque=8192):
+    if incognita not in INCOGNITAS:
+        raise ValueError(f"Incógnita desconocida: {incognita!r} (disponibles: {', '.join(INCOGNITAS)})")
+    if objetivo not in OBJETIVOS:
+        raise ValueError(f"Objetivo desconocido: {objetivo!r} (disponibles: {', '.join(OBJETIVOS)})")
+    if incognita != 'tasa' and i is None:
+        raise ValueError("Se necesita la tasa de interés técnico")
+    columnas = [np.asarray(valores_objetivo, dtype=np.float64)]
+    columnas += [np.asarray(0 if v is None else v) for v in
+                 (tipo_seguro, edad, suma_asegurada, plazo_seguro, plazo_pago, tipo_recargo, t_anos)]
+    meta, *columnas = (np.atleast_1d(c) for c in np.broadcast_arrays(*columnas))
+    poliza = dict(zip(COLUMNAS_POLIZA, columnas))
+    if incognita == 'tasa':
+        return _resolver_tasa(objetivo, meta, poliza, tabla, intervalo, tolerancia, max_iteraciones, bloque)
+    conmutados = obtener_tabla_conmutada(i, tabla)
+    if incognita == 'suma_asegurada':
+        return _resolver_suma(conmutados, objetivo, meta, poliza)
+    return _resolver_edad(conmutados, objetivo, meta, poliza, tolerancia, bloque)
+
+
+# Versión por DataFrame: el objetivo va en la columna del mismo nombre. Se agrega (o
+# reemplaza) la columna de la incógnita con la solución, la tasa en %, seguida de
+# <objetivo>_logrado, iteraciones y convergio.
+def resolver_dataframe(polizas, incognita, objetivo, i=None, tabla=TABLA_MORTALIDAD, **opciones):
+    requeridas = [c for c in (objetivo, *COLUMNAS_POLIZA) if c != incognita]
+    faltantes = [c for c in requeridas if c not in polizas.columns]
+    if faltantes:
+        raise ValueError(f"Faltan las columnas {faltantes}")
+    columnas = [polizas[c].to_numpy() if c != incognita else None for c in COLUMNAS_POLIZA]
+    r = resolver(incognita, objetivo, polizas[objetivo].to_numpy(), *columnas, i=i, tabla=tabla, **opciones)
+    salida = polizas.reset_index(drop=True)
+    salida[incognita] = r['solucion'] * 100 if incognita == 'tasa' else r['solucion']
+    salida[f"{objetivo}_logrado"] = r['logrado']
+    salida['iteraciones'] = r['iteraciones']
+    salida['convergio'] = r['convergio']
+    return salida
+
+
+def main(argv=None):
+    import pandas as pd
+    parser = argparse.ArgumentParser(description="Cálculo inverso de suma asegurada, tasa o edad a partir de un valor objetivo")
+    parser.add_argument('entrada', help="CSV de pólizas con la columna del objetivo y las de " + ", ".join(COLUMNAS_POLIZA)
+                                       + " (salvo la incógnita)")
+    parser.add_argument('salida', help="CSV de resultados")
+    parser.add_argument('--incognita', choices=INCOGNITAS, required=True)
+    parser.add_argument('--objetivo', choices=OBJETIVOS, required=True)
+    parser.add_argument('--tasa', type=float, help="Tasa de interés técnico en %% (no se usa si la incógnita es la tasa)")
+    parser.add_argument('--intervalo', type=float, nargs=2, metavar=('MIN', 'MAX'),
+                        default=[100 * t for t in INTERVALO_TASA], help="Intervalo de búsqueda de la tasa en %%")
+    parser.add_argument('--tabla', default=TABLA_MORTALIDAD, help="Tabla de mortalidad registrada")
+    args = parser.parse_args(argv)
+    if args.incognita != 'tasa' and args.tasa is None:
+        parser.error("--tasa es obligatoria salvo que la incógnita sea la tasa")
+    if args.tasa is not None and not 0 < args.tasa <= 10:
+        parser.error("la tasa debe ser mayor a 0% y menor o igual a 10%")
+    if args.tabla not in registro:
+        parser.error(f"tabla de mortalidad desconocida: {args.tabla!r} (disponibles: {', '.join(registro.nombres())})")
+
+    inicio = time.perf_counter()
+    polizas = pd.read_csv(args.entrada)
+    resultado = resolver_dataframe(polizas, args.incognita, args.objetivo, None if args.tasa is None else args.tasa / 100,
+                                   args.tabla, intervalo=tuple(t / 100 for t in args.intervalo))
+    resultado.to_csv(args.salida, index=False)
+    segundos = time.perf_counter() - inicio
+    convergieron = int(resultado['convergio'].sum())
+    print(f"{len(resultado):,} pólizas en {segundos:.2f} s: {convergieron:,} convergieron, "
+          f"{resultado['iteraciones'].mean():.1f} iteraciones en promedio", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
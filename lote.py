@@ -0,0 +1,158 @@
+# Valuación por lotes desde la línea de comandos. Lee un archivo CSV de pólizas en
+# bloques de tamaño fijo, reparte los bloques entre varios procesos (cada uno arma la
+# tabla de conmutados una sola vez) y va escribiendo los resultados en orden conforme
+# terminan, así que la memoria depende del tamaño de bloque y no del archivo.
+#
+#   python lote.py polizas.csv resultados.csv --tasa 4 --procesos 8
+#
+# Con --almacen la corrida es incremental (ver almacen.py): solo se valúan las pólizas
+# nuevas o que cambiaron desde la corrida anterior. Con --compacto los resultados se
+# guardan en float32 (ver COTA_ERROR_COMPACTO en calculos.py).
+#
+# El CSV debe tener las columnas de COLUMNAS_POLIZA; las demás (por ejemplo un id de
+# póliza) se copian tal cual a la salida, seguidas de los resultados de valuar_cartera.
+# Los campos entre comillas pueden tener saltos de línea: los bloques nunca cortan un
+# registro a la mitad.
+import argparse
+import io
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from calculos import TABLA_MORTALIDAD, obtener_tabla_conmutada, valuar_cartera
+from tablas import registro
+
+COLUMNAS_POLIZA = ('tipo_seguro', 'edad', 'suma_asegurada', 'plazo_seguro', 'plazo_pago', 'tipo_recargo', 't_anos')
+
+# Tabla de conmutados del proceso trabajador (se arma en _iniciar_trabajador)
+_conmutados = None
+
+
+def _iniciar_trabajador(i, tabla):
+    global _conmutados
+    _conmutados = obtener_tabla_conmutada(i, tabla)
+
+
+def valuar_dataframe(conmutados, polizas, compacto=False):
+    import pandas as pd
+    faltantes = [c for c in COLUMNAS_POLIZA if c not in polizas.columns]
+    if faltantes:
+        raise ValueError(f"Faltan las columnas {faltantes}")
+    resultado = valuar_cartera(conmutados, *(polizas[c].to_numpy() for c in COLUMNAS_POLIZA), compacto=compacto)
+    return pd.concat([polizas.reset_index(drop=True), pd.DataFrame(resultado)], axis=1)
+
+
+# Trabajo de cada proceso: interpreta el bloque de texto, valúa y devuelve el CSV ya
+# formateado (con encabezado), de modo que el proceso principal solo lee y escribe bytes
+def _procesar_bloque(encabezado, lineas, compacto=False):
+    import pandas as pd
+    polizas = pd.read_csv(io.BytesIO(encabezado + lineas))
+    return len(polizas), valuar_dataframe(_conmutados, polizas, compacto).to_csv(index=False).encode('utf-8')
+
+
+# Bloques de registros completos del CSV. Se toman tamano_bloque líneas y, si el bloque
+# deja unas comillas abiertas (número impar de comillas; las escapadas "" cuentan dos),
+# se siguen agregando líneas hasta cerrarlas. Un registro con saltos de línea ocupa
+# varias líneas, así que el bloque puede traer menos de tamano_bloque registros.
+def leer_bloques(archivo, tamano_bloque):
+    while True:
+        bloque = b''.join(islice(archivo, tamano_bloque))
+        if not bloque:
+            return
+        while bloque.count(b'"') % 2:
+            linea = archivo.readline()
+            if not linea:
+                raise ValueError("El CSV termina con un campo entre comillas sin cerrar")
+            bloque += linea
+        yield bloque
+
+
+# Encabezado del CSV (el primer registro, que también puede ocupar varias líneas)
+def leer_encabezado(archivo):
+    encabezado = next(leer_bloques(archivo, 1), b'')
+    if not encabezado.strip():
+        raise ValueError("El CSV está vacío: falta el encabezado")
+    if not encabezado.endswith(b'\n'):
+        encabezado += b'\n'
+    return encabezado
+
+
+# Valúa el archivo completo. Con procesos=1 todo corre en el proceso actual. Se
+# mantienen a lo más 2 bloques por proceso en vuelo para acotar la memoria.
+def valuar_archivo(entrada, salida, i, tabla=TABLA_MORTALIDAD, tamano_bloque=100_000, procesos=None, compacto=False):
+    procesos = procesos or os.cpu_count() or 1
+    filas = 0
+    with open(entrada, 'rb') as f_entrada, open(salida, 'wb') as f_salida:
+        encabezado = leer_encabezado(f_entrada)
+        primero = True
+
+        def escribir(resultado):
+            nonlocal primero, filas
+            n, datos = resultado
+            if not primero:
+                datos = datos[datos.index(b'\n') + 1:]
+            f_salida.write(datos)
+            filas += n
+            primero = False
+
+        if procesos == 1:
+            _iniciar_trabajador(i, tabla)
+            for lineas in leer_bloques(f_entrada, tamano_bloque):
+                escribir(_procesar_bloque(encabezado, lineas, compacto))
+            if primero:
+                # Archivo sin pólizas: la salida lleva de todos modos el encabezado
+                escribir(_procesar_bloque(encabezado, b'', compacto))
+            return filas
+
+        with ProcessPoolExecutor(procesos, initializer=_iniciar_trabajador, initargs=(i, tabla)) as pool:
+            pendientes = deque()
+            for lineas in leer_bloques(f_entrada, tamano_bloque):
+                pendientes.append(pool.submit(_procesar_bloque, encabezado, lineas, compacto))
+                if len(pendientes) >= 2 * procesos:
+                    escribir(pendientes.popleft().result())
+            while pendientes:
+                escribir(pendientes.popleft().result())
+        if primero:
+            _iniciar_trabajador(i, tabla)
+            escribir(_procesar_bloque(encabezado, b'', compacto))
+    return filas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valuación por lotes de valores garantizados")
+    parser.add_argument('entrada', help="CSV de pólizas con las columnas " + ", ".join(COLUMNAS_POLIZA))
+    parser.add_argument('salida', help="CSV de resultados")
+    parser.add_argument('--tasa', type=float, required=True, help="Tasa de interés técnico en %% (ej. 4)")
+    parser.add_argument('--tabla', default=TABLA_MORTALIDAD, help="Tabla de mortalidad registrada")
+    parser.add_argument('--bloque', type=int, default=100_000, help="Pólizas por bloque")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos trabajadores (por omisión, uno por núcleo)")
+    parser.add_argument('--almacen', help="Directorio del almacén de resultados para revaluar solo lo que cambió "
+                                          "(requiere la columna id_poliza; ignora --bloque y --procesos)")
+    parser.add_argument('--compacto', action='store_true', help="Resultados en float32 (error relativo menor a 6e-8)")
+    args = parser.parse_args(argv)
+    if not 0 < args.tasa <= 10:
+        parser.error("la tasa debe ser mayor a 0% y menor o igual a 10%")
+    if args.bloque < 1:
+        parser.error("el bloque debe tener al menos una póliza")
+    if args.tabla not in registro:
+        parser.error(f"tabla de mortalidad desconocida: {args.tabla!r} (disponibles: {', '.join(registro.nombres())})")
+
+    inicio = time.perf_counter()
+    if args.almacen:
+        from almacen import revaluar_archivo
+        try:
+            filas, cuentas = revaluar_archivo(args.entrada, args.salida, args.almacen, args.tasa / 100, args.tabla, args.compacto)
+        except ValueError as e:
+            parser.error(str(e))
+        print(", ".join(f"{n:,} {nombre}" for nombre, n in cuentas.items()), file=sys.stderr)
+    else:
+        filas = valuar_archivo(args.entrada, args.salida, args.tasa / 100, args.tabla, args.bloque, args.procesos, args.compacto)
+    segundos = time.perf_counter() - inicio
+    print(f"{filas:,} pólizas valuadas en {segundos:.2f} s ({filas / max(segundos, 1e-9):,.0f} pólizas/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
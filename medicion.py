@@ -0,0 +1,104 @@
+# Medición de tiempos por etapa y contadores para diagnosticar lentitud. Una medición
+# se abre con medir() alrededor de un flujo completo (un cálculo, un PDF); dentro de
+# ella etapa() toma el tiempo de cada parte y contar() suma eventos (consultas a
+# get_valor, aciertos de la caché, ...). Al cerrar, el resumen se escribe como una
+# línea JSON en el log 'valores_garantizados.medicion' (a stderr o al archivo de
+# VG_MEDICION_LOG).
+#
+# Sin una medición abierta, etapa() devuelve un contexto vacío compartido y contar()
+# solo consulta una ContextVar, así que dejar las llamadas en el código cuesta del
+# orden de decenas de nanosegundos. La medición queda activa por omisión si VG_MEDICION=1.
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+ACTIVA = os.environ.get('VG_MEDICION', '0') not in ('', '0')
+
+_actual = ContextVar('medicion', default=None)
+_NULA = nullcontext()
+
+logger = logging.getLogger('valores_garantizados.medicion')
+if not logger.handlers:
+    _destino = os.environ.get('VG_MEDICION_LOG')
+    _manejador = logging.FileHandler(_destino, encoding='utf-8') if _destino else logging.StreamHandler(sys.stderr)
+    _manejador.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_manejador)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Medicion:
+    def __init__(self, evento, **contexto):
+        self.evento = evento
+        self.contexto = contexto
+        self.etapas = {}
+        self.contadores = {}
+        self.total_ms = None
+        self._inicio = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _actual.set(self)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.total_ms = (time.perf_counter() - self._inicio) * 1000
+        _actual.reset(self._token)
+        logger.info(json.dumps(self.resumen(), ensure_ascii=False, default=str))
+        return False
+
+    def agregar_etapa(self, nombre, ms):
+        self.etapas[nombre] = self.etapas.get(nombre, 0.0) + ms
+
+    # Diccionario listo para JSON: evento, contexto, total y etapas en milisegundos, contadores
+    def resumen(self):
+        return {
+            'evento': self.evento,
+            'ts': time.time(),
+            **self.contexto,
+            'total_ms': None if self.total_ms is None else round(self.total_ms, 3),
+            'etapas_ms': {nombre: round(ms, 3) for nombre, ms in self.etapas.items()},
+            'contadores': dict(self.contadores),
+        }
+
+
+class _Etapa:
+    __slots__ = ('medicion', 'nombre', 'inicio')
+
+    def __init__(self, medicion, nombre):
+        self.medicion = medicion
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.medicion.agregar_etapa(self.nombre, (time.perf_counter() - self.inicio) * 1000)
+        return False
+
+
+# Abre una medición si está activa (por omisión, según VG_MEDICION); si no, devuelve
+# un contexto vacío que entrega None en el with
+def medir(evento, activa=None, **contexto):
+    if not (ACTIVA if activa is None else activa):
+        return _NULA
+    return Medicion(evento, **contexto)
+
+
+def etapa(nombre):
+    medicion = _actual.get()
+    if medicion is None:
+        return _NULA
+    return _Etapa(medicion, nombre)
+
+
+def contar(nombre, n=1):
+    medicion = _actual.get()
+    if medicion is not None:
+        medicion.contadores[nombre] = medicion.contadores.get(nombre, 0) + n
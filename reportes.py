@@ -0,0 +1,239 @@
+# Reportes PDF de valores garantizados. generar_pdf arma el documento en memoria y
+# devuelve los bytes, sin pasar por archivos temporales. El diseño del reporte está en
+# PLANTILLA: se define una sola vez por proceso y cada documento solo la recorre con sus
+# datos (copiar un FPDF ya preparado con copy.deepcopy resulta más lento que dibujarlo).
+#
+# La exportación masiva valúa un CSV de pólizas por bloques en varios procesos, cada
+# uno genera los PDF de su bloque y el proceso principal los va agregando en orden a un
+# único .zip:
+#
+#   python reportes.py polizas.csv reportes.zip --tasa 4 --procesos 8
+import argparse
+import io
+import os
+import re
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from calculos import TABLA_MORTALIDAD, obtener_tabla_conmutada
+from lote import COLUMNAS_POLIZA, leer_bloques, leer_encabezado, valuar_dataframe
+from tablas import registro
+
+ESTILOS = {
+    'titulo': ("Arial", "B", 16),
+    'seccion': ("Arial", "B", 12),
+    'texto': ("Arial", "", 10),
+    'resumen': ("Arial", "B", 10),
+    'nota': ("Arial", "", 9),
+    'pie': ("Arial", "I", 8),
+}
+
+
+def _vigencia_saldado(d):
+    if d.get('tipo_seguro') != 'Vitalicio':
+        return f"Vigencia Restante: {d.get('n_restante')} anos"
+    return "Vigencia: Vitalicia"
+
+
+def _vigencia_dotal(d):
+    if d.get('tipo_seguro') == "Dotal (Mixto)" and d.get('años', 0) >= d.get('n_restante', 0):
+        return f"Vigencia hasta termino original: {d.get('n_restante')} anos"
+
+
+def _devolucion_dotal(d):
+    if _vigencia_dotal(d) and d.get('devolucion', 0) > 0:
+        return f"Devolucion si llega con vida: ${d.get('devolucion'):,.2f}"
+
+
+# Renglones del reporte: (estilo, alto, texto, alineación) o ('ln', alto) para un
+# salto. El texto es fijo o una función de pdf_data; si la función devuelve None el
+# renglón se omite.
+PLANTILLA = (
+    ('titulo', 10, "REPORTE DE VALORES GARANTIZADOS", "C"),
+    ('texto', 5, lambda d: f"Fecha: {d['fecha']}", "C"),
+    ('ln', 10),
+
+    ('seccion', 8, "DATOS GENERALES", ""),
+    ('texto', 6, lambda d: f"Tipo de Seguro: {d.get('tipo_seguro')}", ""),
+    ('texto', 6, lambda d: f"Tabla de Mortalidad: {d.get('tabla_mortalidad')}", ""),
+    ('texto', 6, lambda d: f"Suma Asegurada: ${d.get('suma_asegurada'):,.2f}", ""),
+    ('texto', 6, lambda d: f"Tasa de Interes: {d.get('tasa_interes')}%", ""),
+    ('texto', 6, lambda d: f"Edad del Asegurado: {d.get('edad')} anos", ""),
+    ('texto', 6, lambda d: f"Plazo del Seguro: {d.get('plazo_seguro')} anos", ""),
+    ('texto', 6, lambda d: f"Plazo de Pago: {d.get('plazo_pago')} anos", ""),
+    ('texto', 6, lambda d: f"Tipo de Recargos: {d.get('tipo_recargo')}", ""),
+    ('texto', 6, lambda d: f"Ano de Calculo: {d.get('t_anos')}", ""),
+    ('ln', 5),
+
+    ('seccion', 8, "PRIMA COMERCIAL (5 puntos)", ""),
+    ('texto', 6, lambda d: f"PNU: ${d.get('PNU'):.10f}", ""),
+    ('texto', 6, lambda d: f"Prima Neta Nivelada: ${d.get('P'):.10f}", ""),
+    ('texto', 6, lambda d: f"Prima Comercial Anual: ${d.get('B_total'):,.2f}", ""),
+    ('ln', 5),
+
+    ('seccion', 8, lambda d: f"VALOR DE RESCATE AL ANO {d.get('t_anos')} (7.5 puntos)", ""),
+    ('texto', 6, lambda d: f"Edad Actual: {d.get('edad_actual')} anos", ""),
+    ('texto', 6, lambda d: f"Valor de Rescate: ${d.get('V_rescate_total'):,.2f}", ""),
+    ('ln', 5),
+
+    ('seccion', 8, lambda d: f"SEGURO SALDADO AL ANO {d.get('t_anos')} (7.5 puntos)", ""),
+    ('texto', 6, lambda d: f"Nueva Suma Asegurada: ${d.get('S_saldado_total'):,.2f}", ""),
+    ('texto', 6, _vigencia_saldado, ""),
+    ('ln', 5),
+
+    ('seccion', 8, lambda d: f"SEGURO PRORROGADO AL ANO {d.get('t_anos')} (10 puntos)", ""),
+    ('texto', 6, lambda d: f"Suma Asegurada Mantenida: ${d.get('suma_asegurada'):,.2f}", ""),
+    ('texto', 6, lambda d: f"Prorroga: {d.get('años')} anos, {d.get('meses')} meses, {d.get('dias')} dias", ""),
+    ('texto', 6, _vigencia_dotal, ""),
+    ('texto', 6, _devolucion_dotal, ""),
+    ('ln', 10),
+
+    ('resumen', 6, "RESUMEN DE PUNTUACION:", ""),
+    ('nota', 5, "- Prima Comercial: 5 puntos", ""),
+    ('nota', 5, "- Valor de Rescate: 7.5 puntos", ""),
+    ('nota', 5, "- Seguro Saldado: 7.5 puntos", ""),
+    ('nota', 5, "- Seguro Prorrogado: 10 puntos", ""),
+    ('ln', 3),
+    ('pie', 5, "Total por tipo de seguro: 30 puntos", "C"),
+    ('pie', 5, "Calificacion maxima (3 tipos): 100 puntos = 30 puntos del parcial", "C"),
+)
+
+
+# Dibuja el reporte de una póliza y devuelve el PDF como bytes. pdf_data tiene las
+# mismas llaves que arma la interfaz; 'fecha' es opcional (por omisión, ahora).
+def generar_pdf(pdf_data):
+    from fpdf import FPDF
+    if 'fecha' not in pdf_data:
+        pdf_data = dict(pdf_data, fecha=datetime.now().strftime('%d/%m/%Y %H:%M'))
+    pdf = FPDF()
+    pdf.add_page()
+    estilo_actual = None
+    for renglon in PLANTILLA:
+        estilo = renglon[0]
+        if estilo == 'ln':
+            pdf.ln(renglon[1])
+            continue
+        _, alto, texto, alineacion = renglon
+        if callable(texto):
+            texto = texto(pdf_data)
+            if texto is None:
+                continue
+        if estilo != estilo_actual:
+            pdf.set_font(*ESTILOS[estilo])
+            estilo_actual = estilo
+        pdf.cell(0, alto, texto, 0, 1, alineacion)
+    contenido = pdf.output(dest='S')
+    # fpdf 1.7 devuelve str (latin-1); fpdf2 devuelve bytearray
+    return contenido.encode('latin-1') if isinstance(contenido, str) else bytes(contenido)
+
+
+# Nombre del archivo del reporte. El sufijo (por ejemplo el id de la póliza) se limpia
+# para que el nombre sea un solo componente de ruta: cualquier carácter que no sea
+# letra, dígito, punto o guion (incluidas / y \) se cambia por _.
+def nombre_reporte(pdf_data, sufijo=None):
+    tipo = str(pdf_data.get('tipo_seguro', '')).lower().replace(' ', '_').replace('(', '').replace(')', '')
+    sufijo = sufijo if sufijo is not None else datetime.now().strftime('%Y%m%d_%H%M%S')
+    sufijo = re.sub(r'[^\w.-]', '_', str(sufijo))
+    return f"valores_garantizados_{tipo}_{sufijo}.pdf"
+
+
+# Nombre sin repetir dentro del zip: a un nombre ya usado (ids repetidos, o distintos
+# que quedaron iguales al limpiarlos) se le agrega _2, _3, ...
+def _nombre_unico(nombre, usados):
+    base, extension = os.path.splitext(nombre)
+    copia = 1
+    while nombre in usados:
+        copia += 1
+        nombre = f"{base}_{copia}{extension}"
+    usados.add(nombre)
+    return nombre
+
+
+# Tabla de conmutados y datos fijos del reporte en el proceso trabajador
+_conmutados = None
+_datos_fijos = {}
+
+
+def _iniciar_trabajador(i, tabla):
+    global _conmutados, _datos_fijos
+    _conmutados = obtener_tabla_conmutada(i, tabla)
+    _datos_fijos = {'tasa_interes': round(i * 100, 10), 'tabla_mortalidad': tabla,
+                    'fecha': datetime.now().strftime('%d/%m/%Y %H:%M')}
+
+
+# Trabajo de cada proceso: valúa el bloque y devuelve [(nombre, pdf), ...]. El nombre
+# usa la columna id_poliza si existe y si no el número de renglón del archivo.
+def _reportes_bloque(encabezado, lineas, inicio):
+    import pandas as pd
+    polizas = pd.read_csv(io.BytesIO(encabezado + lineas))
+    valores = valuar_dataframe(_conmutados, polizas)
+    ids = polizas['id_poliza'].astype(str) if 'id_poliza' in polizas.columns else range(inicio, inicio + len(polizas))
+    reportes = []
+    for id_poliza, fila in zip(ids, valores.to_dict('records')):
+        fila.update(_datos_fijos)
+        reportes.append((nombre_reporte(fila, id_poliza), generar_pdf(fila)))
+    return reportes
+
+
+# Genera un PDF por póliza y los guarda en el zip destino, en el orden del archivo.
+# Los PDF ya vienen comprimidos, así que se guardan sin volver a comprimir.
+def exportar_zip(entrada, destino, i, tabla=TABLA_MORTALIDAD, tamano_bloque=500, procesos=None):
+    procesos = procesos or os.cpu_count() or 1
+    total = 0
+    with open(entrada, 'rb') as f_entrada, zipfile.ZipFile(destino, 'w', zipfile.ZIP_STORED) as archivo_zip:
+        encabezado = leer_encabezado(f_entrada)
+        usados = set()
+
+        def escribir(reportes):
+            nonlocal total
+            for nombre, contenido in reportes:
+                archivo_zip.writestr(_nombre_unico(nombre, usados), contenido)
+            total += len(reportes)
+
+        bloques = ((encabezado, lineas, n * tamano_bloque + 1)
+                   for n, lineas in enumerate(leer_bloques(f_entrada, tamano_bloque)))
+        if procesos == 1:
+            _iniciar_trabajador(i, tabla)
+            for bloque in bloques:
+                escribir(_reportes_bloque(*bloque))
+            return total
+
+        with ProcessPoolExecutor(procesos, initializer=_iniciar_trabajador, initargs=(i, tabla)) as pool:
+            pendientes = deque()
+            for bloque in bloques:
+                pendientes.append(pool.submit(_reportes_bloque, *bloque))
+                if len(pendientes) >= 2 * procesos:
+                    escribir(pendientes.popleft().result())
+            while pendientes:
+                escribir(pendientes.popleft().result())
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta un reporte PDF por póliza a un archivo zip")
+    parser.add_argument('entrada', help="CSV de pólizas con las columnas " + ", ".join(COLUMNAS_POLIZA) + " (y opcionalmente id_poliza)")
+    parser.add_argument('destino', help="Archivo .zip de salida")
+    parser.add_argument('--tasa', type=float, required=True, help="Tasa de interés técnico en %% (ej. 4)")
+    parser.add_argument('--tabla', default=TABLA_MORTALIDAD, help="Tabla de mortalidad registrada")
+    parser.add_argument('--bloque', type=int, default=500, help="Pólizas por bloque")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos trabajadores (por omisión, uno por núcleo)")
+    args = parser.parse_args(argv)
+    if not 0 < args.tasa <= 10:
+        parser.error("la tasa debe ser mayor a 0% y menor o igual a 10%")
+    if args.bloque < 1:
+        parser.error("el bloque debe tener al menos una póliza")
+    if args.tabla not in registro:
+        parser.error(f"tabla de mortalidad desconocida: {args.tabla!r} (disponibles: {', '.join(registro.nombres())})")
+
+    inicio = time.perf_counter()
+    total = exportar_zip(args.entrada, args.destino, args.tasa / 100, args.tabla, args.bloque, args.procesos)
+    segundos = time.perf_counter() - inicio
+    print(f"{total:,} reportes generados en {segundos:.2f} s ({total / max(segundos, 1e-9):,.0f} reportes/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+# Servicio HTTP/JSON local para que otros sistemas (cotizador, CRM) obtengan valores
+# garantizados sin pasar por la interfaz. Usa solo la biblioteca estándar (asyncio):
+#
+#   python servicio.py --puerto 8765 --tasas 4 5.5
+#
+#   POST /valuar      todos los valores           POST /prima       PNU, P, prima comercial
+#   POST /rescate     valor de rescate            POST /saldado     seguro saldado
+#   POST /prorrogado  seguro prorrogado           GET  /salud       estado y estadísticas
+#
+# El cuerpo es una póliza ({"tipo_seguro": "Temporal", "edad": 40, "suma_asegurada":
+# 100000, "plazo_seguro": 20, "plazo_pago": 10, "tipo_recargo": "Mínimos", "t_anos": 5,
+# "tasa": 4}) o {"polizas": [...]}. tasa va en % y tabla es opcional; para Vitalicio
+# plazo_seguro no hace falta.
+#
+# Las solicitudes que llegan casi al mismo tiempo se juntan en micro-lotes: el primer
+# pedido abre una ventana corta (--ventana-ms), y todo lo que llegó en ella se valúa
+# con una sola llamada a valuar_cartera por tasa y tabla, sobre las tablas de
+# conmutados compartidas de la caché (las de --tasas se construyen al arrancar).
+import argparse
+import asyncio
+import json
+import logging
+import math
+import sys
+from collections import defaultdict
+
+from calculos import TABLA_MORTALIDAD, TIPOS_RECARGO, TIPOS_SEGURO, cache_conmutados, obtener_tabla_conmutada, valuar_cartera
+from lote import COLUMNAS_POLIZA
+from medicion import medir
+from tablas import registro
+
+CAMPOS_RUTA = {
+    '/valuar': None,
+    '/prima': ('PNU', 'P', 'B_total'),
+    '/rescate': ('edad_actual', 'A_actual', 'V_rescate_total'),
+    '/saldado': ('S_saldado_total', 'n_restante'),
+    '/prorrogado': ('años', 'meses', 'dias', 'devolucion'),
+}
+logger = logging.getLogger('valores_garantizados.servicio')
+MAX_CUERPO = 8 * 1024 * 1024
+# Cota de los campos enteros (edades y plazos): muy por encima de cualquier tabla, y
+# lejos del límite de int64 para que ni las sumas de edad y plazo se desborden
+MAX_ENTERO = 1000
+MENSAJES = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+            500: 'Internal Server Error'}
+
+
+# Revisa una póliza del JSON y devuelve ((tasa, tabla), valores en el orden de
+# COLUMNAS_POLIZA). Los rangos de edad y plazos los revisa valuar_cartera.
+def leer_poliza(datos, tasa_omision=None):
+    if not isinstance(datos, dict):
+        raise ValueError("Cada póliza debe ser un objeto JSON")
+    tasa = datos.get('tasa', tasa_omision)
+    tabla = datos.get('tabla', TABLA_MORTALIDAD)
+    if tasa is None:
+        raise ValueError("Falta la tasa de interés ('tasa', en %)")
+    if isinstance(tasa, bool) or not isinstance(tasa, (int, float)) or not 0 < tasa <= 10:
+        raise ValueError("La tasa debe ser mayor a 0% y menor o igual a 10%")
+    if tabla not in registro:
+        raise ValueError(f"Tabla de mortalidad desconocida: {tabla!r}")
+    tipo_seguro = datos.get('tipo_seguro')
+    tipo_recargo = datos.get('tipo_recargo', TIPOS_RECARGO[0])
+    if tipo_seguro not in TIPOS_SEGURO:
+        raise ValueError(f"tipo_seguro debe ser uno de {list(TIPOS_SEGURO)}")
+    if tipo_recargo not in TIPOS_RECARGO:
+        raise ValueError(f"tipo_recargo debe ser uno de {list(TIPOS_RECARGO)}")
+    suma_asegurada = datos.get('suma_asegurada')
+    if (isinstance(suma_asegurada, bool) or not isinstance(suma_asegurada, (int, float)) or not suma_asegurada > 0
+            or not math.isfinite(suma_asegurada)):
+        raise ValueError("suma_asegurada debe ser un número positivo")
+    valores = {'tipo_seguro': tipo_seguro, 'tipo_recargo': tipo_recargo, 'suma_asegurada': float(suma_asegurada)}
+    for campo in ('edad', 'plazo_seguro', 'plazo_pago', 't_anos'):
+        # Para Vitalicio valuar_cartera usa siempre el plazo hasta la última edad
+        valor = datos.get(campo, 0 if campo == 'plazo_seguro' and tipo_seguro == "Vitalicio" else None)
+        if valor is None:
+            raise ValueError(f"Falta el campo {campo!r}")
+        if isinstance(valor, bool) or not isinstance(valor, int):
+            raise ValueError(f"{campo} debe ser un entero")
+        if not -MAX_ENTERO <= valor <= MAX_ENTERO:
+            raise ValueError(f"{campo} debe estar entre {-MAX_ENTERO} y {MAX_ENTERO}")
+        valores[campo] = valor
+    return (float(tasa) / 100, tabla), tuple(valores[campo] for campo in COLUMNAS_POLIZA)
+
+
+# Junta las pólizas que llegan dentro de la ventana y las valúa por grupos de
+# (tasa, tabla). Si un grupo falla (alguna póliza fuera de rango, o cualquier otro
+# error), se valúan una por una para que el error solo le llegue a quien lo causó.
+class AgrupadorLotes:
+    def __init__(self, ventana=0.001, max_lote=4096):
+        self.ventana = ventana
+        self.max_lote = max_lote
+        self.lotes = 0
+        self.polizas = 0
+        self.lote_maximo = 0
+        self._cola = None
+
+    async def valuar(self, clave, poliza):
+        futuro = asyncio.get_running_loop().create_future()
+        self._cola.put_nowait((clave, poliza, futuro))
+        return await futuro
+
+    # Se llama dentro del ciclo de eventos; devuelve la tarea que arma y valúa los lotes
+    def iniciar(self):
+        self._cola = asyncio.Queue()
+        return asyncio.create_task(self._correr())
+
+    async def _correr(self):
+        while True:
+            lote = [await self._cola.get()]
+            # Primero se cede el turno una vez para que entren las solicitudes ya
+            # recibidas. Si no llegó ninguna, no hay carga y se valúa de inmediato; si
+            # llegaron, se espera la ventana para juntar más.
+            await asyncio.sleep(0)
+            if self.ventana > 0 and 0 < self._cola.qsize() < self.max_lote - 1:
+                await asyncio.sleep(self.ventana)
+            while len(lote) < self.max_lote and not self._cola.empty():
+                lote.append(self._cola.get_nowait())
+            # Un error inesperado no debe terminar la tarea: las solicitudes siguientes
+            # se quedarían esperando para siempre
+            try:
+                self._evaluar(lote)
+            except Exception as e:
+                logger.exception("Error al valuar un lote")
+                for _, _, futuro in lote:
+                    _fijar_error(futuro, e)
+
+    def _evaluar(self, lote):
+        self.lotes += 1
+        self.polizas += len(lote)
+        self.lote_maximo = max(self.lote_maximo, len(lote))
+        grupos = defaultdict(list)
+        for clave, poliza, futuro in lote:
+            if not futuro.done():
+                grupos[clave].append((poliza, futuro))
+        with medir("lote_servicio", polizas=len(lote), grupos=len(grupos)):
+            for (i, tabla), pendientes in grupos.items():
+                try:
+                    conmutados = obtener_tabla_conmutada(i, tabla)
+                    resultado = valuar_cartera(conmutados, *zip(*(poliza for poliza, _ in pendientes)))
+                except Exception as e:
+                    if len(pendientes) == 1:
+                        _fijar_error(pendientes[0][1], e)
+                        continue
+                    for poliza, futuro in pendientes:
+                        try:
+                            uno = valuar_cartera(obtener_tabla_conmutada(i, tabla), *([v] for v in poliza))
+                            _fijar_resultado(futuro, {campo: valores[0].item() for campo, valores in uno.items()})
+                        except Exception as e:
+                            _fijar_error(futuro, e)
+                    continue
+                columnas = {campo: valores.tolist() for campo, valores in resultado.items()}
+                for n, (_, futuro) in enumerate(pendientes):
+                    _fijar_resultado(futuro, {campo: valores[n] for campo, valores in columnas.items()})
+
+
+# El cliente pudo cerrar la conexión mientras se valuaba (futuro cancelado)
+def _fijar_resultado(futuro, resultado):
+    if not futuro.done():
+        futuro.set_result(resultado)
+
+
+def _fijar_error(futuro, error):
+    if not futuro.done():
+        futuro.set_exception(error)
+
+
+class ServicioValuacion:
+    def __init__(self, tasa_omision=None, ventana=0.001, max_lote=4096):
+        self.tasa_omision = tasa_omision
+        self.agrupador = AgrupadorLotes(ventana, max_lote)
+        self.solicitudes = 0
+
+    async def iniciar(self, host='127.0.0.1', puerto=8765):
+        self._tarea_lotes = self.agrupador.iniciar()
+        return await asyncio.start_server(self._atender, host, puerto)
+
+    async def _valuar(self, datos, campos):
+        clave, poliza = leer_poliza(datos, self.tasa_omision)
+        resultado = await self.agrupador.valuar(clave, poliza)
+        return resultado if campos is None else {campo: resultado[campo] for campo in campos}
+
+    async def _despachar(self, metodo, ruta, cuerpo):
+        ruta = ruta.split('?', 1)[0]
+        if ruta == '/salud':
+            if metodo != 'GET':
+                return 405, {'error': "Usa GET"}
+            return 200, self.estadisticas()
+        if ruta not in CAMPOS_RUTA:
+            return 404, {'error': f"Ruta desconocida: {ruta}", 'rutas': sorted(CAMPOS_RUTA) + ['/salud']}
+        if metodo != 'POST':
+            return 405, {'error': "Usa POST con una póliza en JSON"}
+        try:
+            datos = json.loads(cuerpo)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            return 400, {'error': f"JSON inválido: {e}"}
+        campos = CAMPOS_RUTA[ruta]
+        if isinstance(datos, dict) and 'polizas' in datos:
+            if not isinstance(datos['polizas'], list):
+                return 400, {'error': "'polizas' debe ser una lista"}
+            resultados = await asyncio.gather(*(self._valuar(p, campos) for p in datos['polizas']), return_exceptions=True)
+            return 200, {'resultados': [{'error': str(r)} if isinstance(r, Exception) else r for r in resultados]}
+        try:
+            return 200, await self._valuar(datos, campos)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+    # HTTP/1.1 mínimo: una solicitud tras otra en la misma conexión (keep-alive),
+    # cuerpo por Content-Length
+    async def _atender(self, lector, escritor):
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                try:
+                    metodo, ruta, version = linea.decode('latin-1').split()
+                except ValueError:
+                    await self._responder(escritor, 400, {'error': "Solicitud mal formada"}, False)
+                    break
+                encabezados = {}
+                while True:
+                    linea = await lector.readline()
+                    if linea in (b'\r\n', b'\n', b''):
+                        break
+                    nombre, _, valor = linea.decode('latin-1').partition(':')
+                    encabezados[nombre.strip().lower()] = valor.strip()
+                conexion = encabezados.get('connection', '').lower()
+                mantener = conexion == 'keep-alive' or (version == 'HTTP/1.1' and conexion != 'close')
+                largo = int(encabezados.get('content-length') or 0)
+                if largo > MAX_CUERPO:
+                    await self._responder(escritor, 413, {'error': f"El cuerpo no debe pasar de {MAX_CUERPO} bytes"}, False)
+                    break
+                cuerpo = await lector.readexactly(largo) if largo else b''
+                self.solicitudes += 1
+                try:
+                    estado, respuesta = await self._despachar(metodo, ruta, cuerpo)
+                except Exception as e:
+                    estado, respuesta = 500, {'error': f"Error interno: {e}"}
+                await self._responder(escritor, estado, respuesta, mantener)
+                if not mantener:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            escritor.close()
+
+    async def _responder(self, escritor, estado, respuesta, mantener):
+        cuerpo = json.dumps(respuesta, ensure_ascii=False).encode('utf-8')
+        escritor.write(
+            f"HTTP/1.1 {estado} {MENSAJES[estado]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(cuerpo)}\r\n"
+            f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n".encode('latin-1') + cuerpo)
+        await escritor.drain()
+
+    def estadisticas(self):
+        agrupador = self.agrupador
+        return {
+            'estado': 'ok',
+            'solicitudes': self.solicitudes,
+            'lotes': agrupador.lotes,
+            'polizas': agrupador.polizas,
+            'polizas_por_lote': round(agrupador.polizas / agrupador.lotes, 2) if agrupador.lotes else 0,
+            'lote_maximo': agrupador.lote_maximo,
+            'cache': cache_conmutados().estadisticas(),
+            'tablas': registro.nombres(),
+        }
+
+
+async def _servir(args):
+    for tasa in args.tasas:
+        obtener_tabla_conmutada(tasa / 100, args.tabla)
+    servicio = ServicioValuacion(args.tasa, args.ventana_ms / 1000, args.max_lote)
+    servidor = await servicio.iniciar(args.host, args.puerto)
+    print(f"Servicio de valuación en http://{args.host}:{args.puerto} (ventana {args.ventana_ms:g} ms, "
+          f"lote máximo {args.max_lote})", file=sys.stderr)
+    async with servidor:
+        await servidor.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP/JSON local de valores garantizados")
+    parser.add_argument('--host', default='127.0.0.1', help="Dirección de escucha (por omisión solo localhost)")
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--tasa', type=float, default=None, help="Tasa en %% para las pólizas que no la indiquen")
+    parser.add_argument('--tasas', type=float, nargs='*', default=[4.0], help="Tasas en %% cuyas tablas se construyen al arrancar")
+    parser.add_argument('--tabla', default=TABLA_MORTALIDAD, help="Tabla de mortalidad de las tablas precalculadas")
+    parser.add_argument('--ventana-ms', type=float, default=1.0, help="Espera para juntar solicitudes en un lote")
+    parser.add_argument('--max-lote', type=int, default=4096, help="Pólizas máximas por lote")
+    args = parser.parse_args(argv)
+    if args.max_lote < 1:
+        parser.error("el lote máximo debe ser al menos 1")
+    if args.tasa is not None and not 0 < args.tasa <= 10:
+        parser.error("la tasa debe ser mayor a 0% y menor o igual a 10%")
+    if args.tabla not in registro:
+        parser.error(f"tabla de mortalidad desconocida: {args.tabla!r} (disponibles: {', '.join(registro.nombres())})")
+    try:
+        asyncio.run(_servir(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
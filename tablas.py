@@ -0,0 +1,203 @@
+# Registro de tablas de mortalidad. Cada tabla se guarda como un arreglo estructurado
+# de NumPy (.npy) con al menos los campos x, lx y dx; cualquier otro campo (por ejemplo
+# qx o columnas selectas) se conserva tal cual. Los .npy se abren con memory mapping,
+# así que los procesos que usan la misma tabla comparten las páginas del archivo en
+# lugar de tener cada uno su copia. Los .npz también se aceptan, pero se cargan completos
+# en memoria porque el formato zip no se puede mapear.
+#
+# Para agregar una tabla basta con dejar el archivo en el directorio de tablas
+# (VG_TABLAS_DIR, por omisión ./tablas); el nombre de la tabla es el del archivo. La
+# tabla Mexicana 2000-I viene en el código y se registra al importar este módulo, así
+# que un archivo con su nombre (o con el de otra tabla ya registrada) se omite.
+import argparse
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger('valores_garantizados.tablas')
+
+CAMPOS_REQUERIDOS = ('x', 'lx', 'dx')
+DIRECTORIO_TABLAS = os.environ.get('VG_TABLAS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablas'))
+
+
+class TablaMortalidad:
+    def __init__(self, nombre, columnas, ruta=None):
+        self.nombre = nombre
+        self.ruta = ruta
+        self.columnas = columnas
+        self.x = np.asarray(columnas['x'])
+        self.lx = np.asarray(columnas['lx'])
+        self.dx = np.asarray(columnas['dx'])
+
+    # Permite usar la tabla donde se espera el diccionario data ({'x': ..., 'lx': ..., 'dx': ...})
+    def __getitem__(self, campo):
+        return self.columnas[campo]
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def campos(self):
+        return _nombres_campos(self.columnas)
+
+    @property
+    def edad_min(self):
+        return int(self.x[0])
+
+    @property
+    def edad_max(self):
+        return int(self.x[-1])
+
+
+# Revisa que la tabla sea utilizable: edades enteras consecutivas, lx positivo y no
+# creciente, dx no negativo, l_{x+1} = l_x - d_x (con tolerancia para el redondeo de
+# las tablas publicadas) y que en la última edad mueran todos los sobrevivientes
+def validar_tabla(nombre, x, lx, dx, tolerancia=1e-6):
+    x, lx, dx = np.asarray(x), np.asarray(lx, dtype=np.float64), np.asarray(dx, dtype=np.float64)
+    if not (x.shape == lx.shape == dx.shape) or x.ndim != 1 or x.size < 2:
+        raise ValueError(f"Tabla {nombre!r}: x, lx y dx deben ser vectores del mismo largo (mínimo 2 edades)")
+    if np.any(x != np.round(x)) or np.any(np.diff(x) != 1):
+        raise ValueError(f"Tabla {nombre!r}: las edades deben ser enteros consecutivos")
+    if np.any(lx <= 0) or np.any(np.diff(lx) > 0):
+        raise ValueError(f"Tabla {nombre!r}: lx debe ser positivo y no creciente")
+    if np.any(dx < 0):
+        raise ValueError(f"Tabla {nombre!r}: dx no puede ser negativo")
+    diferencia = np.abs(lx[:-1] - dx[:-1] - lx[1:])
+    malas = diferencia > np.maximum(1.0, tolerancia * lx[1:])
+    if np.any(malas):
+        edades = x[:-1][malas]
+        raise ValueError(f"Tabla {nombre!r}: l(x+1) != l(x) - d(x) en las edades {edades[:10].tolist()}")
+    if abs(lx[-1] - dx[-1]) > max(1.0, tolerancia * lx[-1]):
+        raise ValueError(f"Tabla {nombre!r}: en la última edad ({int(x[-1])}) dx debe ser igual a lx")
+
+
+def _nombres_campos(columnas):
+    return tuple(columnas.dtype.names) if hasattr(columnas, 'dtype') else tuple(columnas)
+
+
+def _abrir(ruta):
+    if ruta.endswith('.npy'):
+        columnas = np.load(ruta, mmap_mode='r')
+        if columnas.dtype.names is None:
+            raise ValueError(f"{ruta}: se esperaba un arreglo estructurado con campos {CAMPOS_REQUERIDOS}")
+        return columnas
+    with np.load(ruta) as archivo:
+        return {campo: archivo[campo] for campo in archivo.files}
+
+
+def _crear_tabla(nombre, columnas, ruta=None):
+    faltantes = [campo for campo in CAMPOS_REQUERIDOS if campo not in _nombres_campos(columnas)]
+    if faltantes:
+        raise ValueError(f"Tabla {nombre!r}: faltan los campos {faltantes}")
+    validar_tabla(nombre, columnas['x'], columnas['lx'], columnas['dx'])
+    return TablaMortalidad(nombre, columnas, ruta)
+
+
+# Registro de tablas por nombre. Las tablas de archivo se abren la primera vez que se
+# piden; las que vienen como diccionarios en el código se registran directamente.
+class RegistroTablas:
+    def __init__(self):
+        self._tablas = {}
+        self._rutas = {}
+        self._orden = []
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre, columnas, ruta=None):
+        if nombre in self._tablas or nombre in self._rutas:
+            raise ValueError(f"Ya existe una tabla de mortalidad llamada {nombre!r}")
+        self._tablas[nombre] = _crear_tabla(nombre, columnas, ruta)
+        self._orden.append(nombre)
+        return self._tablas[nombre]
+
+    def registrar_archivo(self, ruta, nombre=None):
+        nombre = nombre or os.path.splitext(os.path.basename(ruta))[0]
+        if nombre in self._tablas or nombre in self._rutas:
+            raise ValueError(f"Ya existe una tabla de mortalidad llamada {nombre!r}")
+        self._rutas[nombre] = ruta
+        self._orden.append(nombre)
+        return nombre
+
+    # Un archivo cuyo nombre ya está registrado se omite con un aviso en el log: se carga
+    # al importar el módulo y un archivo mal nombrado no debe tumbar la aplicación
+    def cargar_directorio(self, directorio=DIRECTORIO_TABLAS):
+        if not os.path.isdir(directorio):
+            return []
+        nombres = []
+        for archivo in sorted(os.listdir(directorio)):
+            if archivo.endswith(('.npy', '.npz')):
+                ruta = os.path.join(directorio, archivo)
+                if os.path.splitext(archivo)[0] in self:
+                    logger.warning("Se omite %s: ya existe una tabla de mortalidad con ese nombre", ruta)
+                    continue
+                nombres.append(self.registrar_archivo(ruta))
+        return nombres
+
+    # En orden de registro, sin importar cuáles ya se abrieron (la interfaz depende de un orden estable)
+    def nombres(self):
+        return list(self._orden)
+
+    def __contains__(self, nombre):
+        return nombre in self._tablas or nombre in self._rutas
+
+    def obtener(self, nombre):
+        with self._lock:
+            if nombre not in self._tablas:
+                if nombre not in self._rutas:
+                    raise ValueError(f"Tabla de mortalidad desconocida: {nombre!r}")
+                ruta = self._rutas[nombre]
+                self._tablas[nombre] = _crear_tabla(nombre, _abrir(ruta), ruta)
+                del self._rutas[nombre]
+            return self._tablas[nombre]
+
+
+# Escribe una tabla en el formato del registro (.npy estructurado). Los campos extra
+# se pasan como argumentos con nombre y deben tener el mismo largo que x.
+def guardar_tabla(ruta, x, lx, dx, **extras):
+    validar_tabla(ruta, x, lx, dx)
+    campos = {'x': np.asarray(x, dtype=np.int64), 'lx': np.asarray(lx, dtype=np.float64),
+              'dx': np.asarray(dx, dtype=np.float64)}
+    campos.update({campo: np.asarray(valores) for campo, valores in extras.items()})
+    columnas = np.empty(len(campos['x']), dtype=[(campo, valores.dtype) for campo, valores in campos.items()])
+    for campo, valores in campos.items():
+        columnas[campo] = valores
+    np.save(ruta, columnas)
+    return ruta
+
+
+registro = RegistroTablas()
+
+# Datos de mortalidad - CORREGIDOS para tener la misma longitud
+data = {
+    'x': list(range(12, 101)),  # 12 a 100 (89 valores)
+    'lx': [10000000.00, 9996040.00, 9991772, 9987175, 9982232, 9976911, 9971175, 9965002, 9958356, 9951206, 9943513, 9935230, 9926319, 9916730, 9906406, 9895301, 9883358, 9870509, 9856691, 9841827, 9825844, 9808658, 9790179, 9770314, 9748956, 9726007, 9701352, 9674867, 9646423, 9615883, 9583092, 9547903, 9510151, 9469657, 9426238, 9379692, 9329820, 9276407, 9219227, 9158039, 9092605, 9022655, 8947930, 8868159, 8783051, 8692322, 8595672, 8492808, 8383429, 8267235, 8143937, 8013243, 7874895, 7728626, 7574208, 7411439, 7240153, 7060228, 6871578, 6674199, 6468140.00, 6253527, 6030583, 5799611, 5561038, 5315385, 5063308, 4805576, 4543100, 4276911, 4008175, 3738177, 3468318, 3200088, 2935067, 2674876, 2421164, 2175571, 1939687, 1715009, 1502902, 1304559, 1120960, 952835, 800645, 664559, 544452, 439906.00, 350237],
+    'dx': [3960.00, 4268, 4596, 4944, 5321, 5737, 6172, 6647, 7150, 7692, 8283, 8912, 9589, 10323, 11105, 11944, 12848, 13819, 14864, 15983, 17185, 18480, 19864, 21358, 22949, 24655, 26485, 28444, 30541, 32790, 35189, 37752, 40494, 43418, 46547, 49872, 53413, 57180, 61188, 65434, 69949, 74726, 79771, 85108, 90729, 96650, 102864, 109379, 116194, 123298, 130694, 138349, 146268, 154418, 162770, 171286, 179925, 188649, 197379, 206059, 214613, 222944, 230971, 238573, 245653, 252077, 257733, 262476, 266189, 268735, 269999, 269859, 268229, 265022, 260191, 253712, 245593, 235884, 224678, 212107, 198342, 183600, 168125, 152190, 136086, 120108, 104546, 89669, 350237]
+}
+
+# La tabla incluida en el código siempre está disponible; las demás se leen del
+# directorio de tablas
+TABLA_MORTALIDAD = "Mexicana 2000-I"
+registro.registrar(TABLA_MORTALIDAD, data)
+registro.cargar_directorio()
+
+
+# Convierte un CSV con columnas x, lx, dx (y opcionalmente otras numéricas) al formato .npy
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convierte una tabla de mortalidad CSV al formato binario del registro")
+    parser.add_argument('entrada', help="CSV con encabezado; debe incluir las columnas x, lx y dx")
+    parser.add_argument('salida', nargs='?', help="Archivo .npy de salida (por omisión, en el directorio de tablas)")
+    args = parser.parse_args(argv)
+    columnas = np.genfromtxt(args.entrada, delimiter=',', names=True, dtype=np.float64)
+    faltantes = [campo for campo in CAMPOS_REQUERIDOS if campo not in columnas.dtype.names]
+    if faltantes:
+        parser.error(f"faltan las columnas {faltantes}")
+    salida = args.salida or os.path.join(DIRECTORIO_TABLAS, os.path.splitext(os.path.basename(args.entrada))[0] + '.npy')
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    extras = {campo: columnas[campo] for campo in columnas.dtype.names if campo not in CAMPOS_REQUERIDOS}
+    guardar_tabla(salida, columnas['x'], columnas['lx'], columnas['dx'], **extras)
+    print(f"Tabla guardada en {salida} ({len(columnas)} edades)")
+
+
+if __name__ == '__main__':
+    main()